@@ -0,0 +1,184 @@
+# bench/bench_despachador.py
+"""
+Compara el Despachador (colas por trámite + admins disponibles indexados por
+skill) contra el esquema anterior (una TurnoQueue + deque de admins con
+remove O(n) al desconectarse).
+
+Escenario "churn": N admins disponibles que se desconectan y reconectan al
+azar mientras llegan turnos (cada turno se asigna y el admin vuelve a quedar
+libre). Con skills se agrega una cola de M turnos que los admins libres no
+pueden atender, para mostrar que no se recorre. Con --capacidad cada admin
+atiende varias sesiones a la vez (lugares libres por admin).
+
+Uso:
+    python3 bench/bench_despachador.py --admins 100 1000 10000 --ops 20000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from collections import deque
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVIDOR_DIR = os.path.join(BASE_DIR, "..", "servidor")
+if SERVIDOR_DIR not in sys.path:
+    sys.path.insert(0, SERVIDOR_DIR)
+
+from turnos_service import TurnoQueue, Despachador, PRIORIDADES
+
+TRAMITES = list(PRIORIDADES)
+
+
+class DespachadorLegacy:
+    """El loop anterior de run_turnos_service con la misma interfaz (sin skills)."""
+    def __init__(self, aging_seconds=30):
+        self.turnos = TurnoQueue(aging_seconds=aging_seconds)
+        self.admins = deque()
+
+    def nuevo_turno(self, cliente_id, nombre, tramite):
+        self.turnos.push(cliente_id, nombre, tramite)
+        return self._asignar()
+
+    def admin_listo(self, admin_id, skills=()):
+        self.admins.append(admin_id)
+        par = self._asignar()
+        return [par[1]] if par else []
+
+    def quitar_admin(self, admin_id):
+        try:
+            self.admins.remove(admin_id)
+        except ValueError:
+            pass
+
+    def _asignar(self):
+        if not self.admins:
+            return None
+        turno = self.turnos.pop()
+        if not turno:
+            return None
+        return self.admins.popleft(), turno
+
+
+def verificar(eventos=20000, seed=1):
+    """Sin skills, ambos tienen que asignar exactamente lo mismo."""
+    rng = random.Random(seed)
+    a, b = DespachadorLegacy(aging_seconds=10**9), Despachador(aging_seconds=10**9)
+    conectados = set()
+    for i in range(eventos):
+        r = rng.random()
+        if r < 0.4:
+            tramite = rng.choice(TRAMITES)
+            assert a.nuevo_turno(str(i), "n", tramite) == b.nuevo_turno(str(i), "n", tramite)
+        elif r < 0.8 or not conectados:
+            admin_id = f"A{rng.randrange(50)}"
+            if admin_id in conectados:
+                continue
+            conectados.add(admin_id)
+            ta, tb = a.admin_listo(admin_id), b.admin_listo(admin_id)
+            assert ta == tb, (ta, tb)
+            if ta:
+                conectados.discard(admin_id)
+        else:
+            admin_id = rng.choice(sorted(conectados))
+            conectados.discard(admin_id)
+            a.quitar_admin(admin_id)
+            b.quitar_admin(admin_id)
+
+
+def verificar_capacidad(eventos=20000, seed=2):
+    """Ningún admin pasa su capacidad y cada turno va a un admin con la mayor cantidad de lugares libres."""
+    rng = random.Random(seed)
+    d = Despachador(aging_seconds=10**9)
+    capacidad = {}
+    ocupados = {}       # admin_id -> cliente_ids en sesión
+
+    def tomar(admin_id, turnos):
+        ocupados[admin_id].update(t["cliente_id"] for t in turnos)
+        assert len(ocupados[admin_id]) <= capacidad[admin_id], admin_id
+
+    for i in range(eventos):
+        r = rng.random()
+        if r < 0.4:
+            libres = {a: capacidad[a] - len(o) for a, o in ocupados.items()}
+            par = d.nuevo_turno(str(i), "n", rng.choice(TRAMITES))
+            if par:
+                assert libres[par[0]] == max(libres.values()), (par[0], libres)
+                tomar(par[0], [par[1]])
+        elif r < 0.7:
+            admin_id = f"A{rng.randrange(30)}"
+            if admin_id not in capacidad:
+                capacidad[admin_id] = rng.randint(1, 4)
+                ocupados[admin_id] = set()
+                tomar(admin_id, d.admin_listo(admin_id, (), capacidad[admin_id]))
+            elif ocupados[admin_id]:
+                # termina una de sus sesiones
+                ocupados[admin_id].discard(rng.choice(sorted(ocupados[admin_id])))
+                tomar(admin_id, d.admin_listo(admin_id))
+        elif capacidad:
+            admin_id = rng.choice(sorted(capacidad))
+            del capacidad[admin_id], ocupados[admin_id]
+            d.quitar_admin(admin_id)
+
+
+def churn(despachador, admins, ops, seed, skills_por_admin=None, cola_fija=0, capacidad=1):
+    rng = random.Random(seed)
+    ids = [f"A{i}" for i in range(admins)]
+    skills = skills_por_admin or {}
+
+    # turnos que ningún admin libre atiende (solo con skills)
+    for i in range(cola_fija):
+        despachador.nuevo_turno(f"F{i}", "n", "otro")
+
+    for admin_id in ids:
+        if capacidad > 1:
+            despachador.admin_listo(admin_id, skills.get(admin_id, ()), capacidad)
+        else:
+            despachador.admin_listo(admin_id, skills.get(admin_id, ()))
+
+    t0 = time.perf_counter()
+    for i in range(ops):
+        if i % 4 == 0:
+            par = despachador.nuevo_turno(str(i), "n", rng.choice(TRAMITES))
+            if par:
+                admin_id = par[0]
+                despachador.admin_listo(admin_id, skills.get(admin_id, ()))
+        else:
+            admin_id = ids[rng.randrange(admins)]
+            despachador.quitar_admin(admin_id)
+            despachador.admin_listo(admin_id, skills.get(admin_id, ()))
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del despachador de turnos")
+    parser.add_argument("--admins", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--cola", type=int, default=10000, help="turnos esperando sin admin posible (con skills)")
+    parser.add_argument("--capacidad", type=int, default=4, help="sesiones a la vez por admin (última columna)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    verificar()
+    print("Verificación: sin skills el Despachador asigna igual que el esquema anterior")
+    verificar_capacidad()
+    print("Verificación: con capacidad ningún admin se pasa y se elige al de más lugares libres")
+    print()
+    print(f"{'admins':>8} {'legacy ops/s':>14} {'nuevo ops/s':>14} {'skills ops/s':>14} {'capacidad ops/s':>16}")
+
+    # sin admins generalistas, así la cola de "otro" nunca se atiende
+    grupos = [(t,) for t in TRAMITES] + [tuple(TRAMITES[:2])]
+    for n in args.admins:
+        dt_legacy = churn(DespachadorLegacy(), n, args.ops, args.seed)
+        dt_nuevo = churn(Despachador(), n, args.ops, args.seed)
+        skills = {f"A{i}": grupos[i % len(grupos)] for i in range(n)}
+        dt_skills = churn(Despachador(), n, args.ops, args.seed, skills, cola_fija=args.cola)
+        dt_capacidad = churn(Despachador(), n, args.ops, args.seed, capacidad=args.capacidad)
+        print(
+            f"{n:>8} {args.ops / dt_legacy:>14,.0f} {args.ops / dt_nuevo:>14,.0f} "
+            f"{args.ops / dt_skills:>14,.0f} {args.ops / dt_capacidad:>16,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# bench/bench_ipc.py
+"""
+Eventos/s de proxy -> Turnos: multiprocessing.Queue con dicts pickleados
+(el camino anterior) contra el canal binario de ipc.py (registros struct en
+lotes por un pipe). Un proceso productor manda N eventos con la mezcla
+típica (NEW_TURNO, ADMIN_READY, CLIENTE_DESCONECTADO) y el consumidor los
+recibe ya como dicts; se mide de punta a punta y el costo del put() en el
+productor (lo que paga el loop del proxy).
+
+Con el canal, --lote es cuántos eventos junta el proxy en una vuelta del
+loop antes del flush (1 = sin batching).
+
+Uso:
+    python3 bench/bench_ipc.py --eventos 200000 --lote 1 16 128
+"""
+import os
+import sys
+import time
+import argparse
+from multiprocessing import Process, Queue, Pipe
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVIDOR_DIR = os.path.join(BASE_DIR, "..", "servidor")
+if SERVIDOR_DIR not in sys.path:
+    sys.path.insert(0, SERVIDOR_DIR)
+
+from ipc import CanalEventos, canal_eventos, codificar
+
+
+def evento(i):
+    if i % 3 == 0:
+        return {"type": "NEW_TURNO", "cliente_id": str(i), "nombre": f"Cliente_{i}", "tramite": "consulta", "worker": 0}
+    if i % 3 == 1:
+        return {"type": "ADMIN_READY", "admin_id": f"A{i % 50}", "worker": 0, "skills": [], "atencion_s": 31.5}
+    return {"type": "CLIENTE_DESCONECTADO", "cliente_id": str(i - 2), "worker": 0}
+
+
+def producir_queue(q, n, tiempos):
+    eventos = [evento(i) for i in range(n)]
+    t0 = time.perf_counter()
+    for evt in eventos:
+        q.put(evt)
+    tiempos.send(time.perf_counter() - t0)
+    q.put(None)
+
+
+def producir_canal(tx, n, lote, tiempos):
+    eventos = [evento(i) for i in range(n)]
+    canal = CanalEventos(tx)
+    t0 = time.perf_counter()
+    for i, evt in enumerate(eventos, 1):
+        canal.put(evt)
+        if i % lote == 0:
+            canal.flush()
+    canal.flush()
+    tiempos.send(time.perf_counter() - t0)
+    canal.put(None)
+
+
+def medir_queue(n):
+    q = Queue()
+    rx, tx = Pipe(duplex=False)
+    p = Process(target=producir_queue, args=(q, n, tx))
+    t0 = time.perf_counter()
+    p.start()
+    recibidos = 0
+    while q.get() is not None:
+        recibidos += 1
+    total = time.perf_counter() - t0
+    put = rx.recv()
+    p.join()
+    return recibidos, total, put
+
+
+def medir_canal(n, lote):
+    lector, tx = canal_eventos()
+    rx_t, tx_t = Pipe(duplex=False)
+    p = Process(target=producir_canal, args=(tx, n, lote, tx_t))
+    t0 = time.perf_counter()
+    p.start()
+    recibidos = 0
+    fin = False
+    while not fin:
+        for evt in lector.leer():
+            if evt is None:
+                fin = True
+                break
+            recibidos += 1
+    total = time.perf_counter() - t0
+    put = rx_t.recv()
+    p.join()
+    return recibidos, total, put
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IPC proxy -> Turnos: Queue vs canal binario")
+    parser.add_argument("--eventos", type=int, default=200_000)
+    parser.add_argument("--lote", type=int, nargs="+", default=[1, 16, 128])
+    args = parser.parse_args()
+
+    muestra = [evento(i) for i in range(3)]
+    import pickle
+    print("bytes por evento: pickle "
+          + "/".join(str(len(pickle.dumps(e))) for e in muestra)
+          + ", binario " + "/".join(str(len(codificar(e))) for e in muestra) + "\n")
+
+    print(f"{'camino':<18} {'eventos/s':>12} {'put us':>8}")
+    filas = [("queue+pickle", lambda: medir_queue(args.eventos))]
+    filas += [(f"canal lote={lote}", lambda lote=lote: medir_canal(args.eventos, lote)) for lote in args.lote]
+    for nombre, medir in filas:
+        recibidos, total, put = medir()
+        assert recibidos == args.eventos, (nombre, recibidos)
+        print(f"{nombre:<18} {recibidos / total:>12,.0f} {put / args.eventos * 1e6:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
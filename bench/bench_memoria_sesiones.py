@@ -0,0 +1,154 @@
+# bench/bench_memoria_sesiones.py
+"""
+Memoria del proxy por conexión ociosa: levanta proxy_server.py, conecta N
+clientes que mandan el hello y se quedan esperando turno (no hay admins) y
+mide el RSS del proceso proxy antes y después.
+
+Las conexiones salen de varias IPs de loopback (127.0.0.1, .2, ...) para no
+agotar los puertos efímeros, y el límite de fds se sube lo necesario. Si el
+hard limit no alcanza (50k clientes piden ~50k fds en cada punta), se mide
+con los que entren y se proyecta el costo por conexión a --clientes.
+
+Uso:
+    python3 bench/bench_memoria_sesiones.py --clientes 50000
+    python3 bench/bench_memoria_sesiones.py --clientes 20000 --engine selectors asyncio
+"""
+import os
+import sys
+import time
+import socket
+import signal
+import argparse
+import selectors
+import tempfile
+import subprocess
+
+from bench_proxy_engines import PROXY, esperar_puerto
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Linux: bind() sin elegir puerto todavía (lo elige connect()); sin esto cada
+# bind a puerto 0 busca un puerto libre entre miles ya tomados
+IP_BIND_ADDRESS_NO_PORT = getattr(socket, "IP_BIND_ADDRESS_NO_PORT", 24)
+
+
+def subir_limite_fds(necesarios):
+    """Sube el límite de fds hasta `necesarios` si se puede; devuelve el límite final."""
+    if resource is None:
+        return necesarios
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft >= necesarios:
+        return soft
+    if hard < necesarios:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (necesarios, necesarios))
+            return necesarios
+        except (ValueError, OSError):
+            pass
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(necesarios, hard), hard))
+    return min(necesarios, hard)
+
+
+def rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for linea in f:
+            if linea.startswith("VmRSS:"):
+                return int(linea.split()[1])
+    return 0
+
+
+def conectar(port, clientes, ips, tanda=500):
+    """Conecta en tandas de connect() no bloqueantes (uno a la vez tarda lo que el scheduler)."""
+    socks = []
+    sel = selectors.DefaultSelector()
+    for inicio in range(0, clientes, tanda):
+        pendientes = 0
+        for i in range(inicio, min(inicio + tanda, clientes)):
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            if sys.platform.startswith("linux"):
+                s.setsockopt(socket.IPPROTO_IP, IP_BIND_ADDRESS_NO_PORT, 1)
+            s.bind((f"127.0.0.{i % ips + 1}", 0))
+            s.setblocking(False)
+            s.connect_ex(("127.0.0.1", port))
+            sel.register(s, selectors.EVENT_WRITE, i)
+            socks.append(s)
+            pendientes += 1
+        while pendientes:
+            for key, _ in sel.select(60):
+                s = key.fileobj
+                sel.unregister(s)
+                pendientes -= 1
+                err = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err:
+                    raise OSError(err, os.strerror(err))
+                s.send(f"nombre:m{key.data};tramite:consulta\n".encode())
+    sel.close()
+
+    # el proxy procesó el hello cuando contesta "Esperando a ser atendido"
+    for s in socks:
+        s.settimeout(60)
+        recibido = b""
+        while b"Esperando" not in recibido:
+            chunk = s.recv(4096)
+            if not chunk:
+                raise ConnectionError("el proxy cerró una conexión")
+            recibido += chunk
+    return socks
+
+
+def medir(engine, port, clientes, ips):
+    with tempfile.TemporaryDirectory(prefix="bench_turnos_") as data_dir:
+        proc = subprocess.Popen(
+            [sys.executable, PROXY, "--port", str(port), "--engine", engine, "--no-uvloop"],
+            stdout=subprocess.DEVNULL, env=dict(os.environ, TURNOS_DATA_DIR=data_dir),
+        )
+        socks = []
+        try:
+            esperar_puerto(port)
+            time.sleep(0.5)
+            antes = rss_kb(proc.pid)
+            t0 = time.perf_counter()
+            socks = conectar(port, clientes, ips)
+            dt = time.perf_counter() - t0
+            time.sleep(0.5)
+            despues = rss_kb(proc.pid)
+        finally:
+            for s in socks:
+                s.close()
+            proc.send_signal(signal.SIGINT)
+            proc.wait(30)
+    return antes, despues, dt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria del proxy con clientes ociosos en espera")
+    parser.add_argument("--clientes", type=int, default=50000)
+    parser.add_argument("--engine", nargs="+", default=["selectors"], choices=["selectors", "asyncio"])
+    parser.add_argument("--port", type=int, default=5700)
+    parser.add_argument("--ips", type=int, default=4, help="IPs de loopback de origen")
+    args = parser.parse_args()
+
+    # este proceso y el proxy (que hereda el límite) tienen un fd por cliente
+    limite = subir_limite_fds(args.clientes + 1024)
+    clientes = min(args.clientes, limite - 1024)
+    if clientes < args.clientes:
+        print(f"RLIMIT_NOFILE={limite}: se miden {clientes} clientes y se proyecta a {args.clientes}")
+
+    print(f"{clientes} clientes esperando turno\n")
+    print(f"{'motor':<10} {'RSS base':>10} {'RSS final':>10} {'por conexión':>13} "
+          f"{f'RSS {args.clientes}':>12} {'conexión/s':>11}")
+    for n, engine in enumerate(args.engine):
+        antes, despues, dt = medir(engine, args.port + n, clientes, args.ips)
+        por_conn = (despues - antes) * 1024 / clientes
+        proyectado = antes * 1024 + por_conn * args.clientes
+        print(
+            f"{engine:<10} {antes / 1024:>8.1f}MB {despues / 1024:>8.1f}MB "
+            f"{por_conn:>11.0f} B {proyectado / 2**20:>10.1f}MB {clientes / dt:>11.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
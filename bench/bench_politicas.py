@@ -0,0 +1,150 @@
+# bench/bench_politicas.py
+"""
+Compara las políticas de atención de politicas.py con la misma carga:
+
+- Costo: con N turnos esperando en el Despachador (reloj virtual), us por
+  alta (nuevo_turno), por baja (ausente), por pop (admin_listo de un admin
+  que atiende todo) y por cliente en posiciones() (el rango). En aging y
+  estricta el pop paga además las promociones pendientes: con la cola llena
+  de turnos viejos son casi todos a la vez.
+- Espera: la misma llegada sintética (simulacion.py, misma semilla) contra
+  cada política; p50/p99/max de la espera por trámite y la del total.
+
+Antes verifica que posiciones() de cada política diga exactamente el orden
+en que después salen los turnos.
+
+Uso:
+    python3 bench/bench_politicas.py --sizes 10000 100000 --turnos 200000
+    python3 bench/bench_politicas.py --politicas aging:30 estricta:300 edf:pago=120
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVIDOR_DIR = os.path.join(BASE_DIR, "..", "servidor")
+if SERVIDOR_DIR not in sys.path:
+    sys.path.insert(0, SERVIDOR_DIR)
+
+from turnos_service import Despachador
+from politicas import parse_politica
+from simulacion import Simulacion, llegadas_sinteticas, MEZCLA, ATENCION
+
+TRAMITES = list(MEZCLA) + ["otro"]
+
+POLITICAS = ["aging:30", "estricta:600", "wfq", "edf", "sest:" + ",".join(f"{t}={s:g}" for t, s in ATENCION.items())]
+
+
+class Reloj:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def verificar(spec, n=2000, seed=1):
+    """posiciones() con la cola quieta == orden en que salen, con ausentes y reanudados de por medio."""
+    rng = random.Random(seed)
+    reloj = Reloj()
+    d = Despachador(reloj=reloj, politica=parse_politica(spec))
+    for i in range(n):
+        reloj.t += rng.expovariate(1.0)
+        d.nuevo_turno(i, "n", rng.choice(TRAMITES))
+        r = rng.random()
+        if r < 0.1:
+            d.ausente(rng.randrange(i + 1))
+        elif r < 0.15:
+            d.reanudar(rng.randrange(i + 1), "n", "pago")
+        elif r < 0.45:
+            d.admin_listo("A")
+            d.quitar_admin("A")
+    posiciones = dict(d.posiciones())
+    salida = []
+    while len(d):
+        salida.extend(t["cliente_id"] for t in d.admin_listo("A"))
+        d.quitar_admin("A")
+    real = {cliente_id: i for i, cliente_id in enumerate(salida)}
+    if real != posiciones:
+        distintos = sum(real[c] != posiciones.get(c) for c in real)
+        raise AssertionError(f"{spec}: posiciones() difiere del orden de salida en {distintos} turnos")
+
+
+def medir_costo(spec, size, ops, seed):
+    """us por alta, baja, pop y por cliente en posiciones(), con `size` turnos esperando."""
+    rng = random.Random(seed)
+    reloj = Reloj()
+    d = Despachador(reloj=reloj, politica=parse_politica(spec))
+    for i in range(size):
+        reloj.t += 0.01
+        d.nuevo_turno(i, "n", rng.choice(TRAMITES))
+
+    t0 = time.perf_counter()
+    for i in range(size, size + ops):
+        reloj.t += 0.01
+        d.nuevo_turno(i, "n", rng.choice(TRAMITES))
+    alta = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for i in rng.sample(range(size + ops), ops):
+        d.ausente(i)
+    baja = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for _ in range(ops):
+        reloj.t += 0.01
+        d.admin_listo("A")
+        d.quitar_admin("A")
+    pop = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    en_espera = sum(1 for _ in d.posiciones())
+    rango = time.perf_counter() - t0
+    return alta / ops * 1e6, baja / ops * 1e6, pop / ops * 1e6, rango / max(en_espera, 1) * 1e6
+
+
+def medir_espera(spec, admins, turnos, tasa, seed):
+    llegadas = llegadas_sinteticas(turnos, tasa, MEZCLA, ATENCION, seed)
+    t0 = time.perf_counter()
+    sim = Simulacion([((), admins)], politica=parse_politica(spec)).correr(llegadas)
+    return sim, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las políticas de atención")
+    parser.add_argument("--politicas", nargs="+", default=POLITICAS)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="turnos esperando")
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--turnos", type=int, default=200000, help="turnos simulados para la espera")
+    parser.add_argument("--tasa", type=float, default=0.05, help="llegadas por segundo (10 admins: ~87%% de ocupación)")
+    parser.add_argument("--admins", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for spec in args.politicas:
+        verificar(spec)
+    print("Verificación: en todas las políticas posiciones() coincide con el orden de salida")
+    print()
+
+    print(f"{'politica':<14} {'esperando':>10} {'alta us':>9} {'baja us':>9} {'pop us':>9} {'rango us':>9}")
+    for spec in args.politicas:
+        for size in args.sizes:
+            alta, baja, pop, rango = medir_costo(spec, size, args.ops, args.seed)
+            print(f"{spec.partition(':')[0]:<14} {size:>10} {alta:>9.2f} {baja:>9.2f} {pop:>9.2f} {rango:>9.2f}")
+    print()
+
+    print(f"{args.turnos} turnos, {args.tasa:g}/s, {args.admins} admins (espera en segundos)")
+    print(f"{'politica':<14} {'tramite':<10} {'prom':>8} {'p50':>8} {'p99':>8} {'max':>8} {'turnos/s':>10}")
+    for spec in args.politicas:
+        sim, segundos = medir_espera(spec, args.admins, args.turnos, args.tasa, args.seed)
+        velocidad = f"{sim.turnos / segundos:,.0f}"
+        for tramite, h in [*sorted(sim.espera.items()), ("(todos)", sim.espera_total)]:
+            print(f"{spec.partition(':')[0]:<14} {tramite:<10} {h.sum / h.count:>8.1f} {h.percentil(0.5):>8.1f} "
+                  f"{h.percentil(0.99):>8.1f} {h.max:>8.1f} {velocidad:>10}")
+            velocidad = ""
+
+
+if __name__ == "__main__":
+    main()
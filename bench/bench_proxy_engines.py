@@ -0,0 +1,193 @@
+# bench/bench_proxy_engines.py
+"""
+Compara los motores del proxy (selectors vs asyncio [+uvloop], y selectors
+con --workers N) con sesiones concurrentes reales: por cada motor levanta
+proxy_server.py, conecta N admins y N clientes, espera los emparejamientos y
+hace ping-pong de M mensajes por sesión (cliente -> admin -> cliente).
+
+Para medir --workers la carga también tiene que repartirse en varios
+procesos (--procesos-carga), si no el generador es el cuello de botella.
+
+Uso:
+    python3 bench/bench_proxy_engines.py --sesiones 200 --mensajes 200
+    python3 bench/bench_proxy_engines.py --workers 2 4 --procesos-carga 4
+"""
+import os
+import sys
+import time
+import socket
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from multiprocessing import Pool
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROXY = os.path.join(BASE_DIR, "..", "servidor", "proxy_server.py")
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+def esperar_puerto(port, timeout=10.0):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"el proxy no abrió el puerto {port}")
+
+
+async def leer_hasta(reader, prefijo):
+    while True:
+        linea = await reader.readline()
+        if not linea:
+            raise ConnectionError("el proxy cerró la conexión")
+        if linea.startswith(prefijo):
+            return linea
+
+
+async def admin(port, i, listo, mensajes):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"ADMIN_LOGIN:B{i}\n".encode())
+    await leer_hasta(reader, b"Esperando turnos")
+    listo.set_result(None)
+    await leer_hasta(reader, b"Atendiendo a Cliente")
+    for _ in range(mensajes):
+        linea = await leer_hasta(reader, b"Cliente ")
+        writer.write(b"pong " + linea.rsplit(b" ", 1)[1])
+    await leer_hasta(reader, b"FIN")
+    writer.close()
+
+
+async def cliente(port, i, mensajes, rtts):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    t0 = time.perf_counter()
+    writer.write(f"nombre:bench{i};tramite:consulta\n".encode())
+    await leer_hasta(reader, b"Usted est")
+    t_pareo = time.perf_counter() - t0
+    for n in range(mensajes):
+        t = time.perf_counter()
+        writer.write(f"ping {n}\n".encode())
+        await leer_hasta(reader, b"Admin ")
+        rtts.append(time.perf_counter() - t)
+    writer.write(b"FIN\n")
+    await leer_hasta(reader, b"FIN")
+    writer.close()
+    return t_pareo
+
+
+async def correr_carga(port, sesiones, mensajes, base=0):
+    loop = asyncio.get_running_loop()
+    ids = range(base, base + sesiones)
+    listos = {i: loop.create_future() for i in ids}
+    admins = [asyncio.create_task(admin(port, i, listos[i], mensajes)) for i in ids]
+    await asyncio.gather(*listos.values())
+
+    rtts = []
+    t0 = time.perf_counter()
+    pareos = await asyncio.gather(*(cliente(port, i, mensajes, rtts) for i in ids))
+    total = time.perf_counter() - t0
+    await asyncio.gather(*admins)
+    return total, pareos, rtts
+
+
+def proceso_carga(port, sesiones, mensajes, base):
+    with asyncio.Runner(loop_factory=uvloop.new_event_loop if uvloop else None) as runner:
+        return runner.run(correr_carga(port, sesiones, mensajes, base))
+
+
+def cpu_arbol(pid):
+    """Segundos de CPU (user + sys) de pid y sus descendientes (Linux; 0 si no hay /proc)."""
+    total = 0.0
+    pendientes = [pid]
+    while pendientes:
+        p = pendientes.pop()
+        try:
+            with open(f"/proc/{p}/stat") as f:
+                campos = f.read().rsplit(")", 1)[1].split()
+            total += (int(campos[11]) + int(campos[12])) / os.sysconf("SC_CLK_TCK")
+            for tarea in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{tarea}/children") as f:
+                    pendientes.extend(int(h) for h in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+def percentil(ordenados, q):
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))]
+
+
+def medir(engine, port, sesiones, mensajes, extra, procesos_carga=1):
+    with tempfile.TemporaryDirectory(prefix="bench_turnos_") as data_dir:
+        proc = subprocess.Popen(
+            [sys.executable, PROXY, "--port", str(port), "--engine", engine] + extra,
+            stdout=subprocess.DEVNULL, env=dict(os.environ, TURNOS_DATA_DIR=data_dir),
+        )
+        try:
+            esperar_puerto(port)
+            cpu0 = cpu_arbol(proc.pid)
+            por_proceso = sesiones // procesos_carga
+            with Pool(procesos_carga) as pool:
+                partes = pool.starmap(
+                    proceso_carga,
+                    [(port, por_proceso, mensajes, k * por_proceso) for k in range(procesos_carga)],
+                )
+            cpu = cpu_arbol(proc.pid) - cpu0
+        finally:
+            proc.send_signal(signal.SIGINT)
+            proc.wait(10)
+
+    sesiones = por_proceso * procesos_carga
+    total = max(p[0] for p in partes)
+    pareos = [x for p in partes for x in p[1]]
+    rtts = sorted(x for p in partes for x in p[2])
+
+    relayed = sesiones * mensajes * 2
+    return {
+        "total_s": total,
+        "msgs_s": relayed / total,
+        # por segundo de CPU del servidor (proxy + Turnos + DB): no depende de
+        # cuántos cores le quedan libres al generador de carga
+        "msgs_cpu_s": relayed / cpu if cpu > 0 else 0.0,
+        "rtt_p50_ms": percentil(rtts, 0.5) * 1000,
+        "rtt_p99_ms": percentil(rtts, 0.99) * 1000,
+        "pareo_p50_ms": percentil(sorted(pareos), 0.5) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de motores del proxy")
+    parser.add_argument("--sesiones", type=int, default=200, help="sesiones concurrentes (admins = clientes)")
+    parser.add_argument("--mensajes", type=int, default=200, help="ping-pongs por sesión")
+    parser.add_argument("--port", type=int, default=5600)
+    parser.add_argument("--workers", type=int, nargs="*", default=[], help="además, selectors con --workers N")
+    parser.add_argument("--procesos-carga", type=int, default=1, help="procesos generadores de carga")
+    args = parser.parse_args()
+
+    motores = [("selectors", "selectors", []), ("asyncio", "asyncio", ["--no-uvloop"])]
+    if uvloop is not None:
+        motores.append(("asyncio+uvloop", "asyncio", []))
+    for w in args.workers:
+        motores.append((f"selectors x{w}", "selectors", ["--workers", str(w)]))
+
+    print(f"{args.sesiones} sesiones x {args.mensajes} ping-pongs, {args.procesos_carga} procesos de carga\n")
+    print(f"{'motor':<16} {'total s':>8} {'msgs/s':>10} {'msgs/s CPU':>11} {'rtt p50':>9} {'rtt p99':>9} {'pareo p50':>10}")
+    for n, (nombre, engine, extra) in enumerate(motores):
+        r = medir(engine, args.port + n, args.sesiones, args.mensajes, extra, args.procesos_carga)
+        print(
+            f"{nombre:<16} {r['total_s']:>8.2f} {r['msgs_s']:>10.0f} {r['msgs_cpu_s']:>11.0f} "
+            f"{r['rtt_p50_ms']:>7.2f}ms {r['rtt_p99_ms']:>7.2f}ms {r['pareo_p50_ms']:>8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
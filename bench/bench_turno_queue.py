@@ -0,0 +1,158 @@
+# bench/bench_turno_queue.py
+"""
+Compara la TurnoQueue actual (heaps por nivel, pop O(log n)) contra la
+implementación anterior (re-escaneo + heapify en cada pop, O(n)), y mide
+cuánto tarda Despachador.posiciones() (el rango de cada cliente en espera,
+O(log n) por cliente) con toda la cola llena.
+
+Uso:
+    python3 bench/bench_turno_queue.py --sizes 10000 100000 --pops 2000
+"""
+import os
+import sys
+import time
+import heapq
+import random
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVIDOR_DIR = os.path.join(BASE_DIR, "..", "servidor")
+if SERVIDOR_DIR not in sys.path:
+    sys.path.insert(0, SERVIDOR_DIR)
+
+import turnos_service
+from turnos_service import TurnoQueue, Despachador, PRIORIDADES
+
+TRAMITES = list(PRIORIDADES)
+
+
+class TurnoQueueLegacy:
+    """Copia de la implementación previa, solo como referencia."""
+    def __init__(self, aging_seconds=30):
+        self.heap = []
+        self.counter = 0
+        self.aging_seconds = aging_seconds
+
+    def push(self, cliente_id, nombre, tramite):
+        prioridad = PRIORIDADES.get(tramite, 3)
+        self.counter += 1
+        ts = time.time()
+        heapq.heappush(self.heap, [prioridad, self.counter, cliente_id, nombre, tramite, ts])
+
+    def pop(self):
+        if not self.heap:
+            return None
+
+        now = time.time()
+        for item in self.heap:
+            prioridad, orden, cliente_id, nombre, tramite, ts = item
+            espera = now - ts
+            if espera >= self.aging_seconds and prioridad > 1:
+                item[0] = prioridad - 1
+                item[5] = now
+
+        heapq.heapify(self.heap)
+        prioridad, orden, cliente_id, nombre, tramite, ts = heapq.heappop(self.heap)
+        return {
+            "cliente_id": cliente_id,
+            "nombre": nombre,
+            "tramite": tramite,
+            "prioridad": prioridad,
+            "orden": orden
+        }
+
+
+class RelojFalso:
+    """Reemplaza al módulo time en ambas colas para la verificación."""
+    def __init__(self):
+        self.t = 0.0
+
+    def time(self):
+        return self.t
+
+
+def verificar(n=3000, aging_seconds=30, seed=1):
+    """Con el mismo reloj y la misma secuencia, ambas colas deben asignar igual."""
+    global time
+    rng = random.Random(seed)
+    reloj = RelojFalso()
+    time_real = time
+    turnos_service.time = reloj
+    time = reloj
+    try:
+        nueva, vieja = TurnoQueue(aging_seconds), TurnoQueueLegacy(aging_seconds)
+        for i in range(n):
+            reloj.t += rng.expovariate(1.0)
+            if rng.random() < 0.55:
+                tramite = rng.choice(TRAMITES)
+                nueva.push(str(i), "x", tramite)
+                vieja.push(str(i), "x", tramite)
+            else:
+                a, b = nueva.pop(), vieja.pop()
+                if a != b:
+                    raise AssertionError(f"Difieren en paso {i}: {a} != {b}")
+    finally:
+        turnos_service.time = time_real
+        time = time_real
+
+
+def medir(cls, size, pops, aging_seconds):
+    rng = random.Random(size)
+    q = cls(aging_seconds=aging_seconds)
+
+    t0 = time.perf_counter()
+    for i in range(size):
+        q.push(str(i), f"Cliente_{i}", rng.choice(TRAMITES))
+    t_push = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for _ in range(pops):
+        q.pop()
+    t_pop = time.perf_counter() - t0
+
+    return t_push / size * 1e6, t_pop / pops * 1e6
+
+
+def medir_posiciones(size, aging_seconds):
+    """Tiempo de calcular la posición de los `size` clientes en espera (un aviso completo)."""
+    rng = random.Random(size)
+    despachador = Despachador(aging_seconds=aging_seconds)
+    for i in range(size):
+        despachador.nuevo_turno(str(i), f"Cliente_{i}", rng.choice(TRAMITES))
+    # sacar algunos del medio, como clientes que se desconectan
+    for i in range(0, size, 7):
+        despachador.ausente(str(i))
+
+    t0 = time.perf_counter()
+    n = sum(1 for _ in despachador.posiciones())
+    return (time.perf_counter() - t0) * 1e3, n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TurnoQueue vs implementación anterior")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--pops", type=int, default=1000, help="pops medidos sobre la cola llena")
+    parser.add_argument("--aging", type=float, default=30.0, help="aging_seconds (0 = todos envejecen)")
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    verificar()
+    print("Verificación: mismo orden de asignación que la implementación anterior [OK]\n")
+
+    print(f"{'impl':<8} {'turnos':>8} {'push us':>10} {'pop us':>12}")
+    for size in args.sizes:
+        impls = [("nueva", TurnoQueue)]
+        if not args.skip_legacy:
+            impls.append(("legacy", TurnoQueueLegacy))
+        for nombre, cls in impls:
+            push_us, pop_us = medir(cls, size, min(args.pops, size), args.aging)
+            print(f"{nombre:<8} {size:>8} {push_us:>10.2f} {pop_us:>12.2f}")
+
+    print(f"\n{'en espera':>10} {'posiciones ms':>14} {'us/cliente':>11}")
+    for size in args.sizes:
+        ms, n = medir_posiciones(size, args.aging)
+        print(f"{n:>10} {ms:>14.1f} {ms * 1e3 / n:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
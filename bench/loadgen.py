@@ -0,0 +1,319 @@
+# bench/loadgen.py
+"""
+Generador de carga headless: simula miles de clientes y administrativos en un
+solo proceso (asyncio) hablando el protocolo real contra un proxy ya levantado.
+
+- Admins: se loguean, atienden, responden cada mensaje del cliente (con
+  --admin-think opcional) y vuelven a quedar disponibles tras el FIN. Con
+  --capacidad N cada admin atiende N sesiones a la vez por su conexión
+  (mensajes etiquetados "@<cliente_id>") y piensa cada respuesta aparte.
+- Clientes: llegan como proceso de Poisson (--rate por segundo), eligen
+  trámite según --mix, conversan --mensajes ida y vuelta con --think de
+  espera entre mensajes y terminan con FIN.
+
+Reporta latencia de emparejamiento (hello -> "Usted está siendo atendido"),
+RTT de relay (mensaje del cliente -> respuesta del admin, sin contar el
+think del admin), sesiones/s y filas nuevas en la DB. Con --json deja el
+resultado en un archivo (o "-" para stdout) para comparar corridas.
+
+Uso:
+    python3 servidor/proxy_server.py --port 5000 &
+    python3 bench/loadgen.py --admins 50 --clientes 2000 --rate 200 --json resultado.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVIDOR_DIR = os.path.join(BASE_DIR, "..", "servidor")
+if SERVIDOR_DIR not in sys.path:
+    sys.path.insert(0, SERVIDOR_DIR)
+
+from db import DB_PATH
+from protocol import PING, PONG
+
+PING_B = PING.encode()
+PONG_B = PONG.encode()
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Resultados:
+    def __init__(self):
+        self.pareo = []         # segundos hello -> emparejado
+        self.rtt = []           # segundos mensaje cliente -> respuesta admin
+        self.ok = 0
+        self.fallidas = 0
+        self.errores = {}
+
+    def error(self, e):
+        nombre = type(e).__name__
+        self.errores[nombre] = self.errores.get(nombre, 0) + 1
+        self.fallidas += 1
+
+
+class Ocupado(Exception):
+    """El proxy rechazó al cliente (OCUPADO): aparece en errores como "Ocupado"."""
+
+
+def parse_mix(texto):
+    """'pago=1,reclamo=2,consulta=3' -> ([tramites], [pesos])"""
+    tramites, pesos = [], []
+    for parte in texto.split(","):
+        nombre, _, peso = parte.partition("=")
+        tramites.append(nombre.strip())
+        pesos.append(float(peso or 1))
+    return tramites, pesos
+
+
+async def leer_linea(reader, timeout):
+    linea = await asyncio.wait_for(reader.readline(), timeout)
+    if not linea:
+        raise ConnectionError("el proxy cerró la conexión")
+    return linea.decode(errors="ignore").rstrip("\n")
+
+
+async def admin(args, i, listo):
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    try:
+        login = f"ADMIN_LOGIN:{args.prefijo_admin}{i}"
+        skills = args.admin_skills[(i - 1) % len(args.admin_skills)] if args.admin_skills else ""
+        if skills and skills != "*":
+            login += f";skills:{skills}"
+        if args.capacidad > 1:
+            login += f";capacidad:{args.capacidad}"
+        writer.write(f"{login}\n".encode())
+        while not (await reader.readline()).startswith(b"Esperando turnos"):
+            pass
+        listo.set_result(None)
+
+        pensando = set()
+        while True:
+            linea = await reader.readline()
+            if not linea:
+                return
+            if linea.rstrip(b"\n") == PING_B:
+                writer.write(PONG_B + b"\n")
+                continue
+            if args.capacidad > 1:
+                # "@<id> Cliente <id>: <texto>" -> "@<id> <texto>", cada sesión a su ritmo
+                etiqueta, _, resto = linea.partition(b" ")
+                if not (etiqueta.startswith(b"@") and resto.startswith(b"Cliente ")):
+                    continue
+                respuesta = etiqueta + b" " + resto.split(b": ", 1)[1]
+                if args.admin_think:
+                    tarea = asyncio.create_task(responder(writer, respuesta, args.admin_think))
+                    pensando.add(tarea)
+                    tarea.add_done_callback(pensando.discard)
+                else:
+                    writer.write(respuesta)
+                continue
+            if not linea.startswith(b"Cliente "):
+                continue
+            # "Cliente <id>: <texto>" -> se devuelve el texto (el cliente mide el RTT)
+            texto = linea.split(b": ", 1)[1]
+            if args.admin_think:
+                await asyncio.sleep(random.expovariate(1 / args.admin_think))
+            writer.write(texto)
+    finally:
+        writer.close()
+
+
+async def responder(writer, respuesta, think):
+    await asyncio.sleep(random.expovariate(1 / think))
+    if not writer.is_closing():
+        writer.write(respuesta)
+
+
+async def cliente(args, i, tramite, res):
+    t0 = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    except OSError as e:
+        res.error(e)
+        return
+    try:
+        writer.write(f"nombre:carga{i};tramite:{tramite}\n".encode())
+        while True:
+            linea = await leer_linea(reader, args.timeout)
+            if linea.startswith("Usted est"):
+                break
+            if linea.startswith("OCUPADO:"):
+                raise Ocupado(linea)
+            if linea == PING:
+                writer.write(PONG_B + b"\n")
+        res.pareo.append(time.perf_counter() - t0)
+
+        mensajes = random.randint(args.mensajes_min, args.mensajes)
+        for n in range(mensajes):
+            if args.think:
+                await asyncio.sleep(random.expovariate(1 / args.think))
+            texto = f"m{i}-{n}"
+            t = time.perf_counter()
+            writer.write(f"{texto}\n".encode())
+            while not (await leer_linea(reader, args.timeout)).endswith(texto):
+                pass
+            res.rtt.append(time.perf_counter() - t)
+
+        writer.write(b"FIN\n")
+        while await leer_linea(reader, args.timeout) != "FIN":
+            pass
+        res.ok += 1
+    except (OSError, ConnectionError, asyncio.TimeoutError, Ocupado) as e:
+        res.error(e)
+    finally:
+        writer.close()
+
+
+def filas_db(path):
+    """Máximo id de turnos_atendidos (conexión de solo lectura), o None si no hay DB."""
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM turnos_atendidos").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+
+
+def percentiles_ms(muestras):
+    if not muestras:
+        return {"n": 0}
+    ordenadas = sorted(muestras)
+
+    def p(q):
+        return round(ordenadas[min(len(ordenadas) - 1, int(q * len(ordenadas)))] * 1000, 3)
+
+    return {
+        "n": len(ordenadas),
+        "p50": p(0.5), "p90": p(0.9), "p99": p(0.99),
+        "max": round(ordenadas[-1] * 1000, 3),
+        "prom": round(sum(ordenadas) / len(ordenadas) * 1000, 3),
+    }
+
+
+async def correr(args):
+    res = Resultados()
+    tramites, pesos = parse_mix(args.mix)
+    loop = asyncio.get_running_loop()
+
+    listos = [loop.create_future() for _ in range(args.admins)]
+    admins = [asyncio.create_task(admin(args, i + 1, listos[i])) for i in range(args.admins)]
+    await asyncio.gather(*listos)
+
+    filas_antes = filas_db(args.db)
+
+    clientes = []
+    t0 = time.perf_counter()
+    for i in range(args.clientes):
+        if args.duracion and time.perf_counter() - t0 >= args.duracion:
+            break
+        tramite = random.choices(tramites, pesos)[0]
+        clientes.append(asyncio.create_task(cliente(args, i + 1, tramite, res)))
+        if args.rate:
+            await asyncio.sleep(random.expovariate(args.rate))
+    await asyncio.gather(*clientes)
+    total = time.perf_counter() - t0
+
+    for a in admins:
+        a.cancel()
+    await asyncio.gather(*admins, return_exceptions=True)
+
+    # el DB worker escribe por lotes: se le da un margen antes de contar
+    await asyncio.sleep(args.db_espera)
+    filas_despues = filas_db(args.db)
+
+    return {
+        "config": {
+            "admins": args.admins, "admin_skills": args.admin_skills, "capacidad": args.capacidad,
+            "clientes": len(clientes), "rate": args.rate, "mix": args.mix,
+            "mensajes": [args.mensajes_min, args.mensajes], "think": args.think,
+            "admin_think": args.admin_think,
+        },
+        "duracion_s": round(total, 3),
+        "sesiones": {
+            "ok": res.ok,
+            "fallidas": res.fallidas,
+            "por_segundo": round(res.ok / total, 2) if total else 0,
+            "errores": res.errores,
+        },
+        "pareo_ms": percentiles_ms(res.pareo),
+        "rtt_ms": percentiles_ms(res.rtt),
+        "db_filas_nuevas": (
+            filas_despues - filas_antes
+            if filas_antes is not None and filas_despues is not None else None
+        ),
+    }
+
+
+def subir_limite_fds():
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def imprimir(r):
+    s = r["sesiones"]
+    print(f"Sesiones: {s['ok']} ok, {s['fallidas']} fallidas en {r['duracion_s']}s ({s['por_segundo']} sesiones/s)")
+    if s["errores"]:
+        print(f"  errores: {s['errores']}")
+    for clave, titulo in (("pareo_ms", "Emparejamiento"), ("rtt_ms", "RTT relay")):
+        p = r[clave]
+        if p["n"]:
+            print(f"{titulo:<15} n={p['n']} p50={p['p50']}ms p90={p['p90']}ms p99={p['p99']}ms max={p['max']}ms")
+    print(f"Filas nuevas en DB: {r['db_filas_nuevas']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de carga headless para el proxy de turnos")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--admins", type=int, default=20)
+    parser.add_argument("--prefijo-admin", default="L", help="ids de admin: <prefijo>1..N")
+    parser.add_argument("--admin-skills", default="",
+                        help="grupos de skills repartidos en ronda entre los admins, ej: 'pago,reclamo/consulta/*'")
+    parser.add_argument("--capacidad", type=int, default=1, help="sesiones a la vez por admin")
+    parser.add_argument("--clientes", type=int, default=500, help="total de clientes a generar")
+    parser.add_argument("--duracion", type=float, default=0, help="corta las llegadas a los N segundos (0 = sin límite)")
+    parser.add_argument("--rate", type=float, default=100.0, help="llegadas de clientes por segundo (0 = todos juntos)")
+    parser.add_argument("--mix", default="pago=1,reclamo=1,consulta=1", help="pesos por trámite")
+    parser.add_argument("--mensajes", type=int, default=5, help="mensajes por conversación (máximo)")
+    parser.add_argument("--mensajes-min", type=int, default=None, help="mínimo (default = --mensajes)")
+    parser.add_argument("--think", type=float, default=0.0, help="segundos promedio entre mensajes del cliente")
+    parser.add_argument("--admin-think", type=float, default=0.0, help="segundos promedio antes de responder")
+    parser.add_argument("--timeout", type=float, default=120.0, help="timeout por lectura del cliente")
+    parser.add_argument("--db", default=DB_PATH, help="DB para contar filas persistidas")
+    parser.add_argument("--db-espera", type=float, default=1.0, help="margen antes de contar filas")
+    parser.add_argument("--json", help="escribe el resultado en este archivo ('-' = stdout)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    if args.mensajes_min is None:
+        args.mensajes_min = args.mensajes
+    args.admin_skills = [g for g in args.admin_skills.split("/") if g]
+
+    random.seed(args.seed)
+    subir_limite_fds()
+    r = asyncio.run(correr(args))
+
+    if args.json == "-":
+        print(json.dumps(r, indent=2))
+        return
+    imprimir(r)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(r, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
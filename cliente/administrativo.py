@@ -1,34 +1,95 @@
+import os
 import socket
 import argparse
 import threading
 import select
 import sys
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVIDOR_DIR = os.path.join(BASE_DIR, "..", "servidor")
+if SERVIDOR_DIR not in sys.path:
+    sys.path.insert(0, SERVIDOR_DIR)
 
-def escuchar_mensajes(s: socket.socket, stop: threading.Event, in_session: threading.Event):
+from protocol import encode_frame, parse_etiqueta, FrameDecoder, RECV_SIZE, PING, PONG, MAX_CAPACIDAD
+from enviador import Enviador
+
+
+class Sesiones:
+    """
+    Conversaciones abiertas de un admin con capacidad > 1 (por cliente_id,
+    que es la etiqueta de la sesión) y la actual: a la que van los mensajes
+    que se escriben sin "@<cliente_id>".
+    """
+    def __init__(self):
+        self.abiertas = []
+        self.actual = None
+
+    def abrir(self, sesion):
+        self.abiertas.append(sesion)
+        if self.actual is None:
+            self.elegir(sesion)
+
+    def cerrar(self, sesion):
+        if sesion in self.abiertas:
+            self.abiertas.remove(sesion)
+        if self.actual == sesion:
+            self.actual = None
+            if self.abiertas:
+                self.elegir(self.abiertas[0])
+
+    def elegir(self, sesion):
+        self.actual = sesion
+        print(f"[Escribiendo a la sesión @{sesion}]")
+
+
+def mostrar_etiquetado(msg, sesiones: Sesiones):
+    etiqueta = parse_etiqueta(msg)
+    if etiqueta is None:
+        print(f"\n{msg}")
+        return
+    sesion, texto = etiqueta
+    print(f"\n[{sesion}] {texto}")
+    if texto.startswith("Atendiendo a Cliente"):
+        sesiones.abrir(sesion)
+    elif texto.upper() == "FIN":
+        sesiones.cerrar(sesion)
+        print(f"[Conversación @{sesion} finalizada. Queda un lugar libre para otro turno.]")
+
+
+def escuchar_mensajes(s: socket.socket, enviador: Enviador, stop: threading.Event, in_session: threading.Event,
+                      sesiones=None):
     """
     - stop: termina el programa administrativo (SALIR / Ctrl+C)
     - in_session: indica si el admin está atendiendo a un cliente
+    - sesiones: con capacidad > 1, las conversaciones abiertas (mensajes etiquetados)
     """
+    decoder = FrameDecoder()
     while not stop.is_set():
         try:
-            server_msg = s.recv(1024).decode(errors="ignore")
-            if not server_msg:
+            chunk = s.recv(RECV_SIZE)
+            if not chunk:
                 print("\n[Servidor desconectado]")
                 stop.set()
                 break
 
-            msg = server_msg.strip()
-            if msg:
-                print(f"\n{msg}")
-
-            if msg.startswith("Atendiendo a Cliente"):
-                in_session.set()
-
-            if msg.upper() == "FIN":
-                in_session.clear()
-                print("[Conversación finalizada. Quedás disponible para otro turno.]")
-                continue
+            for server_msg in decoder.feed(chunk):
+                if server_msg == PING:
+                    enviador.enviar(PONG)
+                    continue
+                msg = server_msg.strip()
+                if sesiones is not None:
+                    if msg:
+                        mostrar_etiquetado(msg, sesiones)
+                    continue
+                if msg:
+                    print(f"\n{msg}")
+
+                if msg.startswith("Atendiendo a Cliente"):
+                    in_session.set()
+
+                if msg.upper() == "FIN":
+                    in_session.clear()
+                    print("[Conversación finalizada. Quedás disponible para otro turno.]")
 
         except Exception as e:
             print(f"\n[Error de conexión: {e}]")
@@ -45,13 +106,38 @@ def escuchar_mensajes(s: socket.socket, stop: threading.Event, in_session: threa
         pass
 
 
-def enviar_mensajes(s: socket.socket, stop: threading.Event, in_session: threading.Event):
+def etiquetar_entrada(msg, sesiones: Sesiones):
+    """
+    Línea escrita por el admin que multiplexa -> frame a mandar (o None):
+    "@7 texto" va a la sesión 7 y la deja como actual, "@7" solo la elige,
+    y sin etiqueta va a la actual.
+    """
+    etiqueta = parse_etiqueta(msg)
+    if etiqueta is not None:
+        sesion, texto = etiqueta
+        if sesion not in sesiones.abiertas:
+            print(f"[No hay una sesión @{sesion}. Abiertas: {' '.join('@' + x for x in sesiones.abiertas) or 'ninguna'}]")
+            return None
+        if sesion != sesiones.actual:
+            sesiones.elegir(sesion)
+        return msg if texto.strip() else None
+    if sesiones.actual is None:
+        print("[No hay conversaciones abiertas. Esperá un turno...]")
+        return None
+    return f"@{sesiones.actual} {msg}"
+
+
+def enviar_mensajes(enviador: Enviador, stop: threading.Event, in_session: threading.Event, sesiones=None):
     """
     - Permite escribir mensajes.
     - FIN: cierra sesión actual, pero el admin queda activo.
     - SALIR o /exit: cierra el programa administrativo.
+    - Con sesiones (capacidad > 1): "@<cliente_id> texto" o "@<cliente_id>"
+      cambian de conversación; lo demás va a la actual.
     """
     print("(Escribí mensajes. FIN termina la conversación. SALIR (/exit) cierra el admin.)")
+    if sesiones is not None:
+        print("(Varias conversaciones a la vez: @<cliente_id> <mensaje> elige a quién le escribís.)")
 
     while not stop.is_set():
         r, _, _ = select.select([sys.stdin], [], [], 0.2)
@@ -72,9 +158,20 @@ def enviar_mensajes(s: socket.socket, stop: threading.Event, in_session: threadi
                 stop.set()
                 break
 
+            if sesiones is not None:
+                frame = etiquetar_entrada(msg, sesiones)
+                if frame is None:
+                    continue
+                try:
+                    enviador.enviar(frame)
+                except Exception:
+                    stop.set()
+                    break
+                continue
+
             if msg.strip().upper() == "FIN":
                 try:
-                    s.sendall(msg.encode())
+                    enviador.enviar(msg)
                 except Exception:
                     stop.set()
                     break
@@ -83,7 +180,7 @@ def enviar_mensajes(s: socket.socket, stop: threading.Event, in_session: threadi
                 continue
 
             try:
-                s.sendall(msg.encode())
+                enviador.enviar(msg)
             except Exception:
                 stop.set()
                 break
@@ -94,24 +191,34 @@ def main():
     parser.add_argument("--host", default="localhost")
     parser.add_argument("--port", type=int, default=5000)
     parser.add_argument("--admin_id", required=True)
+    parser.add_argument("--skills", default="", help="Trámites que atiende, ej: pago,reclamo (vacío = todos)")
+    parser.add_argument("--capacidad", type=int, default=1,
+                        help=f"Conversaciones a la vez por esta conexión (1-{MAX_CAPACIDAD})")
     args = parser.parse_args()
 
     s = None
     try:
         s = socket.create_connection((args.host, args.port))
-        s.sendall(f"ADMIN_LOGIN:{args.admin_id}".encode())
+        login = f"ADMIN_LOGIN:{args.admin_id}"
+        if args.skills:
+            login += f";skills:{args.skills}"
+        if args.capacidad > 1:
+            login += f";capacidad:{args.capacidad}"
+        s.sendall(encode_frame(login))
 
         stop = threading.Event()
         in_session = threading.Event()
+        sesiones = Sesiones() if args.capacidad > 1 else None
 
+        enviador = Enviador(s)
         t_escuchar = threading.Thread(
             target=escuchar_mensajes,
-            args=(s, stop, in_session),
+            args=(s, enviador, stop, in_session, sesiones),
             daemon=True,
         )
         t_escuchar.start()
 
-        enviar_mensajes(s, stop, in_session)
+        enviar_mensajes(enviador, stop, in_session, sesiones)
         print("[Fin de la sesión administrativa]")
 
     except KeyboardInterrupt:
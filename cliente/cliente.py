@@ -1,9 +1,18 @@
+import os
 import socket
 import argparse
 import threading
 import select
 import sys
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVIDOR_DIR = os.path.join(BASE_DIR, "..", "servidor")
+if SERVIDOR_DIR not in sys.path:
+    sys.path.insert(0, SERVIDOR_DIR)
+
+from protocol import encode_frame, parse_ocupado, parse_posicion, FrameDecoder, RECV_SIZE, PING, PONG
+from enviador import Enviador
+
 
 def elegir_tramite():
     print("Seleccione el tipo de trámite:")
@@ -22,20 +31,43 @@ def elegir_tramite():
             print("Opción inválida. Intente de nuevo.")
 
 
-def escuchar_mensajes(s: socket.socket, done: threading.Event):
+def mostrar(mensaje):
+    ocupado = parse_ocupado(mensaje)
+    if ocupado:
+        # el token era de un turno que ya no está y la cola está llena
+        segundos, motivo = ocupado
+        print(f"\nSu turno anterior ya no está y el servidor está ocupado ({motivo}). "
+              f"Intente de nuevo en {segundos} s.")
+        return
+    posicion = parse_posicion(mensaje)
+    if posicion is None:
+        print(f"\n{mensaje}")
+        return
+    lugar, espera = posicion
+    if espera is None:
+        print(f"\n[Su lugar en la fila: {lugar}]")
+    else:
+        print(f"\n[Su lugar en la fila: {lugar} - espera estimada: ~{espera} s]")
+
+
+def escuchar_mensajes(s: socket.socket, done: threading.Event, decoder: FrameDecoder, enviador: Enviador):
     while not done.is_set():
         try:
-            respuesta = s.recv(1024).decode(errors="ignore")
-            if not respuesta:
+            chunk = s.recv(RECV_SIZE)
+            if not chunk:
                 print("\n[Servidor desconectado]")
                 done.set()
                 break
 
-            print(f"\n{respuesta.strip()}")
-            if respuesta.strip().upper() == "FIN":
-                print("[La conversación ha finalizado]")
-                done.set()
-                break
+            for respuesta in decoder.feed(chunk):
+                if respuesta == PING:
+                    enviador.enviar(PONG)
+                    continue
+                mostrar(respuesta.strip())
+                if respuesta.strip().upper() == "FIN":
+                    print("[La conversación ha finalizado]")
+                    done.set()
+                    break
 
         except Exception as e:
             print(f"\n[Error de conexión: {e}]")
@@ -52,7 +84,7 @@ def escuchar_mensajes(s: socket.socket, done: threading.Event):
         pass
 
 
-def enviar_mensajes(s: socket.socket, done: threading.Event):
+def enviar_mensajes(enviador: Enviador, done: threading.Event):
     print("(Escribí mensajes. Para terminar: FIN)")
     while not done.is_set():
         r, _, _ = select.select([sys.stdin], [], [], 0.2)
@@ -66,8 +98,10 @@ def enviar_mensajes(s: socket.socket, done: threading.Event):
                 break
 
             mensaje_cliente = mensaje_cliente.rstrip("\n")
+            if not mensaje_cliente.strip():
+                continue
             try:
-                s.sendall(mensaje_cliente.encode())
+                enviador.enviar(mensaje_cliente)
             except Exception:
                 done.set()
                 break
@@ -83,6 +117,7 @@ def main():
     parser.add_argument("--port", type=int, default=5000)
     parser.add_argument("--name", help="Nombre del cliente")
     parser.add_argument("--tramite", choices=["pago", "reclamo", "consulta"], help="Tipo de trámite")
+    parser.add_argument("--token", help="Token de un turno anterior para retomar el lugar en la cola")
     args = parser.parse_args()
 
     nombre = args.name or input("Ingrese su nombre: ")
@@ -93,21 +128,45 @@ def main():
         s = socket.create_connection((args.host, args.port))
 
         mensaje = f"nombre:{nombre};tramite:{tramite}"
-        s.sendall(mensaje.encode())
-
-        cliente_id_msg = s.recv(1024).decode(errors="ignore")
+        if args.token:
+            mensaje += f";token:{args.token}"
+        s.sendall(encode_frame(mensaje))
+
+        decoder = FrameDecoder()
+        frames = []
+        while not frames:
+            chunk = s.recv(RECV_SIZE)
+            if not chunk:
+                print("No se recibió un identificador de cliente válido del servidor.")
+                return
+            frames = decoder.feed(chunk)
+
+        cliente_id_msg = frames.pop(0)
+        ocupado = parse_ocupado(cliente_id_msg)
+        if ocupado:
+            segundos, motivo = ocupado
+            print(f"El servidor está ocupado ({motivo}). Intente de nuevo en {segundos} s.")
+            return
         if cliente_id_msg.startswith("CLIENTE_ID:"):
-            cliente_id = cliente_id_msg.split(":", 1)[1].strip()
+            # CLIENTE_ID:<id>;token:<token>
+            cliente_id, _, token = cliente_id_msg.split(":", 1)[1].strip().partition(";token:")
             print(f"Su identificador de cliente es: {cliente_id}")
+            if token:
+                print(f"Si se corta la conexión, vuelva con --token {token} para conservar su lugar")
         else:
             print("No se recibió un identificador de cliente válido del servidor.")
             return
 
+        # lo que llegó junto con el CLIENTE_ID (ej: "Esperando a ser atendido...")
+        for frame in frames:
+            mostrar(frame)
+
         done = threading.Event()
-        t = threading.Thread(target=escuchar_mensajes, args=(s, done), daemon=True)
+        enviador = Enviador(s)
+        t = threading.Thread(target=escuchar_mensajes, args=(s, done, decoder, enviador), daemon=True)
         t.start()
 
-        enviar_mensajes(s, done)
+        enviar_mensajes(enviador, done)
         print("[Fin de la sesión de cliente]")
 
     except Exception as e:
@@ -0,0 +1,18 @@
+import threading
+
+from protocol import encode_frame
+
+
+class Enviador:
+    """
+    Los clientes escriben desde dos hilos (el de entrada y el que contesta
+    PONG): cada frame sale entero con un sendall bajo un lock, así un envío
+    parcial de uno no queda intercalado con el otro.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+
+    def enviar(self, msg: str):
+        with self.lock:
+            self.sock.sendall(encode_frame(msg))
@@ -0,0 +1,96 @@
+# servidor/admision.py
+import math
+import time
+
+# Cada cuánto se descartan los baldes de IPs que ya se llenaron de nuevo
+# (un balde lleno es igual a no tener balde)
+PURGAR_CADA = 10.0
+
+# Claves de max_cola / parse_max_cola para "cualquier trámite"
+TODOS = "*"
+
+
+def parse_max_cola(texto):
+    """'200' o 'pago=50,consulta=500' o '200,pago=50' -> {tramite | "*": límite}"""
+    limites = {}
+    for parte in (texto or "").split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        tramite, _, n = parte.rpartition("=")
+        limites[tramite.strip() or TODOS] = int(n)
+    return limites
+
+
+class Admision:
+    """
+    Control de admisión en la puerta del proxy (todo opcional, 0 = sin límite):
+      - max_conexiones: conexiones TCP abiertas a la vez
+      - max_cola: clientes esperando turno por trámite ({tramite | "*": n})
+      - tasa_ip / rafaga_ip: token bucket de conexiones nuevas por IP de origen
+
+    conexion() y turno() devuelven None si se admite o (reintentar_s, motivo)
+    si no; el proxy contesta OCUPADO al toque en vez de dejar al cliente
+    esperando un turno que no va a llegar. Los rechazos se cuentan por motivo.
+
+    Con --workers N cada worker tiene su propia instancia y los límites se
+    reparten entre los N (SO_REUSEPORT ya reparte las conexiones parejo).
+    Los clientes que retoman su turno con token no pasan por max_cola: ya
+    tenían su lugar.
+    """
+    def __init__(self, max_conexiones=0, max_cola=None, tasa_ip=0.0, rafaga_ip=0, reintento_s=5, workers=1):
+        self.max_conexiones = math.ceil(max_conexiones / workers)
+        self.max_cola = {t: math.ceil(n / workers) for t, n in (max_cola or {}).items() if n > 0}
+        self.tasa_ip = tasa_ip / workers
+        self.rafaga_ip = max(1.0, float(rafaga_ip or math.ceil(tasa_ip)))
+        self.reintento_s = reintento_s
+
+        self.baldes = {}    # ip -> [tokens, monotonic de la última recarga]
+        self._proxima_purga = 0.0
+        self.rechazos = {"conexiones": 0, "tasa_ip": 0, "cola": 0}
+
+    def conexion(self, ip, abiertas):
+        """Antes de aceptar una conexión nueva de ip con `abiertas` ya abiertas."""
+        if self.max_conexiones and abiertas >= self.max_conexiones:
+            return self._rechazar("conexiones", self.reintento_s)
+        if self.tasa_ip:
+            falta = self._tomar(ip, time.monotonic())
+            if falta:
+                return self._rechazar("tasa_ip", math.ceil(falta / self.tasa_ip))
+        return None
+
+    def turno(self, tramite, en_espera):
+        """Antes de encolar un turno nuevo con `en_espera` clientes ya esperando ese trámite."""
+        limite = self.max_cola.get(tramite, self.max_cola.get(TODOS, 0))
+        if limite and en_espera >= limite:
+            return self._rechazar("cola", self.reintento_s)
+        return None
+
+    def _rechazar(self, motivo, reintentar_s):
+        self.rechazos[motivo] += 1
+        return max(1, reintentar_s), motivo
+
+    def _tomar(self, ip, ahora):
+        """Saca un token del balde de ip; devuelve 0 o cuántos tokens faltan."""
+        if ahora >= self._proxima_purga:
+            self._purgar(ahora)
+        balde = self.baldes.get(ip)
+        if balde is None:
+            self.baldes[ip] = [self.rafaga_ip - 1, ahora]
+            return 0
+        tokens = min(self.rafaga_ip, balde[0] + (ahora - balde[1]) * self.tasa_ip)
+        balde[1] = ahora
+        if tokens < 1:
+            balde[0] = tokens
+            return 1 - tokens
+        balde[0] = tokens - 1
+        return 0
+
+    def _purgar(self, ahora):
+        self._proxima_purga = ahora + PURGAR_CADA
+        llenos = [
+            ip for ip, (tokens, t) in self.baldes.items()
+            if tokens + (ahora - t) * self.tasa_ip >= self.rafaga_ip
+        ]
+        for ip in llenos:
+            del self.baldes[ip]
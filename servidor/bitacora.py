@@ -0,0 +1,365 @@
+# servidor/bitacora.py
+"""
+Log estructurado (JSON lines) del proxy, Turnos y el DB Worker.
+
+Cada línea es un evento con tipo y campos:
+
+    log.info("emparejado", "Emparejado Admin {admin} <-> Cliente {cliente}", admin="A1", cliente="7")
+    -> {"ts": "...", "nivel": "INFO", "proceso": "proxy-0", "evento": "emparejado",
+        "msg": "Emparejado Admin A1 <-> Cliente 7", "admin": "A1", "cliente": "7"}
+
+Quien loguea solo arma un LogRecord y lo deja en una cola acotada
+(QueueHandler): el texto, el JSON y los write() los hace un hilo escritor
+(QueueListener) que junta lo que encuentra en la cola y hace flush cuando
+la vacía. Si la salida no da abasto y la cola se llena, los eventos nuevos
+se descartan y se cuentan en `descartados`: el event loop nunca espera al
+log. La rotación de los archivos (RotatingFileHandler) también pasa en ese
+hilo.
+
+Antes de arrancar() (y después de cerrar()) se escribe sincrónico, sin
+hilo: así un fork nunca copia un escritor a medio escribir.
+
+Nivel y muestreo se eligen por línea de comandos (--log-nivel,
+--log-muestreo evento=N: uno de cada N) y se cambian en caliente
+escribiendo el archivo de control (JSON con "nivel" y/o "muestreo"); el
+escritor lo revisa cada INTERVALO_CONTROL segundos y borrarlo vuelve a lo
+de la línea de comandos.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import logging
+import logging.handlers
+
+NOMBRE_LOGGER = "turnos"
+NIVELES = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+# Eventos esperando al escritor como máximo (pasado eso se descartan)
+MAX_PENDIENTES = 10000
+# Cada cuánto el escritor mira si cambió el archivo de control
+INTERVALO_CONTROL = 1.0
+# Rotación de los archivos por proceso
+MAX_BYTES_ARCHIVO = 50 * 1024 * 1024
+ARCHIVOS_ROTADOS = 5
+# Buffer de la salida: se vacía cuando la cola queda vacía, no por línea
+TAMANO_BUFFER = 64 * 1024
+
+
+def parse_muestreo(texto):
+    """'conexion=10,desconexion=10' -> {evento: N} (se escribe uno de cada N)"""
+    muestreo = {}
+    for parte in (texto or "").split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        evento, _, n = parte.partition("=")
+        muestreo[evento.strip()] = max(1, int(n))
+    return muestreo
+
+
+def nivel_de(nombre):
+    nombre = str(nombre).upper()
+    if nombre not in NIVELES:
+        raise ValueError(f"nivel de log desconocido: {nombre}")
+    return getattr(logging, nombre)
+
+
+def abrir_stdout(buffering=-1):
+    """stdout propio (mismo fd, buffer propio): con PYTHONUNBUFFERED sys.stdout haría un write por línea."""
+    try:
+        return open(sys.stdout.fileno(), "w", encoding="utf-8", buffering=buffering, closefd=False)
+    except (AttributeError, OSError, ValueError):
+        return sys.stdout
+
+
+def mensaje(record):
+    """La plantilla del evento con sus campos (en el hilo escritor, no en el que loguea)."""
+    campos = getattr(record, "campos", None)
+    if campos is None:
+        return record.getMessage()
+    try:
+        return record.msg.format_map(campos)
+    except (KeyError, IndexError, ValueError, AttributeError):
+        return record.msg
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por evento: ts, nivel, proceso, evento, msg y los campos."""
+    def __init__(self, proceso):
+        super().__init__()
+        self.proceso = proceso
+        self._ultimo = None     # RotatingFileHandler formatea dos veces el mismo record
+        self._linea = None
+
+    def format(self, record):
+        if record is self._ultimo:
+            return self._linea
+        datos = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "nivel": record.levelname,
+            "proceso": self.proceso,
+            "evento": getattr(record, "evento", record.name),
+            "msg": mensaje(record),
+        }
+        for clave, valor in (getattr(record, "campos", None) or {}).items():
+            # un campo nunca pisa ts / nivel / proceso / evento / msg
+            datos.setdefault(clave, valor)
+        muestreo = getattr(record, "muestreo", 1)
+        if muestreo > 1:
+            datos["muestreo"] = muestreo
+        if record.exc_info:
+            datos["traza"] = self.formatException(record.exc_info)
+        self._ultimo = record
+        self._linea = json.dumps(datos, ensure_ascii=False, default=str)
+        return self._linea
+
+
+class FormatoTexto(logging.Formatter):
+    """'[PROXY] Emparejado Admin A1 <-> Cliente 7', como los print de antes."""
+    def __init__(self, etiqueta):
+        super().__init__()
+        self.etiqueta = etiqueta
+
+    def format(self, record):
+        linea = f"[{self.etiqueta}] {mensaje(record)}"
+        if record.exc_info:
+            linea += "\n" + self.formatException(record.exc_info)
+        return linea
+
+
+class _FlushDiferido:
+    """Con `diferido` el flush lo hace el escritor al vaciar la cola, no cada línea."""
+    diferido = False
+
+    def flush(self):
+        if not self.diferido:
+            super().flush()
+
+    def vaciar(self):
+        super().flush()
+
+
+class _Salida(_FlushDiferido, logging.StreamHandler):
+    pass
+
+
+class _Archivo(_FlushDiferido, logging.handlers.RotatingFileHandler):
+    pass
+
+
+class _Cola(logging.handlers.QueueHandler):
+    """QueueHandler que nunca bloquea ni formatea: si la cola está llena, cuenta y descarta."""
+    def __init__(self, cola):
+        super().__init__(cola)
+        self.descartados = 0
+
+    def prepare(self, record):
+        # el record no sale del proceso: el formato se hace en el escritor
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+class _Escritor(logging.handlers.QueueListener):
+    """QueueListener que además revisa el archivo de control y hace flush al vaciar la cola."""
+    def __init__(self, cola, handlers, bitacora):
+        super().__init__(cola, *handlers)
+        self.bitacora = bitacora
+        self.proximo_control = 0.0
+
+    def dequeue(self, block):
+        while True:
+            ahora = time.monotonic()
+            if ahora >= self.proximo_control:
+                self.proximo_control = ahora + INTERVALO_CONTROL
+                self.bitacora.revisar_control()
+            try:
+                return self.queue.get(timeout=INTERVALO_CONTROL)
+            except queue.Empty:
+                pass
+
+    def handle(self, record):
+        super().handle(record)
+        if self.queue.empty():
+            for handler in self.handlers:
+                handler.vaciar()
+
+    def enqueue_sentinel(self):
+        # con la cola llena put_nowait fallaría: se espera a que el escritor haga lugar
+        self.queue.put(self._sentinel)
+
+
+class Bitacora:
+    """
+    Log de eventos del proceso (hay una sola, `log`). debug/info/warning/
+    error(evento, plantilla, **campos): el nivel y el muestreo se deciden
+    acá, antes de crear el record, así lo que no se escribe casi no cuesta.
+    El muestreo escribe el primero y después uno de cada N de ese evento,
+    con "muestreo": N en la línea para poder reescalar.
+
+    configurar() arma las salidas del proceso: stdout (json o texto) y, con
+    `directorio`, <directorio>/<proceso>.log en JSON con rotación.
+    arrancar() las pasa al hilo escritor; cerrar() escribe lo pendiente y
+    vuelve a escribir sincrónico.
+    """
+    def __init__(self):
+        self.logger = logging.getLogger(NOMBRE_LOGGER)
+        self.logger.setLevel(logging.DEBUG)     # el nivel lo filtra la bitácora
+        self.logger.propagate = False
+        self.proceso = NOMBRE_LOGGER
+        self.nivel = logging.INFO
+        self.muestreo = {}          # evento -> N
+        self.contadores = {}        # evento -> eventos vistos (muestreados o no)
+        self.base = (self.nivel, self.muestreo)     # de la línea de comandos
+        self.control = None
+        self.control_mtime = None
+        self.handlers = []
+        self.cola = None
+        self.escritor = None
+        self._descartados = 0
+        self._poner(_Salida(abrir_stdout()), FormatoTexto("TURNOS"))
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._despues_de_fork)
+
+    @property
+    def descartados(self):
+        return self._descartados + (self.cola.descartados if self.cola is not None else 0)
+
+    def _poner(self, handler, formato):
+        handler.setFormatter(formato)
+        self.handlers.append(handler)
+        self.logger.addHandler(handler)
+
+    def configurar(self, proceso, etiqueta=None, nivel="INFO", formato="json", muestreo=None, directorio=None,
+                   control=None):
+        if self.escritor is not None:
+            self.cerrar()
+        for handler in self.handlers:
+            self.logger.removeHandler(handler)
+            handler.close()
+        self.handlers = []
+        self.proceso = proceso
+        self.base = (nivel_de(nivel), dict(muestreo or {}))
+        self.nivel, self.muestreo = self.base
+        self.contadores = {}
+        self.control = control
+        self.control_mtime = None
+
+        self._poner(_Salida(abrir_stdout(TAMANO_BUFFER)), FormatoJSON(proceso) if formato == "json" else FormatoTexto(etiqueta or proceso))
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+            archivo = _Archivo(os.path.join(directorio, f"{proceso}.log"), maxBytes=MAX_BYTES_ARCHIVO,
+                               backupCount=ARCHIVOS_ROTADOS, encoding="utf-8")
+            self._poner(archivo, FormatoJSON(proceso))
+
+    def arrancar(self):
+        """Desde acá se escribe en el hilo escritor (después de los fork de este proceso)."""
+        if self.escritor is not None:
+            return
+        for handler in self.handlers:
+            self.logger.removeHandler(handler)
+            handler.diferido = True
+        self.cola = _Cola(queue.Queue(MAX_PENDIENTES))
+        self.logger.addHandler(self.cola)
+        self.escritor = _Escritor(self.cola.queue, self.handlers, self)
+        self.escritor.start()
+
+    def cerrar(self):
+        """Espera a que el escritor escriba lo pendiente y vuelve a escribir sincrónico."""
+        if self.escritor is None:
+            return
+        self.logger.removeHandler(self.cola)
+        self.escritor.stop()
+        self.escritor = None
+        self._descartados += self.cola.descartados
+        self.cola = None
+        self._sincronico()
+        if self._descartados:
+            self.warning("log_descartado", "{descartados} eventos de log descartados (la salida no daba abasto)",
+                         descartados=self._descartados)
+
+    def _sincronico(self):
+        for handler in self.handlers:
+            handler.diferido = False
+            handler.vaciar()
+            self.logger.addHandler(handler)
+
+    def _despues_de_fork(self):
+        # en el hijo no hay hilo escritor: se vuelve a sincrónico (lo encolado queda para el padre)
+        if self.escritor is None:
+            return
+        self.logger.removeHandler(self.cola)
+        self.escritor = None
+        self.cola = None
+        self._sincronico()
+
+    # --- Eventos ---
+
+    def _log(self, nivel, evento, plantilla, campos, exc_info=None):
+        if nivel < self.nivel:
+            return
+        if exc_info is True:
+            exc_info = sys.exc_info()
+        n = self.muestreo.get(evento, 1)
+        if n > 1:
+            visto = self.contadores.get(evento, 0)
+            self.contadores[evento] = visto + 1
+            if visto % n:
+                return
+        record = logging.LogRecord(NOMBRE_LOGGER, nivel, "", 0, plantilla, None, exc_info)
+        record.evento = evento
+        record.campos = campos
+        record.muestreo = n
+        self.logger.handle(record)
+
+    def debug(self, evento, plantilla, /, **campos):
+        self._log(logging.DEBUG, evento, plantilla, campos)
+
+    def info(self, evento, plantilla, /, **campos):
+        self._log(logging.INFO, evento, plantilla, campos)
+
+    def warning(self, evento, plantilla, /, **campos):
+        self._log(logging.WARNING, evento, plantilla, campos)
+
+    def error(self, evento, plantilla, /, exc_info=None, **campos):
+        self._log(logging.ERROR, evento, plantilla, campos, exc_info)
+
+    # --- Control en caliente ---
+
+    def revisar_control(self):
+        """En el hilo escritor: si cambió el archivo de control, aplica su nivel y muestreo."""
+        if not self.control:
+            return
+        try:
+            mtime = os.stat(self.control).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self.control_mtime:
+            return
+        self.control_mtime = mtime
+        nivel, muestreo = self.base
+        if mtime is not None:
+            try:
+                with open(self.control) as f:
+                    datos = json.load(f)
+                if "nivel" in datos:
+                    nivel = nivel_de(datos["nivel"])
+                if "muestreo" in datos:
+                    muestreo = {str(e): max(1, int(n)) for e, n in datos["muestreo"].items()}
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                self.warning("log_control_invalido", "Archivo de control de log ilegible ({archivo}): {error}",
+                             archivo=self.control, error=str(e))
+                return
+        self.nivel = nivel
+        self.muestreo = muestreo
+        self.warning("log_control", "Log: nivel {nivel_log}, muestreo {muestreo}",
+                     nivel_log=logging.getLevelName(nivel), muestreo=muestreo)
+
+
+log = Bitacora()
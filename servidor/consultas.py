@@ -0,0 +1,279 @@
+# servidor/consultas.py
+"""
+Consultas de lectura sobre turnos_atendidos y mensajes: sesiones y tiempo de
+atención promedio por admin, por trámite y por ventana de tiempo, y búsqueda
+de texto en los transcripts.
+
+Todo corre sobre una conexión de solo lectura (mode=ro + query_only): con la
+DB en WAL los lectores ven el último commit sin bloquear al DB Worker ni
+quedar bloqueados por él.
+
+Uso:
+    python3 servidor/consultas.py admins --desde "2026-10-01" --hasta "2026-10-02"
+    python3 servidor/consultas.py tramites --json
+    python3 servidor/consultas.py ventanas --por hora
+    python3 servidor/consultas.py buscar "transferencia rechazada"
+    python3 servidor/consultas.py crear-fts           # una vez; escribe en la DB
+    python3 servidor/consultas.py servir --port 9200  # GET /admins, /tramites, /ventanas, /buscar?q=
+"""
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from db import DB_PATH, crear_fts
+
+# Largo del prefijo de timestamp ("YYYY-MM-DD HH:MM:SS") que define cada ventana
+VENTANAS = {"minuto": 16, "hora": 13, "dia": 10}
+
+LIMITE_BUSQUEDA = 50
+
+# Columnas comunes de los reportes agrupados
+AGREGADOS = """
+    COUNT(*) AS sesiones,
+    ROUND(AVG(duracion_s), 3) AS atencion_prom_s,
+    SUM(mensajes) AS mensajes,
+    MIN(timestamp) AS primera,
+    MAX(timestamp) AS ultima
+"""
+
+
+def abrir_lectura(path=DB_PATH):
+    """Conexión de solo lectura (no crea la DB si no existe: sqlite3.OperationalError)."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.execute("PRAGMA query_only=ON")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _filtro_tiempo(desde, hasta):
+    """WHERE sobre timestamp (índice idx_turnos_timestamp); hasta es exclusivo."""
+    condiciones = []
+    params = []
+    if desde:
+        condiciones.append("timestamp >= ?")
+        params.append(desde)
+    if hasta:
+        condiciones.append("timestamp < ?")
+        params.append(hasta)
+    where = "WHERE " + " AND ".join(condiciones) if condiciones else ""
+    return where, params
+
+
+def _filas(cursor):
+    return [dict(fila) for fila in cursor]
+
+
+def por_admin(conn, desde=None, hasta=None):
+    """Sesiones, atención promedio y mensajes por admin en [desde, hasta)."""
+    where, params = _filtro_tiempo(desde, hasta)
+    return _filas(conn.execute(f"""
+        SELECT admin_id, {AGREGADOS}
+        FROM turnos_atendidos {where}
+        GROUP BY admin_id
+        ORDER BY sesiones DESC, admin_id
+    """, params))
+
+
+def por_tramite(conn, desde=None, hasta=None):
+    """Sesiones, atención promedio y mensajes por trámite en [desde, hasta)."""
+    where, params = _filtro_tiempo(desde, hasta)
+    return _filas(conn.execute(f"""
+        SELECT tramite, {AGREGADOS}
+        FROM turnos_atendidos {where}
+        GROUP BY tramite
+        ORDER BY sesiones DESC, tramite
+    """, params))
+
+
+def por_ventana(conn, por="hora", desde=None, hasta=None):
+    """Sesiones por ventana de tiempo (minuto, hora o dia) en [desde, hasta)."""
+    if por not in VENTANAS:
+        raise ValueError(f"ventana desconocida: {por} (opciones: {', '.join(VENTANAS)})")
+    where, params = _filtro_tiempo(desde, hasta)
+    return _filas(conn.execute(f"""
+        SELECT substr(timestamp, 1, {VENTANAS[por]}) AS ventana, {AGREGADOS}
+        FROM turnos_atendidos {where}
+        GROUP BY ventana
+        ORDER BY ventana
+    """, params))
+
+
+def tiene_fts(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'mensajes_fts'"
+    ).fetchone() is not None
+
+
+def buscar(conn, texto, limite=LIMITE_BUSQUEDA):
+    """
+    Mensajes que contienen `texto`, con su sesión y turno. Usa el índice FTS5
+    si existe (ordenado por relevancia); si no, cae a un LIKE que recorre
+    toda la tabla mensajes. En FTS5 el texto va como una frase entre
+    comillas: lo que escribe el usuario ("50%", "a OR") no es sintaxis MATCH.
+    """
+    if tiene_fts(conn):
+        sql = """
+            SELECT m.sesion_id, m.seq, m.timestamp, m.emisor,
+                   snippet(mensajes_fts, 0, '[', ']', '...', 12) AS texto,
+                   t.admin_id, t.cliente_id, t.tramite
+            FROM mensajes_fts
+            JOIN mensajes m ON m.rowid = mensajes_fts.rowid
+            LEFT JOIN turnos_atendidos t ON t.sesion_id = m.sesion_id
+            WHERE mensajes_fts MATCH ?
+            ORDER BY mensajes_fts.rank
+            LIMIT ?
+        """
+        params = ('"' + texto.replace('"', '""') + '"', limite)
+    else:
+        sql = """
+            SELECT m.sesion_id, m.seq, m.timestamp, m.emisor, m.texto,
+                   t.admin_id, t.cliente_id, t.tramite
+            FROM mensajes m
+            LEFT JOIN turnos_atendidos t ON t.sesion_id = m.sesion_id
+            WHERE m.texto LIKE ? ESCAPE '\\'
+            ORDER BY m.timestamp DESC
+            LIMIT ?
+        """
+        patron = texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params = (f"%{patron}%", limite)
+    return _filas(conn.execute(sql, params))
+
+
+def consultar(conn, reporte, parametros):
+    """Despacha un reporte por nombre (lo usan el CLI y el HTTP)."""
+    desde = parametros.get("desde")
+    hasta = parametros.get("hasta")
+    if reporte == "admins":
+        return por_admin(conn, desde, hasta)
+    if reporte == "tramites":
+        return por_tramite(conn, desde, hasta)
+    if reporte == "ventanas":
+        return por_ventana(conn, parametros.get("por") or "hora", desde, hasta)
+    if reporte == "buscar":
+        if not parametros.get("q"):
+            raise ValueError("falta el texto a buscar (q)")
+        return buscar(conn, parametros["q"], int(parametros.get("limite") or LIMITE_BUSQUEDA))
+    raise KeyError(reporte)
+
+
+def servir_consultas(path, host, port):
+    """Servidor HTTP con GET /<reporte>?desde=&hasta=&por=&q= que responde JSON."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            parametros = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                # una conexión por pedido: sqlite3 no comparte conexiones entre hilos
+                conn = abrir_lectura(path)
+                try:
+                    filas = consultar(conn, url.path.strip("/"), parametros)
+                finally:
+                    conn.close()
+            except KeyError:
+                self.send_error(404)
+                return
+            except (ValueError, sqlite3.Error) as e:
+                self.send_error(400, str(e))
+                return
+            cuerpo = json.dumps(filas, ensure_ascii=False).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer((host, port), Handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="consultas-http", daemon=True).start()
+    return servidor
+
+
+def imprimir_tabla(filas):
+    if not filas:
+        print("(sin resultados)")
+        return
+    columnas = list(filas[0])
+    valores = [["" if f[c] is None else str(f[c]) for c in columnas] for f in filas]
+    anchos = [max(len(c), *(len(v[i]) for v in valores)) for i, c in enumerate(columnas)]
+    print("  ".join(c.ljust(a) for c, a in zip(columnas, anchos)))
+    for v in valores:
+        print("  ".join(x.ljust(a) for x, a in zip(v, anchos)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reportes sobre los turnos atendidos (solo lectura)")
+    parser.add_argument("--db", default=DB_PATH)
+    sub = parser.add_subparsers(dest="reporte", required=True)
+
+    for nombre, ayuda in (("admins", "sesiones por admin"), ("tramites", "sesiones por trámite"),
+                          ("ventanas", "sesiones por ventana de tiempo")):
+        p = sub.add_parser(nombre, help=ayuda)
+        p.add_argument("--desde", help="timestamp inicial, ej. 2026-10-01 o '2026-10-01 09:00'")
+        p.add_argument("--hasta", help="timestamp final (exclusivo)")
+        p.add_argument("--json", action="store_true")
+        if nombre == "ventanas":
+            p.add_argument("--por", choices=list(VENTANAS), default="hora")
+
+    p = sub.add_parser("buscar", help="busca texto en los transcripts")
+    p.add_argument("q")
+    p.add_argument("--limite", type=int, default=LIMITE_BUSQUEDA)
+    p.add_argument("--json", action="store_true")
+
+    sub.add_parser("crear-fts", help="crea el índice FTS5 de mensajes (escribe en la DB)")
+
+    p = sub.add_parser("servir", help="endpoint HTTP con los reportes en JSON")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=9200)
+    args = parser.parse_args()
+
+    if args.reporte == "crear-fts":
+        conn = sqlite3.connect(args.db)
+        try:
+            if not crear_fts(conn):
+                sys.exit("Este SQLite no tiene FTS5: buscar usa LIKE")
+        finally:
+            conn.close()
+        print("Índice FTS5 de mensajes creado")
+        return
+
+    if args.reporte == "servir":
+        servidor = servir_consultas(args.db, args.host, args.port)
+        print(f"[CONSULTAS] http://{args.host}:{args.port}/{{admins,tramites,ventanas,buscar}}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            servidor.shutdown()
+        return
+
+    try:
+        conn = abrir_lectura(args.db)
+    except sqlite3.OperationalError as e:
+        sys.exit(f"No se pudo abrir {args.db}: {e}")
+    try:
+        filas = consultar(conn, args.reporte, vars(args))
+    except (ValueError, sqlite3.Error) as e:
+        sys.exit(f"Error: {e}")
+    finally:
+        conn.close()
+
+    if args.json:
+        print(json.dumps(filas, ensure_ascii=False, indent=2))
+    else:
+        imprimir_tabla(filas)
+
+
+if __name__ == "__main__":
+    main()
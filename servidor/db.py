@@ -3,19 +3,86 @@ import sqlite3
 from datetime import datetime
 
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))          
-PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, ".."))    
-DATA_DIR = os.path.join(PROJECT_ROOT, "data")
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, ".."))
+DATA_DIR = os.environ.get("TURNOS_DATA_DIR", os.path.join(PROJECT_ROOT, "data"))
 
 
 DB_PATH = os.path.join(DATA_DIR, "turnos.db")
 
+# Pragmas para el writer de larga vida:
+# - WAL: los commits no reescriben la DB, solo agregan al log
+# - synchronous=NORMAL: en WAL solo hace fsync en los checkpoints
+PRAGMAS_WRITER = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
 
-def inicializar_db():
-    # Asegura que exista /data
+INSERT_TURNO = """
+    INSERT INTO turnos_atendidos
+        (cliente_id, nombre, tramite, prioridad, admin_id, timestamp, conversacion, sesion_id, mensajes, duracion_s,
+         espera_s)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_MENSAJE = """
+    INSERT OR IGNORE INTO mensajes (sesion_id, seq, timestamp, emisor, texto)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+# Columnas agregadas después de la primera versión de turnos_atendidos
+# (las DBs viejas se migran con ALTER TABLE en inicializar_db)
+COLUMNAS_NUEVAS = (
+    ("sesion_id", "TEXT"),
+    ("mensajes", "INTEGER NOT NULL DEFAULT 0"),
+    ("duracion_s", "REAL"),   # emparejamiento -> fin de la sesión (NULL en filas viejas)
+    ("espera_s", "REAL"),     # hello del cliente -> emparejamiento (NULL en filas viejas)
+)
+
+# Índices para las consultas de servidor/consultas.py (reportes por admin,
+# por trámite y por ventana de tiempo, y de un mensaje a su turno).
+# timestamp es TEXT "YYYY-MM-DD HH:MM:SS", así que los rangos usan el índice.
+INDICES = (
+    "CREATE INDEX IF NOT EXISTS idx_turnos_admin ON turnos_atendidos (admin_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_turnos_tramite ON turnos_atendidos (tramite, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_turnos_timestamp ON turnos_atendidos (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_turnos_sesion ON turnos_atendidos (sesion_id)",
+)
+
+# Búsqueda de texto en los transcripts (opcional, ver crear_fts): tabla FTS5
+# con contenido externo sobre mensajes, mantenida por un trigger de INSERT.
+FTS_MENSAJES = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS mensajes_fts
+        USING fts5(texto, content='mensajes', content_rowid='rowid')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS mensajes_fts_insert AFTER INSERT ON mensajes BEGIN
+        INSERT INTO mensajes_fts (rowid, texto) VALUES (new.rowid, new.texto);
+    END
+    """,
+)
+
+
+def abrir_conexion():
+    """Abre una conexión pensada para reutilizarse (un solo writer por proceso)."""
     os.makedirs(DATA_DIR, exist_ok=True)
 
     conn = sqlite3.connect(DB_PATH)
+    for pragma in PRAGMAS_WRITER:
+        conn.execute(pragma)
+    return conn
+
+
+def inicializar_db(conn=None):
+    # Asegura que exista /data
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+    propia = conn is None
+    if propia:
+        conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     c.execute("""
         CREATE TABLE IF NOT EXISTS turnos_atendidos (
@@ -29,19 +96,75 @@ def inicializar_db():
             conversacion TEXT
         )
     """)
+    existentes = {fila[1] for fila in c.execute("PRAGMA table_info(turnos_atendidos)")}
+    for nombre, tipo in COLUMNAS_NUEVAS:
+        if nombre not in existentes:
+            c.execute(f"ALTER TABLE turnos_atendidos ADD COLUMN {nombre} {tipo}")
+
+    # Transcript normalizado: una fila por mensaje relayado.
+    # turnos_atendidos.conversacion queda solo para filas anteriores.
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS mensajes (
+            sesion_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            timestamp TEXT NOT NULL,
+            emisor TEXT NOT NULL,
+            texto TEXT NOT NULL,
+            PRIMARY KEY (sesion_id, seq)
+        )
+    """)
+    for indice in INDICES:
+        c.execute(indice)
     conn.commit()
-    conn.close()
+    if propia:
+        conn.close()
 
 
-def guardar_turno(cliente_id, nombre, tramite, prioridad, admin_id, conversacion=None):
-    os.makedirs(DATA_DIR, exist_ok=True)
+def crear_fts(conn):
+    """
+    Crea el índice FTS5 de mensajes (con su trigger) y lo llena con lo que ya
+    haya. Devuelve False si este SQLite no tiene FTS5. Una vez creado, el DB
+    Worker lo mantiene solo: el trigger corre en cada INSERT de mensajes.
+    """
+    try:
+        with conn:
+            for sql in FTS_MENSAJES:
+                conn.execute(sql)
+            conn.execute("INSERT INTO mensajes_fts (mensajes_fts) VALUES ('rebuild')")
+    except sqlite3.OperationalError as e:
+        if "fts5" in str(e):
+            return False
+        raise
+    return True
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+
+def fila_turno(cliente_id, nombre, tramite, prioridad, admin_id, conversacion=None, sesion_id=None, mensajes=0,
+               duracion_s=None, espera_s=None):
+    """Arma la tupla para INSERT_TURNO (mismo orden de columnas)."""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    c.execute("""
-        INSERT INTO turnos_atendidos (cliente_id, nombre, tramite, prioridad, admin_id, timestamp, conversacion)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (cliente_id, nombre, tramite, prioridad, admin_id, timestamp, conversacion))
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    return (cliente_id, nombre, tramite, prioridad, admin_id, timestamp, conversacion, sesion_id, mensajes, duracion_s,
+            espera_s)
+
+
+def filas_mensajes(sesion_id, filas):
+    """
+    [(seq, ts_epoch, emisor, texto), ...] -> tuplas para INSERT_MENSAJE.
+    El proxy manda el texto como bytes (tal cual se relayó): se decodifica acá.
+    """
+    return [
+        (sesion_id, seq, datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S"), emisor,
+         texto.decode(errors="ignore") if isinstance(texto, bytes) else texto)
+        for seq, ts, emisor, texto in filas
+    ]
+
+
+def guardar_turnos(conn, filas, mensajes=()):
+    """
+    Inserta un lote de filas (ver fila_turno) y de mensajes (ver filas_mensajes)
+    en una sola transacción.
+    """
+    with conn:
+        if mensajes:
+            conn.executemany(INSERT_MENSAJE, mensajes)
+        if filas:
+            conn.executemany(INSERT_TURNO, filas)
@@ -1,24 +1,187 @@
 import os
 import sys
+import time
+import queue
+import signal
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 if BASE_DIR not in sys.path:
     sys.path.insert(0, BASE_DIR)
 
-from db import inicializar_db, guardar_turno
+from metricas import Registro, INTERVALO_VOLCADO, tamano_cola
+from bitacora import log
+from db import abrir_conexion, inicializar_db, fila_turno, filas_mensajes, guardar_turnos, INSERT_TURNO, INSERT_MENSAJE
 
 
-def run_db_worker(db_queue):
+class TurnoBatchWriter:
+    """
+    Writer con group commit sobre una conexión de larga vida:
+    - escribir(items) inserta todo el lote con executemany en una transacción
+    - si el lote falla, reintenta fila por fila para aislar la fila mala
+    - lleva estadísticas (filas/s, tamaño de lotes) y las reporta cada stats_interval
+
+    Los items son turnos cerrados (dict para fila_turno) o tramos de transcript
+    {"tipo": "mensajes", "sesion_id", "filas"} que van a la tabla mensajes.
+    """
+    def __init__(self, conn, stats_interval=10.0, metricas=None):
+        self.conn = conn
+        self.stats_interval = stats_interval
+
+        self.metricas = metricas if metricas is not None else Registro({"proceso": "db"})
+        self.latencia_commit = self.metricas.histograma(
+            "turnos_db_commit_segundos", "Duración de cada transacción de lote")
+        self.metricas.valor("turnos_db_filas_total", "Filas escritas por tabla", lambda: {
+            "turnos_atendidos": self.filas_total, "mensajes": self.mensajes_total,
+        }, tipo="counter", etiqueta="tabla")
+        self.metricas.valor("turnos_db_lotes_total", "Lotes escritos", lambda: self.lotes_total, tipo="counter")
+
+        self.filas_total = 0
+        self.mensajes_total = 0
+        self.lotes_total = 0
+        self.lote_max = 0
+
+        self._t_reporte = time.monotonic()
+        self._filas_intervalo = 0
+        self._mensajes_intervalo = 0
+        self._lotes_intervalo = 0
+        self._lote_max_intervalo = 0
+
+    def escribir(self, items):
+        filas = []
+        mensajes = []
+        for item in items:
+            try:
+                if item.get("tipo") == "mensajes":
+                    mensajes.extend(filas_mensajes(item["sesion_id"], item["filas"]))
+                else:
+                    filas.append(fila_turno(**item))
+            except Exception as e:
+                log.warning("db_item_invalido", "Item inválido descartado: {error}", error=str(e))
+
+        if filas or mensajes:
+            t0 = time.perf_counter()
+            try:
+                guardar_turnos(self.conn, filas, mensajes)
+                escritas = len(filas)
+                escritos = len(mensajes)
+                self.latencia_commit.observar(time.perf_counter() - t0)
+            except Exception as e:
+                log.error("db_lote_fallido", "Error guardando lote de {turnos} turnos y {mensajes} mensajes: {error}",
+                          turnos=len(filas), mensajes=len(mensajes), error=str(e))
+                escritos = self._escribir_de_a_una(INSERT_MENSAJE, mensajes)
+                escritas = self._escribir_de_a_una(INSERT_TURNO, filas)
+
+            self.filas_total += escritas
+            self.mensajes_total += escritos
+            self.lotes_total += 1
+            lote = len(filas) + len(mensajes)
+            self.lote_max = max(self.lote_max, lote)
+            self._lote_max_intervalo = max(self._lote_max_intervalo, lote)
+            self._filas_intervalo += escritas
+            self._mensajes_intervalo += escritos
+            self._lotes_intervalo += 1
+
+        if time.monotonic() - self._t_reporte >= self.stats_interval:
+            self.reportar()
+
+    def _escribir_de_a_una(self, sql, filas):
+        escritas = 0
+        for fila in filas:
+            try:
+                with self.conn:
+                    self.conn.execute(sql, fila)
+                escritas += 1
+            except Exception as e:
+                log.error("db_fila_fallida", "Error guardando fila: {error}", error=str(e))
+        return escritas
+
+    def reportar(self):
+        ahora = time.monotonic()
+        dt = ahora - self._t_reporte
+        if self._lotes_intervalo:
+            total = self._filas_intervalo + self._mensajes_intervalo
+            log.info("db_estadisticas",
+                     "{turnos} turnos + {mensajes} mensajes en {segundos:.1f}s ({filas_s:.1f} filas/s), "
+                     "lotes={lotes} (prom {promedio:.1f}, max {lote_max})",
+                     turnos=self._filas_intervalo, mensajes=self._mensajes_intervalo, segundos=dt,
+                     filas_s=total / dt, lotes=self._lotes_intervalo, promedio=total / self._lotes_intervalo,
+                     lote_max=self._lote_max_intervalo)
+        self._t_reporte = ahora
+        self._filas_intervalo = 0
+        self._mensajes_intervalo = 0
+        self._lotes_intervalo = 0
+        self._lote_max_intervalo = 0
+
+    def cerrar(self):
+        self.reportar()
+        log.info("db_total", "Total: {turnos} turnos y {mensajes} mensajes en {lotes} lotes (max {lote_max})",
+                 turnos=self.filas_total, mensajes=self.mensajes_total, lotes=self.lotes_total,
+                 lote_max=self.lote_max)
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+def juntar_lote(db_queue, primero, batch_size, max_latency):
+    """
+    Arma un lote a partir de `primero`: sigue drenando la cola hasta llenar
+    batch_size o hasta que pasen max_latency segundos desde el primer item.
+    Devuelve (lote, fin) donde fin indica que llegó el centinela None.
+    """
+    lote = [primero]
+    limite = time.monotonic() + max_latency
+    while len(lote) < batch_size:
+        restante = limite - time.monotonic()
+        try:
+            if restante > 0:
+                item = db_queue.get(timeout=restante)
+            else:
+                item = db_queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is None:
+            return lote, True
+        lote.append(item)
+    return lote, False
+
+
+def run_db_worker(db_queue, batch_size=500, max_latency=0.05, stats_interval=10.0, metricas_dir=None,
+                  opciones_log=None):
     """
     Proceso dedicado: lee tareas desde db_queue y escribe en SQLite.
     IPC real: multiprocessing.Queue
+
+    Escribe por lotes (group commit): un commit cada batch_size filas o cada
+    max_latency segundos, lo que ocurra primero. Con None hace flush y termina
+    (Ctrl+C se ignora: el proxy manda None después de la última sesión).
+    Con metricas_dir vuelca sus métricas ahí (ver metricas.Registro), y loguea
+    con opciones_log (ver bitacora.Bitacora.configurar).
     """
-    inicializar_db()
-    while True:
-        item = db_queue.get()
-        if item is None:  
-            break
-        try:
-            guardar_turno(**item)
-        except Exception as e:
-            print(f"[DB_WORKER] Error guardando turno: {e}")
\ No newline at end of file
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    log.configurar("db", etiqueta="DB_WORKER", **(opciones_log or {}))
+    log.arrancar()
+    conn = abrir_conexion()
+    inicializar_db(conn)
+    metricas = Registro({"proceso": "db"})
+    metricas.valor("turnos_db_backlog", "Items pendientes en q_to_db", lambda: tamano_cola(db_queue))
+    if metricas_dir:
+        metricas.exportar(metricas_dir, "db")
+    writer = TurnoBatchWriter(conn, stats_interval=stats_interval, metricas=metricas)
+
+    try:
+        while True:
+            metricas.volcar()
+            try:
+                item = db_queue.get(timeout=INTERVALO_VOLCADO)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            lote, fin = juntar_lote(db_queue, item, batch_size, max_latency)
+            writer.escribir(lote)
+            if fin:
+                break
+    finally:
+        writer.cerrar()
+        log.cerrar()
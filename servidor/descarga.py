@@ -0,0 +1,81 @@
+# servidor/descarga.py
+import socket
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from bitacora import log
+
+# Hilos del pool y trabajos en vuelo como máximo (pasado eso descargar()
+# devuelve False y el que llama decide: hacerlo ahí o salteárselo)
+HILOS_DESCARGA = 2
+MAX_EN_VUELO = 32
+
+
+class Descarga:
+    """
+    Trabajo bloqueante fuera del event loop del proxy: un ThreadPoolExecutor
+    acotado para lo que toca el disco, y un socketpair como despertador
+    seleccionable para sus terminaciones. (Los logs no pasan por acá: tienen
+    su propio hilo escritor, ver bitacora.py.)
+
+    Solo el loop llama a descargar() / completar(), así que el
+    estado no lleva locks. descargar(fn, *args, listo=None) manda fn(*args)
+    al pool; al terminar, el hilo deja el future en una deque y escribe un
+    byte en el socketpair. El motor registra fileno() en su selector (o con
+    add_reader) y completar() corre en el loop los listo(future).
+    """
+    def __init__(self, hilos=HILOS_DESCARGA, max_en_vuelo=MAX_EN_VUELO):
+        self.pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="descarga")
+        self.max_en_vuelo = max_en_vuelo
+        self.en_vuelo = 0
+        self.hechos = deque()       # (future, listo) terminados, los agrega el hilo del pool
+        self.rx, self.tx = socket.socketpair()
+        self.rx.setblocking(False)
+        self.tx.setblocking(False)
+        self.cerrada = False
+
+    def fileno(self):
+        return self.rx.fileno()
+
+    def descargar(self, fn, *args, listo=None):
+        """fn(*args) en el pool; False (sin mandarlo) si ya hay max_en_vuelo trabajos en vuelo."""
+        if self.cerrada or self.en_vuelo >= self.max_en_vuelo:
+            return False
+        self.en_vuelo += 1
+        self.pool.submit(fn, *args).add_done_callback(lambda futuro: self._terminado(futuro, listo))
+        return True
+
+    def _terminado(self, futuro, listo):
+        # en el hilo del pool: primero la deque, después el despertador
+        self.hechos.append((futuro, listo))
+        try:
+            self.tx.send(b"\0")
+        except OSError:
+            # buffer lleno: el loop ya tiene despertares pendientes
+            pass
+
+    def completar(self):
+        """En el loop, cuando fileno() está listo: corre los listo() de lo que terminó."""
+        try:
+            while self.rx.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self.hechos:
+            futuro, listo = self.hechos.popleft()
+            self.en_vuelo -= 1
+            error = futuro.exception()
+            if error is not None:
+                log.error("descarga_fallida", "Falló un trabajo en segundo plano: {error}", error=repr(error))
+            if listo is not None:
+                listo(futuro)
+
+    def cerrar(self):
+        """Espera lo que está en vuelo y corre sus listo()."""
+        if self.cerrada:
+            return
+        self.cerrada = True
+        self.pool.shutdown(wait=True)
+        self.completar()
+        self.rx.close()
+        self.tx.close()
@@ -0,0 +1,344 @@
+# servidor/ipc.py
+"""
+Eventos entre el proxy y Turnos como registros binarios de layout fijo.
+
+Cada registro empieza con el tipo (1 byte) y sigue con campos struct
+little-endian: cliente_id como u32 (los ids del proxy son números), trámites
+conocidos como un código de 1 byte (sys.intern implícito: el decoder devuelve
+siempre el mismo str), y el resto de los textos como u16 de largo + UTF-8.
+Un lote es la concatenación de registros precedida por su largo (u32) y
+viaja en un solo write por el fd de un multiprocessing.Pipe: sin pickle, sin
+thread alimentador ni lock de Queue, y un despertar del lector por lote en
+vez de por evento.
+
+Hacia afuera los eventos siguen siendo los mismos dicts
+({"type": "NEW_TURNO", ...}); codificar() / decodificar() traducen.
+"""
+import os
+import math
+import struct
+from multiprocessing import Pipe
+
+from bitacora import log
+
+# Trámites con código fijo (0 = texto a continuación)
+TRAMITES = ("pago", "reclamo", "consulta")
+_CODIGO_TRAMITE = {t: i + 1 for i, t in enumerate(TRAMITES)}
+
+FIN = 0
+NEW_TURNO = 1
+RESUME = 2
+CLIENTE_DESCONECTADO = 3
+ADMIN_READY = 4
+ADMIN_DISCONNECTED = 5
+ASSIGN = 6
+POSICIONES = 7
+REENCOLAR = 8
+TURNO_VENCIDO = 9
+
+_NOMBRES = {
+    NEW_TURNO: "NEW_TURNO", RESUME: "RESUME", CLIENTE_DESCONECTADO: "CLIENTE_DESCONECTADO",
+    ADMIN_READY: "ADMIN_READY", ADMIN_DISCONNECTED: "ADMIN_DISCONNECTED",
+    ASSIGN: "ASSIGN", POSICIONES: "POSICIONES", REENCOLAR: "REENCOLAR", TURNO_VENCIDO: "TURNO_VENCIDO",
+}
+
+_TIPO_WORKER_ID = struct.Struct("<BBI")      # NEW_TURNO / RESUME / CLIENTE_DESCONECTADO / TURNO_VENCIDO
+_TIPO_WORKER = struct.Struct("<BB")          # ADMIN_READY / ADMIN_DISCONNECTED
+_ASSIGN = struct.Struct("<BBIBId")           # tipo, admin_worker, cliente_id, prioridad, orden, clave (NaN = sin clave fija)
+_REENCOLAR = struct.Struct("<BBIBId")        # tipo, worker, cliente_id, prioridad, orden, clave
+_ATENCION = struct.Struct("<dBB")            # atencion_s (NaN = sin dato), capacidad (0 = libera un lugar), cantidad de skills
+_POSICIONES = struct.Struct("<BI")           # tipo, cantidad
+_POSICION = struct.Struct("<IIi")            # cliente_id, posición, espera (-1 = sin estimación)
+_LARGO = struct.Struct("<H")
+_U8 = struct.Struct("<B")
+_LARGO_LOTE = struct.Struct("<I")
+_FIN = _U8.pack(FIN)
+
+# Bytes por read() del lector (varios lotes si los hay)
+TAMANO_LECTURA = 256 * 1024
+
+
+def _texto(s):
+    b = s.encode()[:0xFFFF]
+    return _LARGO.pack(len(b)) + b
+
+
+def _tramite(t):
+    codigo = _CODIGO_TRAMITE.get(t)
+    if codigo:
+        return _U8.pack(codigo)
+    return b"\0" + _texto(t or "")
+
+
+def _cod_turno(tipo, evt):
+    return (_TIPO_WORKER_ID.pack(tipo, evt.get("worker", 0), int(evt["cliente_id"]))
+            + _tramite(evt["tramite"]) + _texto(evt["nombre"] or ""))
+
+
+def _cod_desconectado(tipo, evt):
+    return _TIPO_WORKER_ID.pack(tipo, evt.get("worker", 0), int(evt["cliente_id"]))
+
+
+def _cod_admin_ready(tipo, evt):
+    atencion = evt.get("atencion_s")
+    skills = evt.get("skills") or ()
+    datos = (_TIPO_WORKER.pack(tipo, evt.get("worker", 0)) + _texto(evt["admin_id"])
+             + _ATENCION.pack(math.nan if atencion is None else atencion, evt.get("capacidad", 0), len(skills)))
+    for t in skills:
+        datos += _tramite(t)
+    return datos
+
+
+def _cod_admin_disconnected(tipo, evt):
+    return _TIPO_WORKER.pack(tipo, evt.get("worker", 0)) + _texto(evt["admin_id"])
+
+
+def _primario(evt):
+    # la clave fija de politicas.py es (primario, orden); el orden ya viaja aparte
+    clave = evt.get("clave")
+    return math.nan if clave is None else clave[0]
+
+
+def _clave(evt, primario, orden):
+    if primario == primario:    # no NaN
+        evt["clave"] = (primario, orden)
+    return evt
+
+
+def _cod_assign(tipo, evt):
+    return (_ASSIGN.pack(tipo, evt.get("admin_worker", 0), int(evt["cliente_id"]), evt.get("prioridad", 0),
+                         evt.get("orden", 0), _primario(evt))
+            + _texto(evt["admin_id"]) + _tramite(evt["tramite"]) + _texto(evt["nombre"] or ""))
+
+
+def _cod_reencolar(tipo, evt):
+    return (_REENCOLAR.pack(tipo, evt.get("worker", 0), int(evt["cliente_id"]), evt["prioridad"], evt["orden"],
+                            _primario(evt))
+            + _tramite(evt["tramite"]) + _texto(evt["nombre"] or ""))
+
+
+def _cod_posiciones(tipo, evt):
+    posiciones = evt["posiciones"]
+    partes = [_POSICIONES.pack(tipo, len(posiciones))]
+    pack = _POSICION.pack
+    for cliente_id, posicion, espera in posiciones:
+        partes.append(pack(int(cliente_id), posicion, -1 if espera is None else espera))
+    return b"".join(partes)
+
+
+_CODIFICADORES = {
+    "NEW_TURNO": (NEW_TURNO, _cod_turno),
+    "RESUME": (RESUME, _cod_turno),
+    "CLIENTE_DESCONECTADO": (CLIENTE_DESCONECTADO, _cod_desconectado),
+    "ADMIN_READY": (ADMIN_READY, _cod_admin_ready),
+    "ADMIN_DISCONNECTED": (ADMIN_DISCONNECTED, _cod_admin_disconnected),
+    "ASSIGN": (ASSIGN, _cod_assign),
+    "POSICIONES": (POSICIONES, _cod_posiciones),
+    "REENCOLAR": (REENCOLAR, _cod_reencolar),
+    "TURNO_VENCIDO": (TURNO_VENCIDO, _cod_desconectado),
+}
+
+
+def codificar(evt):
+    """dict de evento (o None = FIN) -> bytes de un registro."""
+    if evt is None:
+        return _FIN
+    tipo, cod = _CODIFICADORES[evt["type"]]
+    return cod(tipo, evt)
+
+
+def _leer_texto(datos, i):
+    (n,) = _LARGO.unpack_from(datos, i)
+    i += 2
+    return str(datos[i:i + n], "utf-8", "replace"), i + n
+
+
+def _leer_tramite(datos, i):
+    codigo = datos[i]
+    if codigo:
+        return TRAMITES[codigo - 1], i + 1
+    return _leer_texto(datos, i + 1)
+
+
+def decodificar(datos):
+    """bytes de un lote -> lista de eventos (dicts; None para FIN)."""
+    eventos = []
+    i = 0
+    fin = len(datos)
+    while i < fin:
+        tipo = datos[i]
+        if tipo in (NEW_TURNO, RESUME):
+            _, worker, cliente_id = _TIPO_WORKER_ID.unpack_from(datos, i)
+            tramite, i = _leer_tramite(datos, i + _TIPO_WORKER_ID.size)
+            nombre, i = _leer_texto(datos, i)
+            eventos.append({"type": _NOMBRES[tipo], "cliente_id": str(cliente_id), "nombre": nombre,
+                            "tramite": tramite, "worker": worker})
+        elif tipo in (CLIENTE_DESCONECTADO, TURNO_VENCIDO):
+            _, worker, cliente_id = _TIPO_WORKER_ID.unpack_from(datos, i)
+            i += _TIPO_WORKER_ID.size
+            eventos.append({"type": _NOMBRES[tipo], "cliente_id": str(cliente_id), "worker": worker})
+        elif tipo == ADMIN_READY:
+            worker = datos[i + 1]
+            admin_id, i = _leer_texto(datos, i + _TIPO_WORKER.size)
+            atencion, capacidad, n = _ATENCION.unpack_from(datos, i)
+            i += _ATENCION.size
+            skills = []
+            for _ in range(n):
+                t, i = _leer_tramite(datos, i)
+                skills.append(t)
+            evt = {"type": "ADMIN_READY", "admin_id": admin_id, "worker": worker, "skills": skills}
+            if atencion == atencion:    # no NaN
+                evt["atencion_s"] = atencion
+            if capacidad:
+                evt["capacidad"] = capacidad
+            eventos.append(evt)
+        elif tipo == ADMIN_DISCONNECTED:
+            worker = datos[i + 1]
+            admin_id, i = _leer_texto(datos, i + _TIPO_WORKER.size)
+            eventos.append({"type": "ADMIN_DISCONNECTED", "admin_id": admin_id, "worker": worker})
+        elif tipo == ASSIGN:
+            _, admin_worker, cliente_id, prioridad, orden, primario = _ASSIGN.unpack_from(datos, i)
+            admin_id, i = _leer_texto(datos, i + _ASSIGN.size)
+            tramite, i = _leer_tramite(datos, i)
+            nombre, i = _leer_texto(datos, i)
+            eventos.append(_clave({"type": "ASSIGN", "admin_id": admin_id, "admin_worker": admin_worker,
+                                   "cliente_id": str(cliente_id), "nombre": nombre, "tramite": tramite,
+                                   "prioridad": prioridad, "orden": orden}, primario, orden))
+        elif tipo == REENCOLAR:
+            _, worker, cliente_id, prioridad, orden, primario = _REENCOLAR.unpack_from(datos, i)
+            tramite, i = _leer_tramite(datos, i + _REENCOLAR.size)
+            nombre, i = _leer_texto(datos, i)
+            eventos.append(_clave({"type": "REENCOLAR", "cliente_id": str(cliente_id), "nombre": nombre,
+                                   "tramite": tramite, "worker": worker, "prioridad": prioridad, "orden": orden},
+                                  primario, orden))
+        elif tipo == POSICIONES:
+            _, n = _POSICIONES.unpack_from(datos, i)
+            i += _POSICIONES.size
+            fin_pos = i + n * _POSICION.size
+            eventos.append({"type": "POSICIONES", "posiciones": [
+                (str(cliente_id), posicion, None if espera < 0 else espera)
+                for cliente_id, posicion, espera in _POSICION.iter_unpack(datos[i:fin_pos])
+            ]})
+            i = fin_pos
+        elif tipo == FIN:
+            eventos.append(None)
+            i += 1
+        else:
+            raise ValueError(f"registro IPC desconocido: tipo {tipo} en offset {i}")
+    return eventos
+
+
+class CanalEventos:
+    """
+    Extremo de escritura de un canal de eventos (un multiprocessing.Pipe del
+    que solo se usa el fd). put(evt) codifica y junta; flush() manda lo
+    juntado como un lote: u32 de largo + registros.
+
+    El dueño del loop llama flush() al final de cada vuelta, o asigna
+    `programar` (p. ej. loop.call_soon) y el primer put de cada lote agenda
+    el flush solo. Con bloqueante=False (el proxy) flush() nunca bloquea: si
+    el pipe está lleno lo que falta queda en `pendiente` para el próximo
+    flush(), así proxy y Turnos no pueden trabarse escribiéndose a la vez.
+    put(None) manda FIN al toque; cerrar() lo manda esperando lo pendiente y
+    deja el canal mudo: lo que se ponga después se descarta, se cuenta en
+    `descartados` y se loguea (en un reinicio en caliente el proceso viejo
+    sigue drenando sesiones con el Turnos ya detenido).
+    """
+    __slots__ = ("conn", "fd", "partes", "pendiente", "programar", "descartados")
+
+    def __init__(self, conn, bloqueante=True):
+        self.conn = conn            # se guarda para que no se cierre el fd
+        self.fd = conn.fileno()
+        self.partes = []
+        self.pendiente = bytearray()
+        self.programar = None
+        self.descartados = 0
+        os.set_blocking(self.fd, bloqueante)
+
+    def put(self, evt):
+        if self.fd < 0:
+            self.descartados += 1
+            log.info("evento_descartado", "Canal de eventos cerrado: se descarta {tipo}",
+                     tipo=evt["type"] if evt else "FIN")
+            return
+        if evt is None:
+            self.partes.append(codificar(None))
+            self.flush()
+            return
+        if not self.partes and self.programar is not None:
+            self.programar(self.flush)
+        self.partes.append(codificar(evt))
+
+    def flush(self):
+        if self.fd < 0:
+            return
+        if self.partes:
+            lote = b"".join(self.partes)
+            self.partes.clear()
+            self.pendiente += _LARGO_LOTE.pack(len(lote))
+            self.pendiente += lote
+        pendiente = self.pendiente
+        while pendiente:
+            try:
+                n = os.write(self.fd, pendiente)
+            except BlockingIOError:
+                return
+            except OSError:
+                # el lector ya no está (FIN mandado o proceso caído): no hay a quién entregarlo
+                pendiente.clear()
+                return
+            del pendiente[:n]
+
+    def cerrar(self):
+        """Manda lo juntado y FIN aunque tenga que esperar al lector."""
+        if self.fd < 0:
+            return
+        self.partes.append(_FIN)
+        os.set_blocking(self.fd, True)
+        self.flush()
+        self.fd = -1
+
+
+class LectorEventos:
+    """
+    Extremo de lectura de un canal de eventos. Tiene fileno(), así que sirve
+    para selectors / add_reader / multiprocessing.connection.wait. leer()
+    hace un solo read (no bloquea si el fd está listo) y devuelve los eventos
+    de los lotes completos; EOFError si el otro lado cerró.
+    """
+    __slots__ = ("conn", "fd", "buf")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.fd = conn.fileno()
+        self.buf = bytearray()
+
+    def fileno(self):
+        return self.fd
+
+    def leer(self):
+        try:
+            datos = os.read(self.fd, TAMANO_LECTURA)
+        except BlockingIOError:
+            return []
+        if not datos:
+            raise EOFError
+        buf = self.buf
+        buf += datos
+        eventos = []
+        i = 0
+        while len(buf) - i >= _LARGO_LOTE.size:
+            (n,) = _LARGO_LOTE.unpack_from(buf, i)
+            if len(buf) - i - _LARGO_LOTE.size < n:
+                break
+            i += _LARGO_LOTE.size
+            eventos += decodificar(bytes(buf[i:i + n]))
+            i += n
+        del buf[:i]
+        return eventos
+
+
+def canal_eventos():
+    """(LectorEventos, multiprocessing Connection de escritura): el escritor arma su CanalEventos en su proceso."""
+    rx, tx = Pipe(duplex=False)
+    return LectorEventos(rx), tx
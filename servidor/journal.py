@@ -0,0 +1,186 @@
+# servidor/journal.py
+import os
+import json
+import time
+import hmac
+import secrets
+import hashlib
+
+from bitacora import log
+
+# Archivos dentro del directorio de datos (el mismo de turnos.db)
+JOURNAL = "turnos.journal"
+SNAPSHOT = "turnos.snapshot"
+CLAVE = "turnos.key"
+
+# Cada cuántas operaciones se reescribe el snapshot y se vacía el journal
+COMPACTAR_CADA = 10000
+# fsync del journal como mucho una vez por este intervalo (segundos)
+INTERVALO_FSYNC = 1.0
+
+
+class EstadoCola:
+    """Lo que se recupera del disco: turnos en espera y contadores."""
+    def __init__(self):
+        self.turnos = {}            # cliente_id -> registro (ver JournalTurnos.push)
+        self.llegadas = 0           # último orden de llegada usado
+        self.ultimo_cliente_id = 0  # mayor cliente_id numérico emitido
+
+    def aplicar(self, reg):
+        op = reg["op"]
+        if op == "push":
+            self.turnos[reg["c"]] = reg
+            self.llegadas = max(self.llegadas, reg["o"])
+            if reg["c"].isdigit():
+                self.ultimo_cliente_id = max(self.ultimo_cliente_id, int(reg["c"]))
+        elif op == "pop":
+            self.turnos.pop(reg["c"], None)
+        elif op == "age":
+            turno = self.turnos.get(reg["c"])
+            if turno is not None:
+                turno["p"] = reg["p"]
+
+
+def cargar_estado(directorio):
+    """
+    Snapshot + journal -> EstadoCola. Reaplicar es idempotente (push pisa,
+    pop de algo que no está se ignora), así que no importa si el proceso se
+    cortó entre escribir el snapshot y vaciar el journal.
+    """
+    estado = EstadoCola()
+    try:
+        with open(os.path.join(directorio, SNAPSHOT)) as f:
+            snap = json.load(f)
+        estado.llegadas = snap["llegadas"]
+        estado.ultimo_cliente_id = snap["ultimo_cliente_id"]
+        for reg in snap["turnos"]:
+            estado.turnos[reg["c"]] = reg
+    except FileNotFoundError:
+        pass
+    except (ValueError, KeyError) as e:
+        log.warning("snapshot_ilegible", "Snapshot ilegible, se ignora: {error}", error=str(e))
+
+    try:
+        with open(os.path.join(directorio, JOURNAL)) as f:
+            for linea in f:
+                try:
+                    estado.aplicar(json.loads(linea))
+                except (ValueError, KeyError):
+                    # última línea a medio escribir si el proceso murió en el write
+                    break
+    except FileNotFoundError:
+        pass
+    return estado
+
+
+class JournalTurnos:
+    """
+    Journal append-only de la cola de turnos (una línea JSON por operación:
+    push / pop / age) con snapshots periódicos.
+
+    Cada operación es un único write() con O_APPEND: si el proceso muere, lo
+    escrito ya está en el kernel. El fsync se agrupa (sincronizar(), como
+    mucho cada INTERVALO_FSYNC). Cada COMPACTAR_CADA operaciones se escribe
+    el estado completo en el snapshot y se vacía el journal, así que
+    recuperar cuesta leer un snapshot chico más unas pocas líneas.
+    """
+    def __init__(self, directorio, estado, compactar_cada=COMPACTAR_CADA):
+        os.makedirs(directorio, exist_ok=True)
+        self.directorio = directorio
+        self.estado = estado
+        self.compactar_cada = compactar_cada
+        self.ops = 0
+        self.sucio = False
+        self._proximo_fsync = 0.0
+
+        self.fd = os.open(os.path.join(directorio, JOURNAL), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # arranca compactando: lo recuperado queda en el snapshot y el journal vacío
+        self.compactar()
+
+    def _escribir(self, reg):
+        self.estado.aplicar(reg)
+        os.write(self.fd, (json.dumps(reg, separators=(",", ":")) + "\n").encode())
+        self.sucio = True
+        self.ops += 1
+        if self.ops >= self.compactar_cada:
+            self.compactar()
+
+    def push(self, cliente_id, nombre, tramite, prioridad, orden, ts, clave=None):
+        """clave: [política, primario] de las políticas de clave fija (ver Despachador.restaurar)."""
+        reg = {"op": "push", "c": cliente_id, "n": nombre, "t": tramite, "p": prioridad, "o": orden, "ts": ts}
+        if clave is not None:
+            reg["k"] = clave
+        self._escribir(reg)
+
+    def pop(self, cliente_id):
+        self._escribir({"op": "pop", "c": cliente_id})
+
+    def aging(self, cliente_id, prioridad):
+        self._escribir({"op": "age", "c": cliente_id, "p": prioridad})
+
+    def sincronizar(self):
+        """fsync agrupado; llamar seguido desde el loop del proceso."""
+        if not self.sucio:
+            return
+        ahora = time.monotonic()
+        if ahora < self._proximo_fsync:
+            return
+        self._proximo_fsync = ahora + INTERVALO_FSYNC
+        os.fsync(self.fd)
+        self.sucio = False
+
+    def compactar(self):
+        snap = {
+            "llegadas": self.estado.llegadas,
+            "ultimo_cliente_id": self.estado.ultimo_cliente_id,
+            "turnos": list(self.estado.turnos.values()),
+        }
+        ruta = os.path.join(self.directorio, SNAPSHOT)
+        with open(ruta + ".tmp", "w") as f:
+            json.dump(snap, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(ruta + ".tmp", ruta)
+        os.ftruncate(self.fd, 0)
+        self.ops = 0
+        self.sucio = False
+
+    def cerrar(self):
+        try:
+            self.compactar()
+        finally:
+            os.close(self.fd)
+
+
+# --- Tokens para retomar el turno ---
+#
+# El token que recibe el cliente es "<cliente_id>.<firma>", con la firma HMAC
+# de una clave guardada en el directorio de datos (sobrevive reinicios). El
+# proxy lo valida sin consultar a nadie y así nadie puede reclamar un
+# cliente_id ajeno.
+
+def cargar_clave(directorio):
+    ruta = os.path.join(directorio, CLAVE)
+    try:
+        with open(ruta, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        os.makedirs(directorio, exist_ok=True)
+        clave = secrets.token_bytes(32)
+        with open(ruta, "wb") as f:
+            f.write(clave)
+        os.chmod(ruta, 0o600)
+        return clave
+
+
+def firmar_token(clave, cliente_id):
+    firma = hmac.new(clave, cliente_id.encode(), hashlib.sha256).hexdigest()[:20]
+    return f"{cliente_id}.{firma}"
+
+
+def validar_token(clave, token):
+    """Devuelve el cliente_id si el token es válido, si no None."""
+    cliente_id, _, _ = (token or "").partition(".")
+    if cliente_id and hmac.compare_digest(firmar_token(clave, cliente_id), token):
+        return cliente_id
+    return None
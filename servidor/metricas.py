@@ -0,0 +1,263 @@
+# servidor/metricas.py
+import os
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Límites (segundos) de los buckets, estilo Prometheus: cada bucket cuenta
+# las observaciones <= a su límite; el último es +Inf.
+BUCKETS_LATENCIA = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 30, 60, 120, 300, float("inf"),
+)
+
+
+class Histograma:
+    """
+    Histograma de buckets fijos: observar() es O(log buckets) y no guarda
+    las muestras, así que puede quedar prendido todo el tiempo.
+    """
+    def __init__(self, buckets=BUCKETS_LATENCIA):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observar(self, valor):
+        self.counts[bisect.bisect_left(self.buckets, valor)] += 1
+        self.count += 1
+        self.sum += valor
+        if valor > self.max:
+            self.max = valor
+
+    def percentil(self, q):
+        """Estimación por interpolación lineal dentro del bucket (q entre 0 y 1)."""
+        if not self.count:
+            return 0.0
+        objetivo = q * self.count
+        acumulado = 0
+        inferior = 0.0
+        for limite, n in zip(self.buckets, self.counts):
+            if n and acumulado + n >= objetivo:
+                superior = min(limite, self.max)
+                return inferior + (superior - inferior) * (objetivo - acumulado) / n
+            acumulado += n
+            if limite != float("inf"):
+                inferior = limite
+        return self.max
+
+    def resumen(self):
+        if not self.count:
+            return "n=0"
+        return (
+            f"n={self.count} prom={self.sum / self.count * 1000:.2f}ms "
+            f"p50={self.percentil(0.5) * 1000:.2f}ms p90={self.percentil(0.9) * 1000:.2f}ms "
+            f"p99={self.percentil(0.99) * 1000:.2f}ms max={self.max * 1000:.2f}ms"
+        )
+
+    def formatear(self, ancho=40):
+        """Histograma en texto, una línea por bucket con observaciones."""
+        if not self.count:
+            return "(sin datos)"
+        pico = max(self.counts)
+        lineas = []
+        for limite, n in zip(self.buckets, self.counts):
+            if not n:
+                continue
+            etiqueta = "+Inf" if limite == float("inf") else f"{limite * 1000:g}ms"
+            barra = "#" * max(1, round(n / pico * ancho))
+            lineas.append(f"  <= {etiqueta:>9} {n:>8} {barra}")
+        return "\n".join(lineas)
+
+    def prometheus(self, nombre, etiquetas=""):
+        """Líneas de texto Prometheus (buckets acumulados, _sum y _count)."""
+        sep = "," if etiquetas else ""
+        lineas = []
+        acumulado = 0
+        for limite, n in zip(self.buckets, self.counts):
+            acumulado += n
+            le = "+Inf" if limite == float("inf") else repr(limite)
+            lineas.append(f'{nombre}_bucket{{{etiquetas}{sep}le="{le}"}} {acumulado}')
+        if self.buckets[-1] != float("inf"):
+            lineas.append(f'{nombre}_bucket{{{etiquetas}{sep}le="+Inf"}} {self.count}')
+        sufijo = f"{{{etiquetas}}}" if etiquetas else ""
+        lineas.append(f"{nombre}_sum{sufijo} {self.sum}")
+        lineas.append(f"{nombre}_count{sufijo} {self.count}")
+        return lineas
+
+
+# --- Exposición en formato Prometheus ---
+#
+# Cada proceso (proxy/workers, turnos, db) tiene su Registro y cada
+# INTERVALO_VOLCADO segundos escribe un snapshot en texto Prometheus en un
+# directorio compartido. El proceso principal sirve /metrics por HTTP juntando
+# esos archivos. Medir es sumar enteros en el propio proceso: no hay locks ni
+# IPC extra, y renderizar cuesta lo mismo haya o no alguien scrapeando.
+
+INTERVALO_VOLCADO = 1.0
+
+# Buckets para lo que dura una vuelta de un event loop (microsegundos a 1 s)
+BUCKETS_VUELTA = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, float("inf"),
+)
+
+
+class Contador:
+    __slots__ = ("valor",)
+
+    def __init__(self):
+        self.valor = 0
+
+    def inc(self, n=1):
+        self.valor += n
+
+
+class Registro:
+    """
+    Métricas de un proceso. Las etiquetas fijas (proceso, worker) se agregan
+    a todas las muestras.
+      - contador(nombre, ayuda) -> Contador
+      - histograma(nombre, ayuda, h=None) -> Histograma
+      - valor(nombre, ayuda, fn, tipo="gauge", etiqueta=None): se lee fn() al
+        renderizar; con etiqueta, fn() devuelve {valor_etiqueta: número}
+    """
+    def __init__(self, etiquetas=None):
+        self.etiquetas = ",".join(f'{k}="{v}"' for k, v in (etiquetas or {}).items())
+        self.metricas = []   # (nombre, ayuda, tipo, fuente, etiqueta)
+        self.archivo = None
+        self._proximo = 0.0
+
+    def contador(self, nombre, ayuda):
+        c = Contador()
+        self.metricas.append((nombre, ayuda, "counter", lambda: c.valor, None))
+        return c
+
+    def histograma(self, nombre, ayuda, h=None):
+        h = h if h is not None else Histograma()
+        self.metricas.append((nombre, ayuda, "histogram", h, None))
+        return h
+
+    def valor(self, nombre, ayuda, fn, tipo="gauge", etiqueta=None):
+        self.metricas.append((nombre, ayuda, tipo, fn, etiqueta))
+
+    def render(self):
+        base = self.etiquetas
+        lineas = []
+        for nombre, ayuda, tipo, fuente, etiqueta in self.metricas:
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            if tipo == "histogram":
+                lineas.extend(fuente.prometheus(nombre, base))
+            elif etiqueta:
+                for clave, v in fuente().items():
+                    etiquetas = f'{base},{etiqueta}="{clave}"' if base else f'{etiqueta}="{clave}"'
+                    lineas.append(f"{nombre}{{{etiquetas}}} {v}")
+            else:
+                lineas.append(f"{nombre}{{{base}}} {fuente()}" if base else f"{nombre} {fuente()}")
+        return "\n".join(lineas) + "\n"
+
+    def exportar(self, directorio, nombre_archivo):
+        """Activa el volcado periódico a directorio/nombre_archivo.prom."""
+        self.archivo = os.path.join(directorio, f"{nombre_archivo}.prom")
+
+    def volcar(self, forzar=False):
+        """Llamar seguido desde el loop del proceso: solo escribe cada INTERVALO_VOLCADO."""
+        texto = self.volcado(forzar)
+        if texto is not None:
+            self.escribir_volcado(texto)
+
+    def volcado(self, forzar=False):
+        """
+        El snapshot renderizado si toca volcar (None si no): así el loop solo
+        renderiza y escribir_volcado() puede correr en otro hilo.
+        """
+        if self.archivo is None:
+            return None
+        ahora = time.monotonic()
+        if not forzar and ahora < self._proximo:
+            return None
+        self._proximo = ahora + INTERVALO_VOLCADO
+        return self.render()
+
+    def escribir_volcado(self, texto):
+        tmp = self.archivo + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(texto)
+            os.replace(tmp, self.archivo)
+        except OSError:
+            pass
+
+
+def tamano_cola(q):
+    """qsize() de una multiprocessing.Queue (-1 donde el SO no lo soporta, p.ej. macOS)."""
+    try:
+        return q.qsize()
+    except NotImplementedError:
+        return -1
+
+
+def juntar_snapshots(directorio):
+    """Une los .prom de todos los procesos agrupando cada métrica (un solo HELP/TYPE)."""
+    familias = {}   # nombre -> [help, type, muestras]
+    try:
+        archivos = sorted(f for f in os.listdir(directorio) if f.endswith(".prom"))
+    except OSError:
+        archivos = []
+    for archivo in archivos:
+        try:
+            with open(os.path.join(directorio, archivo)) as f:
+                lineas = f.read().splitlines()
+        except OSError:
+            continue
+        actual = None
+        for linea in lineas:
+            if linea.startswith("# HELP "):
+                nombre = linea.split(" ", 3)[2]
+                actual = familias.setdefault(nombre, [linea, None, []])
+            elif linea.startswith("# TYPE "):
+                actual[1] = linea
+            elif linea and actual is not None:
+                actual[2].append(linea)
+
+    salida = []
+    for ayuda, tipo, muestras in familias.values():
+        salida.append(ayuda)
+        salida.append(tipo)
+        salida.extend(muestras)
+    return "\n".join(salida) + "\n"
+
+
+def servir_metricas(directorio, host, port, sock=None):
+    """
+    Servidor HTTP (hilo daemon) con GET /metrics en formato de texto Prometheus.
+    sock: socket ya escuchando (heredado en un reinicio en caliente) en vez de abrir host:port.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            cuerpo = juntar_snapshots(directorio).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    if sock is None:
+        servidor = ThreadingHTTPServer((host, port), Handler)
+    else:
+        servidor = ThreadingHTTPServer((host, port), Handler, bind_and_activate=False)
+        servidor.socket.close()
+        servidor.socket = sock
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="metricas-http", daemon=True).start()
+    return servidor
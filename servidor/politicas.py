@@ -0,0 +1,341 @@
+# servidor/politicas.py
+"""
+Políticas de atención de Turnos Service, elegibles al arrancar
+(--politica en proxy_server.py y simulacion.py):
+
+  aging[:segundos]          PRIORIDADES y un nivel más urgente cada N s de
+                            espera (30 por defecto; ver TurnoQueue)
+  estricta[:segundos]       PRIORIDADES sin escalones; el que espera más de N s
+                            (600) pasa a un nivel de guardia, antes que todos
+  wfq[:tramite=peso,...]    reparto justo entre trámites con pesos (PESOS)
+  edf[:tramite=seg,...]     primero el que vence antes: llegada + SLA del trámite
+  sest[:tramite=seg,...]    primero el trámite de atención esperada más corta
+                            (por defecto, el promedio histórico de la DB)
+
+Cada política arma con cola(reloj) la cola de un trámite del Despachador;
+todas las colas tienen la misma interfaz:
+  push(cliente_id, nombre, tramite, orden, prioridad, clave) -> _Turno
+  pop() -> dict del turno que sale  |  quitar(turno)  (baja, O(1) perezosa)
+  peek() -> clave del tope, comparable con la de otras colas de la política
+  clave(turno) y antes_que(primario, orden): cuántos vivos salen antes que
+  esa clave (el rango, para POSICIONES)
+  envejecer(), len() y en_nivel (turnos vivos por prioridad, para métricas)
+Las de clave fija guardan la clave en el journal y al reiniciar la
+recuperan con restaurado(turno); las de aging guardan la prioridad.
+
+Adentro de un trámite todas atienden por orden de llegada; lo que cambia es
+cómo se comparan los topes de trámites distintos. aging y estricta usan
+TurnoQueue (niveles con heaps y Fenwick). wfq, edf y sest le dan a cada turno
+una clave fija al entrar (primario, orden) y usan ColaPorClave: un heap, con
+push/pop O(log n).
+"""
+import sqlite3
+from bisect import bisect_left
+from heapq import heappush, heappop, heapify
+from collections import deque
+
+from turnos_service import TurnoQueue, PoliticaAging, _Turno, PRIORIDADES
+from consultas import abrir_lectura
+from db import DB_PATH
+
+LIMITE_ESTRICTA = 600.0
+
+# Turnos por vuelta de cada trámite cuando todos tienen gente esperando
+PESOS = {"pago": 3, "reclamo": 2, "consulta": 1}
+
+# Segundos desde la llegada en los que debería empezar la atención
+SLA = {"pago": 300.0, "reclamo": 600.0, "consulta": 900.0}
+
+
+def parse_pares(texto, tipo=float):
+    """'pago=0.3,consulta=0.5' -> {"pago": 0.3, "consulta": 0.5}"""
+    pares = {}
+    for parte in (texto or "").split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        clave, _, valor = parte.partition("=")
+        pares[clave.strip()] = tipo(valor)
+    return pares
+
+
+def _texto_pares(pares):
+    return ",".join(f"{k}={v:g}" for k, v in pares.items())
+
+
+class ColaEstricta(TurnoQueue):
+    """
+    TurnoQueue sin aging escalonado: cada turno queda en el nivel de su
+    trámite hasta esperar `limite` segundos y entonces salta al nivel de
+    guardia (uno más urgente que todos), donde los vencidos salen por orden
+    de llegada. Es el mismo recorrido de las deques de TurnoQueue, solo
+    cambia a dónde va el promovido.
+    """
+    def __init__(self, limite, reloj=None, prioridades=None):
+        super().__init__(aging_seconds=limite, reloj=reloj, prioridades=prioridades)
+        self.guardia = self.min_prioridad - 1
+        # el nivel de guardia va primero: pop y peek recorren los heaps en orden
+        self.heaps = {self.guardia: [], **self.heaps}
+        self.por_llegada = {self.guardia: deque(), **self.por_llegada}
+        self.en_nivel = {self.guardia: 0, **self.en_nivel}
+        self.muertos = {self.guardia: 0, **self.muertos}
+        self.min_prioridad = self.guardia
+
+    def _promocion(self, p):
+        return self.guardia
+
+
+class PoliticaEstricta:
+    """Prioridad estricta por PRIORIDADES con guarda de inanición (ver ColaEstricta)."""
+    nombre = "estricta"
+
+    def __init__(self, limite=LIMITE_ESTRICTA, prioridades=None):
+        self.limite = limite
+        self.prioridades = prioridades or PRIORIDADES
+
+    def __str__(self):
+        return f"{self.nombre}:{self.limite:g}"
+
+    def cola(self, reloj):
+        return ColaEstricta(self.limite, reloj=reloj, prioridades=self.prioridades)
+
+
+class ColaPorClave:
+    """
+    Cola de un trámite para las políticas de clave fija: al entrar, la
+    política le da al turno una clave (primario, orden) que no cambia
+    (reanudar la conserva) y sale el de clave menor.
+    - Un heap de (clave, turno); quitar() solo lo marca inactivo y el
+      tope descarta los inactivos, como en TurnoQueue (que también compacta
+      el heap cuando los inactivos superan a los vivos).
+    - antes_que() hace bisect sobre una foto ordenada de las claves vivas.
+      La foto se rearma solo si la cola cambió desde la consulta anterior:
+      posiciones() consulta todas las colas por cada turno sin tocarlas en
+      el medio, así que es un sort por vuelta de avisos (casi ordenado:
+      los turnos entran con claves crecientes).
+    """
+    def __init__(self, politica, reloj):
+        self.politica = politica
+        self.reloj = reloj
+        self.heap = []
+        self.foto = None
+        self.nivel = None           # prioridad del trámite (solo para métricas)
+        self.counter = 0
+        self.size = 0
+        self.muertos = 0            # inactivos que siguen en el heap
+        self.al_promover = None     # acá no hay promociones
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def en_nivel(self):
+        return {self.nivel: self.size} if self.size else {}
+
+    def push(self, cliente_id, nombre, tramite, orden=None, prioridad=None, clave=None):
+        """clave: la que ya tenía el turno (reanudar); si no, la calcula la política."""
+        prioridades = self.politica.prioridades
+        self.nivel = prioridades.get(tramite, max(prioridades.values()))
+        self.counter += 1
+        turno = _Turno(self.nivel, orden or self.counter, cliente_id, nombre, tramite, self.reloj())
+        turno.clave = clave or self.politica.clave(turno)
+        heappush(self.heap, (turno.clave, turno))
+        self.size += 1
+        self.foto = None
+        return turno
+
+    def quitar(self, turno):
+        if not turno.activo:
+            return
+        turno.activo = False
+        self.size -= 1
+        self.foto = None
+        self.muertos += 1
+        if self.muertos > self.size:
+            heap = self.heap
+            heap[:] = [(clave, t) for clave, t in heap if t.activo]
+            heapify(heap)
+            self.muertos = 0
+
+    def envejecer(self):
+        pass
+
+    def clave(self, turno):
+        return turno.clave
+
+    def antes_que(self, primario, orden):
+        if self.foto is None:
+            self.foto = sorted(clave for clave, turno in self.heap if turno.activo)
+        return bisect_left(self.foto, (primario, orden))
+
+    def peek(self):
+        heap = self.heap
+        while heap:
+            clave, turno = heap[0]
+            if turno.activo:
+                return clave
+            heappop(heap)
+            self.muertos -= 1
+        return None
+
+    def pop(self):
+        heap = self.heap
+        while heap:
+            _, turno = heappop(heap)
+            if not turno.activo:
+                self.muertos -= 1
+                continue
+            turno.activo = False
+            self.size -= 1
+            self.foto = None
+            self.politica.atendido(turno)
+            return {
+                "cliente_id": turno.cliente_id,
+                "nombre": turno.nombre,
+                "tramite": turno.tramite,
+                "prioridad": turno.prioridad,
+                "orden": turno.orden,
+                "clave": turno.clave
+            }
+        return None
+
+
+class PoliticaClaveFija:
+    """Base de wfq, edf y sest: clave(turno) al entrar y atendido(turno) al salir."""
+    nombre = None
+
+    def __init__(self, valores=None, prioridades=None):
+        self.valores = dict(valores or {})
+        self.prioridades = prioridades or PRIORIDADES
+
+    def __str__(self):
+        return f"{self.nombre}:{_texto_pares(self.valores)}" if self.valores else self.nombre
+
+    def cola(self, reloj):
+        return ColaPorClave(self, reloj)
+
+    def atendido(self, turno):
+        pass
+
+    def restaurado(self, turno):
+        """Turno recuperado del journal con su clave (ver Despachador.restaurar)."""
+        pass
+
+
+class PoliticaWFQ(PoliticaClaveFija):
+    """
+    Weighted fair queuing entre trámites, en la variante self-clocked
+    (SCFQ): el tiempo virtual es la etiqueta del último turno atendido, en
+    vez de simular el reparto ideal, así que cada turno cuesta O(1) más el
+    heap. Etiqueta = max(virtual, etiqueta anterior del trámite) + 1 / peso:
+    con todos los trámites esperando salen en proporción a los pesos, y un
+    trámite que estuvo vacío no acumula crédito.
+    """
+    nombre = "wfq"
+
+    def __init__(self, pesos=None, prioridades=None):
+        super().__init__(pesos or PESOS, prioridades)
+        self.virtual = 0.0
+        self.ultima = {}            # tramite -> etiqueta del último que entró
+        self.restaurados = 0
+
+    def clave(self, turno):
+        inicio = max(self.virtual, self.ultima.get(turno.tramite, 0.0))
+        fin = self.ultima[turno.tramite] = inicio + 1.0 / self.valores.get(turno.tramite, 1)
+        return fin, turno.orden
+
+    def atendido(self, turno):
+        if turno.clave[0] > self.virtual:
+            self.virtual = turno.clave[0]
+
+    def restaurado(self, turno):
+        # después de un reinicio los nuevos de cada trámite van detrás de los
+        # recuperados, y el tiempo virtual arranca donde empezó el primero en salir
+        fin = turno.clave[0]
+        if fin > self.ultima.get(turno.tramite, 0.0):
+            self.ultima[turno.tramite] = fin
+        inicio = fin - 1.0 / self.valores.get(turno.tramite, 1)
+        if not self.restaurados or inicio < self.virtual:
+            self.virtual = inicio
+        self.restaurados += 1
+
+
+class PoliticaEDF(PoliticaClaveFija):
+    """
+    Earliest deadline first: vence a la llegada + SLA del trámite (los que
+    no están en la tabla, con el SLA más largo). Sin carga de más cumple
+    todos los SLA que se puedan cumplir; saturado, todos llegan tarde parejo.
+    """
+    nombre = "edf"
+
+    def __init__(self, sla=None, prioridades=None):
+        super().__init__(sla or SLA, prioridades)
+        self.sla_defecto = max(self.valores.values())
+
+    def clave(self, turno):
+        return turno.ts + self.valores.get(turno.tramite, self.sla_defecto), turno.orden
+
+
+class PoliticaSEST(PoliticaClaveFija):
+    """
+    Shortest expected service time: primero el trámite de atención esperada
+    más corta (segundos por trámite; los que faltan, con el promedio de los
+    que hay). Baja la espera promedio pero sin guarda: con carga sostenida el
+    trámite más largo puede no salir nunca. Sin estimaciones es FIFO.
+    """
+    nombre = "sest"
+
+    def __init__(self, atencion=None, prioridades=None):
+        super().__init__(atencion, prioridades)
+
+    def historial(self, path=DB_PATH):
+        """Completa los trámites sin estimación con AVG(duracion_s) de turnos_atendidos."""
+        for tramite, promedio in atencion_historica(path).items():
+            self.valores.setdefault(tramite, round(promedio, 1))
+
+    def clave(self, turno):
+        valores = self.valores
+        esperado = valores.get(turno.tramite)
+        if esperado is None:
+            esperado = sum(valores.values()) / len(valores) if valores else 0.0
+        return esperado, turno.orden
+
+
+POLITICAS = {
+    "aging": PoliticaAging,
+    "estricta": PoliticaEstricta,
+    "wfq": PoliticaWFQ,
+    "edf": PoliticaEDF,
+    "sest": PoliticaSEST,
+}
+
+
+def parse_politica(texto):
+    """'wfq', 'aging:60' o 'edf:pago=120,consulta=900' -> la política armada"""
+    nombre, _, param = texto.partition(":")
+    clase = POLITICAS.get(nombre.strip())
+    if clase is None:
+        raise ValueError(f"política desconocida: {nombre} (opciones: {', '.join(POLITICAS)})")
+    if not param.strip():
+        return clase()
+    if clase in (PoliticaAging, PoliticaEstricta):
+        return clase(float(param))
+    return clase(parse_pares(param))
+
+
+def atencion_historica(path=DB_PATH):
+    """{tramite: segundos} promedio de atención; {} si la DB no existe o no tiene duraciones."""
+    try:
+        conn = abrir_lectura(path)
+    except sqlite3.Error:
+        return {}
+    try:
+        filas = conn.execute(
+            "SELECT tramite, AVG(duracion_s) AS promedio FROM turnos_atendidos "
+            "WHERE duracion_s IS NOT NULL GROUP BY tramite"
+        ).fetchall()
+    except sqlite3.Error:
+        return {}
+    finally:
+        conn.close()
+    return {fila["tramite"]: fila["promedio"] for fila in filas}
@@ -1,19 +1,36 @@
+# --- Mensajes ----------------------------------------------------------------
+# Handshake del proxy con clientes y admins, rechazos y avisos de espera.
+
+
 def parse_hello(msg: str):
     """
     Devuelve un dict con:
-      - {"type":"ADMIN_LOGIN","admin_id":...}
-      - {"type":"CLIENT_HELLO","nombre":...,"tramite":...}
+      - {"type":"ADMIN_LOGIN","admin_id":...,"skills":[...],"capacidad":n}  (skills vacío = todos los trámites)
+      - {"type":"CLIENT_HELLO","nombre":...,"tramite":...,"token":... o None}
       - None si no se puede parsear todavía
     """
     msg = (msg or "").strip()
     if not msg:
         return None
 
+    # formato: ADMIN_LOGIN:A1  o  ADMIN_LOGIN:A1;skills:pago,reclamo;capacidad:3
     if msg.startswith("ADMIN_LOGIN:"):
-        admin_id = msg.split(":", 1)[1].strip()
-        return {"type": "ADMIN_LOGIN", "admin_id": admin_id}
+        admin_id, *resto = msg.split(":", 1)[1].split(";")
+        skills = []
+        capacidad = 1
+        for chunk in resto:
+            k, _, v = chunk.partition(":")
+            k = k.strip()
+            if k == "skills":
+                skills = [t.strip() for t in v.split(",") if t.strip()]
+            elif k == "capacidad":
+                try:
+                    capacidad = min(max(int(v), 1), MAX_CAPACIDAD)
+                except ValueError:
+                    pass
+        return {"type": "ADMIN_LOGIN", "admin_id": admin_id.strip(), "skills": skills, "capacidad": capacidad}
 
-    # formato: nombre:Juan;tramite:consulta
+    # formato: nombre:Juan;tramite:consulta  (opcional ;token:<token> para retomar el turno)
     if ";" in msg and ":" in msg:
         partes = {}
         for chunk in msg.split(";"):
@@ -25,10 +42,146 @@ def parse_hello(msg: str):
                 "type": "CLIENT_HELLO",
                 "nombre": partes.get("nombre", "Desconocido"),
                 "tramite": partes.get("tramite"),
+                "token": partes.get("token"),
             }
 
     return None
 
 
-def build_client_id(cliente_id: str) -> str:
-    return f"CLIENTE_ID:{cliente_id}\n"
\ No newline at end of file
+def build_client_id(cliente_id: str, token: str = None) -> str:
+    if token:
+        return f"CLIENTE_ID:{cliente_id};token:{token}\n"
+    return f"CLIENTE_ID:{cliente_id}\n"
+
+
+def build_ocupado(reintentar_s: int, motivo: str) -> str:
+    """Rechazo de admisión: el proxy está lleno, reintentar en reintentar_s segundos."""
+    return f"OCUPADO:{reintentar_s};motivo:{motivo}\n"
+
+
+def parse_ocupado(msg: str):
+    """"OCUPADO:5;motivo:cola" -> (5, "cola"), o None si msg no es un rechazo."""
+    if not msg.startswith("OCUPADO:"):
+        return None
+    segundos, _, motivo = msg.split(":", 1)[1].partition(";motivo:")
+    try:
+        return int(segundos), motivo.strip()
+    except ValueError:
+        return None
+
+
+def build_posicion(posicion: int, espera_s=None) -> str:
+    """Aviso a un cliente en espera: su lugar en la fila y la espera estimada (si hay)."""
+    if espera_s is None:
+        return f"POSICION:{posicion}\n"
+    return f"POSICION:{posicion};espera:{espera_s}\n"
+
+
+def parse_posicion(msg: str):
+    """"POSICION:3;espera:40" -> (3, 40); sin estimación -> (3, None); None si no es un aviso."""
+    if not msg.startswith("POSICION:"):
+        return None
+    posicion, _, espera = msg.split(":", 1)[1].partition(";espera:")
+    try:
+        return int(posicion), int(espera) if espera.strip() else None
+    except ValueError:
+        return None
+
+
+# --- Sesiones etiquetadas ----------------------------------------------------
+# Un admin con capacidad > 1 atiende varias sesiones por la misma conexión:
+# todo lo de una sesión, en los dos sentidos, va etiquetado "@<cliente_id> <texto>"
+# (el id de la sesión es el del cliente). Con capacidad 1 no hay etiquetas.
+MAX_CAPACIDAD = 32
+
+
+def etiquetar(sesion, texto: str) -> str:
+    """Etiqueta cada línea de texto con la sesión: "@7 <línea>\n"."""
+    return "".join(f"@{sesion} {linea}\n" for linea in texto.split("\n") if linea)
+
+
+def parse_etiqueta(msg: str):
+    """"@7 hola" -> ("7", "hola"); None si msg no está etiquetado."""
+    if not msg.startswith("@"):
+        return None
+    sesion, _, texto = msg[1:].partition(" ")
+    return (sesion, texto) if sesion else None
+
+
+# --- Latidos -----------------------------------------------------------------
+# El proxy manda PING a una conexión callada y la da por muerta si no
+# recibe nada a tiempo; los clientes contestan PONG. Un PING del cliente
+# recibe PONG. No son mensajes de chat: nunca se relayan. Empiezan con CONTROL
+# (SOH), que encode_frame les saca a los mensajes escritos, así un "PING"
+# tipeado en la charla llega al otro lado como cualquier mensaje.
+CONTROL = "\x01"
+PING = CONTROL + "PING"
+PONG = CONTROL + "PONG"
+
+
+# --- Framing -----------------------------------------------------------------
+# Cada mensaje viaja como una línea UTF-8 terminada en "\n". TCP puede juntar o
+# partir escrituras, así que cada conexión tiene su FrameDecoder que acumula
+# bytes y devuelve solo las líneas completas.
+
+MAX_FRAME = 64 * 1024
+RECV_SIZE = 64 * 1024
+
+# Backpressure por conexión en el proxy: si el buffer de salida supera
+# HIGH_WATERMARK se deja de leer a quien lo está llenando (el propio socket y
+# su peer) hasta que baje de LOW_WATERMARK.
+HIGH_WATERMARK = 256 * 1024
+LOW_WATERMARK = 64 * 1024
+
+
+class FrameError(ValueError):
+    """El peer mandó una línea más larga que MAX_FRAME sin terminarla."""
+
+
+def encode_frame(msg: str) -> bytes:
+    """Codifica un mensaje como un frame (los saltos internos se aplanan; solo PING y PONG empiezan con CONTROL)."""
+    msg = msg.replace("\r", " ").replace("\n", " ")
+    if msg[:1] == CONTROL and msg not in (PING, PONG):
+        msg = msg.lstrip(CONTROL)
+    return (msg + "\n").encode()
+
+
+class FrameDecoder:
+    """
+    Decoder incremental: feed(bytes) devuelve cero o más frames completos
+    (str, sin el "\\n"). Lo que queda sin terminar se guarda para el próximo feed.
+    """
+    __slots__ = ("buf", "max_frame")
+
+    def __init__(self, max_frame=MAX_FRAME):
+        self.buf = bytearray()
+        self.max_frame = max_frame
+
+    def feed(self, data: bytes):
+        return [str(frame, "utf-8", "ignore") for frame in self.feed_crudo(data)]
+
+    def feed_crudo(self, data: bytes):
+        """
+        Como feed() pero sin decodificar: devuelve cada frame como bytes (sin
+        "\\n" ni "\\r" final), cortado directo de `data` si no había un frame a
+        medias. Para mensajes de chat un slice de bytes sale más barato que
+        una memoryview.
+        """
+        if self.buf:
+            self.buf += data
+            data = bytes(self.buf)
+            self.buf.clear()
+        frames = []
+        inicio = 0
+        while True:
+            fin = data.find(b"\n", inicio)
+            if fin < 0:
+                break
+            corte = fin - 1 if fin > inicio and data[fin - 1] == 13 else fin
+            frames.append(data[inicio:corte])
+            inicio = fin + 1
+        if inicio < len(data):
+            self.buf += data[inicio:]
+            if len(self.buf) > self.max_frame:
+                raise FrameError(f"frame de más de {self.max_frame} bytes")
+        return frames
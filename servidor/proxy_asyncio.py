@@ -0,0 +1,280 @@
+# servidor/proxy_asyncio.py
+import time
+import signal
+import asyncio
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+from protocol import FrameDecoder, FrameError, RECV_SIZE, HIGH_WATERMARK, LOW_WATERMARK
+from metricas import INTERVALO_VOLCADO, BUCKETS_VUELTA, Histograma
+from sesiones import Conexion
+from descarga import Descarga
+from bitacora import log
+
+# Cada cuánto se actualiza el reloj de las sesiones y se revisan los timeouts
+RESOLUCION_RELOJ = 0.5
+# Período del timer que mide cuánto se atrasa el loop
+PERIODO_RETRASO = 0.1
+# Vencido el drenaje, segundos para que salga lo escrito a las sesiones cortadas
+GRACIA_CIERRE = 2.0
+# Segundos que se espera el hello de un rechazado antes de cerrar
+ESPERA_RECHAZO = 0.5
+
+
+class ConexionAsyncio(Conexion):
+    """Conexión asyncio: estado de sesión + streams (lo que ProxySessions ve como `conn`)."""
+    __slots__ = ("reader", "writer", "addr", "cerrada")
+
+    def __init__(self, reader, writer):
+        super().__init__()
+        self.reader = reader
+        self.writer = writer
+        self.addr = writer.get_extra_info("peername")
+        self.cerrada = False
+
+
+class AsyncioEngine:
+    """
+    Motor de I/O con asyncio streams (opcionalmente sobre uvloop).
+    Mismo comportamiento en el cable que SelectorsEngine:
+    - una task por conexión que lee, decodifica frames y se los pasa a las sesiones
+    - las escrituras van al buffer del transport (write() nunca bloquea)
+    - backpressure: después de cada lectura la task espera drain() de su propio
+      writer y del de su peer, así no se lee más mientras alguno esté por
+      encima de HIGH_WATERMARK (y hasta que baje de LOW_WATERMARK)
+    - SIGTERM drena como en SelectorsEngine: se cierran los servers, se
+      sueltan las conexiones sin sesión y se espera hasta `drenaje` segundos a
+      las sesiones en curso (el reinicio en caliente es solo de selectors)
+    - los logs van al hilo escritor de bitacora.log y el snapshot de métricas
+      al pool de descarga.Descarga, con su despertador en add_reader. Las vueltas del loop no se ven desde afuera:
+      el retraso se mide con un timer cada PERIODO_RETRASO (cuánto tarde
+      despierta) en turnos_proxy_loop_retraso_segundos y el mayor del
+      intervalo en turnos_proxy_loop_bloqueo_max_segundos
+    """
+    def __init__(self, sesiones, servers, from_turnos, usar_uvloop=True, drenaje=30.0):
+        self.sesiones = sesiones
+        sesiones.transporte = self
+        self.servers = servers
+        self.from_turnos = from_turnos
+        self.usar_uvloop = usar_uvloop and uvloop is not None
+        self.conexiones = 0
+        self.abiertas = set()           # ConexionAsyncio vivas (para soltar las sin hello al drenar)
+        self.servidores = []
+        self.drenaje = drenaje
+        self.limite_drenaje = None
+        self.cortadas = False
+        self.descarga = Descarga()
+        self.volcando = False
+        self.retraso = Histograma(BUCKETS_VUELTA)
+        self.bloqueo_max = 0.0
+        metricas = sesiones.metricas
+        metricas.valor("turnos_proxy_conexiones_activas", "Conexiones TCP abiertas", lambda: self.conexiones)
+        metricas.histograma("turnos_proxy_loop_retraso_segundos",
+                            "Atraso del timer de control del event loop", self.retraso)
+        metricas.valor("turnos_proxy_loop_bloqueo_max_segundos",
+                       "Mayor atraso del event loop en el último intervalo de volcado", lambda: self.bloqueo_max)
+        metricas.valor("turnos_proxy_descarga_en_vuelo", "Trabajos en el pool de descarga",
+                       lambda: self.descarga.en_vuelo)
+        metricas.valor("turnos_proxy_log_descartadas_total", "Eventos de log descartados con la salida saturada",
+                       lambda: log.descartados, tipo="counter")
+
+    # --- transporte (llamado desde ProxySessions) ---
+
+    def enviar(self, conn, payload: bytes):
+        if conn.cerrada:
+            return
+        # si el socket está roto, el transport se cierra y la task de lectura
+        # de conn recibe EOF/error y llama a sesiones.desconectado()
+        conn.writer.write(payload)
+
+    def enviar_partes(self, conn, partes):
+        if conn.cerrada:
+            return
+        # writelines: escritura vectorizada (sendmsg) en los transports que la soportan
+        conn.writer.writelines(partes)
+
+    def cerrar(self, conn, vaciar=False):
+        if conn.cerrada:
+            return
+        conn.cerrada = True
+        if vaciar:
+            conn.writer.close()            # cierra después de mandar lo pendiente
+        else:
+            conn.writer.transport.abort()  # descarta lo pendiente
+
+    def abierta(self, conn):
+        return not conn.cerrada
+
+    def peer_cambio(self, conn):
+        # el backpressure se evalúa con el peer actual en cada vuelta de lectura
+        pass
+
+    # --- loop ---
+
+    async def backpressure(self, conn):
+        for c in (conn, conn.peer, *(conn.atiende.values() if conn.atiende else ())):
+            if c is None or c.cerrada:
+                continue
+            try:
+                await c.writer.drain()
+            except (ConnectionError, OSError):
+                # la caída del peer la procesa su propia task
+                pass
+
+    async def rechazar(self, reader, writer, linea):
+        """Contesta OCUPADO y cierra, como rechazar() de proxy_server.py."""
+        try:
+            writer.write(linea)
+            writer.write_eof()
+            # si el hello del cliente queda sin leer, close() manda RST y puede
+            # pisar el OCUPADO antes de que el cliente lo lea
+            await asyncio.wait_for(reader.read(RECV_SIZE), ESPERA_RECHAZO)
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            pass
+        writer.close()
+
+    async def handle_conn(self, reader, writer):
+        ocupado = self.sesiones.admitir_conexion(writer.get_extra_info("peername"), self.conexiones)
+        if ocupado is not None:
+            await self.rechazar(reader, writer, ocupado)
+            return
+        conn = ConexionAsyncio(reader, writer)
+        writer.transport.set_write_buffer_limits(high=HIGH_WATERMARK, low=LOW_WATERMARK)
+        log.info("conexion", "Conexión entrante desde {addr}", addr=conn.addr)
+        self.conexiones += 1
+        self.abiertas.add(conn)
+        self.sesiones.vigilar(conn)
+
+        decoder = FrameDecoder()
+        try:
+            while not conn.cerrada:
+                chunk = await reader.read(RECV_SIZE)
+                if not chunk:
+                    break
+                try:
+                    frames = decoder.feed_crudo(chunk)
+                except FrameError as e:
+                    log.warning("trama_invalida", "Cerrando {addr}: {error}", addr=conn.addr, error=str(e))
+                    break
+                for frame in frames:
+                    self.sesiones.handle_frame(conn, frame)
+                    if conn.cerrada:
+                        # el frame cerró la conexión (FIN de cliente)
+                        break
+                await self.backpressure(conn)
+        except (ConnectionError, OSError):
+            pass
+        except asyncio.CancelledError:
+            # apagado del proxy: la task es la raíz de la conexión, no hay a quién propagar
+            conn.cerrada = True
+        finally:
+            self.conexiones -= 1
+            self.abiertas.discard(conn)
+            if not conn.cerrada:
+                self.sesiones.desconectado(conn)
+
+    def drain_turnos(self):
+        """Procesa los lotes que el Turnos Service haya mandado por el pipe (ipc.LectorEventos)."""
+        try:
+            for evt in self.from_turnos.leer():
+                self.sesiones.handle_turnos_event(evt)
+        except (EOFError, OSError):
+            log.error("canal_turnos_cerrado", "Se cerró el canal con Turnos Service")
+            asyncio.get_running_loop().remove_reader(self.from_turnos.fileno())
+
+    async def volcar_metricas(self):
+        metricas = self.sesiones.metricas
+        while True:
+            texto = metricas.volcado()
+            if texto is not None:
+                self.bloqueo_max = 0.0
+                if not self.volcando:
+                    self.volcando = self.descarga.descargar(metricas.escribir_volcado, texto,
+                                                            listo=self.volcado_escrito)
+            await asyncio.sleep(INTERVALO_VOLCADO)
+
+    def volcado_escrito(self, _futuro):
+        self.volcando = False
+
+    async def medir_retraso(self):
+        while True:
+            esperado = time.monotonic() + PERIODO_RETRASO
+            await asyncio.sleep(PERIODO_RETRASO)
+            retraso = max(0.0, time.monotonic() - esperado)
+            self.retraso.observar(retraso)
+            if retraso > self.bloqueo_max:
+                self.bloqueo_max = retraso
+
+    async def vencimientos(self):
+        # reloj de las sesiones + timeouts, con la resolución de la rueda;
+        # vuelve cuando terminó el drenaje
+        while True:
+            ahora = time.monotonic()
+            self.sesiones.vencer(ahora)
+            # reintenta lo que haya quedado pendiente con el pipe a Turnos lleno
+            self.sesiones.q_to_turnos.flush()
+            if self.limite_drenaje is not None and self.drenado(ahora):
+                return
+            await asyncio.sleep(RESOLUCION_RELOJ)
+
+    def empezar_drenaje(self):
+        if self.limite_drenaje is not None:
+            return
+        log.info("drenaje", "SIGTERM: drenando hasta {plazo:g} s", plazo=self.drenaje)
+        for servidor in self.servidores:
+            servidor.close()
+        self.limite_drenaje = time.monotonic() + self.drenaje
+        self.sesiones.drenar([c for c in self.abiertas if c.rol is None])
+
+    def drenado(self, ahora):
+        """True cuando ya no queda nada (o venció el plazo y pasó la gracia para vaciar buffers)."""
+        if not self.conexiones:
+            return True
+        if ahora < self.limite_drenaje:
+            return False
+        if self.cortadas:
+            return True
+        self.cortadas = True
+        log.warning("drenaje_vencido", "Venció el drenaje: se cortan {sesiones} sesiones",
+                    sesiones=self.sesiones.cortar_sesiones())
+        self.limite_drenaje = ahora + GRACIA_CIERRE
+        return False
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.from_turnos.fileno(), self.drain_turnos)
+        loop.add_reader(self.descarga.fileno(), self.descarga.completar)
+        loop.add_signal_handler(signal.SIGTERM, self.empezar_drenaje)
+        loop.add_signal_handler(
+            signal.SIGUSR2, log.warning, "reinicio_no_soportado",
+            "Reinicio en caliente solo con --engine selectors y --workers 1")
+        # los eventos de una vuelta del loop van a Turnos en un solo lote
+        self.sesiones.q_to_turnos.programar = loop.call_soon
+
+        for sock in self.servers:
+            # start_server ya acepta: no hace falta serve_forever()
+            self.servidores.append(await asyncio.start_server(self.handle_conn, sock=sock))
+        tareas = [asyncio.create_task(self.volcar_metricas()), asyncio.create_task(self.medir_retraso()),
+                  asyncio.create_task(self.vencimientos())]
+        try:
+            hechas, _ = await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+            for tarea in hechas:
+                tarea.result()
+        finally:
+            loop.remove_reader(self.descarga.fileno())
+
+    def run(self):
+        loop_factory = uvloop.new_event_loop if self.usar_uvloop else None
+        if self.usar_uvloop:
+            log.info("uvloop", "asyncio sobre uvloop")
+        try:
+            with asyncio.Runner(loop_factory=loop_factory) as runner:
+                runner.run(self.serve())
+        finally:
+            self.descarga.cerrar()
+
+    def close(self):
+        self.descarga.cerrar()
@@ -1,296 +1,540 @@
 # servidor/proxy_server.py
 import os
 import sys
+import time
 import socket
+import pickle
+import shutil
+import signal
+import tempfile
+import threading
 import selectors
 import argparse
-import threading
+import subprocess
 from multiprocessing import Process, Queue
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 if BASE_DIR not in sys.path:
     sys.path.insert(0, BASE_DIR)
 
-from protocol import parse_hello, build_client_id
+from protocol import FrameDecoder, FrameError, RECV_SIZE, HIGH_WATERMARK, LOW_WATERMARK
+from sesiones import ProxySessions, Conexion
+from admision import Admision, parse_max_cola
+from metricas import INTERVALO_VOLCADO, BUCKETS_VUELTA, Histograma, servir_metricas
+from descarga import Descarga
+from bitacora import log, parse_muestreo, NIVELES
+from journal import cargar_estado, cargar_clave
+from db import DATA_DIR, DB_PATH
 from turnos_service import run_turnos_service
+from politicas import parse_politica, POLITICAS
+from ipc import CanalEventos, canal_eventos
 from db_worker import run_db_worker
 
-PRIORIDADES = {"pago": 1, "reclamo": 2, "consulta": 3}
+# data del selector para el extremo del pipe Turnos -> Proxy
+TURNOS_PIPE = "TURNOS_PIPE"
+# data del selector para el canal entre workers (--workers N)
+CANAL_WORKERS = "CANAL_WORKERS"
+# data del selector para el despertador del pool de descarga
+DESCARGA = "DESCARGA"
+
+# Tamaño máximo de un mensaje entre workers (datagrama AF_UNIX)
+MAX_MSG_WORKER = 256 * 1024
+
+# Segundos que se espera a Turnos / DB Worker al apagar antes de matarlos
+ESPERA_SERVICIOS = 10.0
+# Vencido el drenaje, segundos para que salga lo escrito a las sesiones cortadas
+GRACIA_CIERRE = 2.0
+# Reinicio en caliente: espera del paso de sockets entre el proceso viejo y el nuevo
+ESPERA_REINICIO = 30.0
+
+
+class ConexionSocket(Conexion):
+    """Conexión del SelectorsEngine: estado de sesión + socket y buffers (es el data del selector)."""
+    __slots__ = ("sock", "addr", "decoder", "out", "eventos", "bloqueado", "cerrar", "roto")
+
+    def __init__(self, sock, addr):
+        super().__init__()
+        self.sock = sock
+        self.addr = addr
+        self.decoder = FrameDecoder()
+        self.out = bytearray()               # buffer de salida pendiente
+        self.eventos = selectors.EVENT_READ  # 0 = fuera del selector (pausado)
+        self.bloqueado = False               # out superó HIGH_WATERMARK (hasta bajar de LOW)
+        self.cerrar = False                  # cerrado lógico; si hay out pendiente se vacía antes
+        self.roto = False                    # falló una escritura, se limpia al final de la vuelta
+
+
+def rechazar(sock, linea):
+    """Contesta OCUPADO y cierra sin registrar la conexión (nunca bloquea)."""
+    try:
+        sock.setblocking(False)
+        sock.send(linea)
+        sock.shutdown(socket.SHUT_WR)
+        # si el hello del cliente queda sin leer, close() manda RST y puede
+        # pisar el OCUPADO antes de que el cliente lo lea
+        sock.recv(RECV_SIZE)
+    except OSError:
+        pass
+    sock.close()
+
+
+class SelectorsEngine:
+    """
+    Motor de I/O con selectors: sockets no bloqueantes, buffer de salida por
+    conexión vaciado con EVENT_WRITE y backpressure por watermarks.
+    Implementa el `transporte` que usa ProxySessions; cada socket se
+    registra con su ConexionSocket como data, así un evento llega directo al
+    objeto de la conexión sin buscarlo en ningún mapa.
+
+    SIGTERM drena: deja de aceptar, suelta lo que no está en sesión (ver
+    ProxySessions.drenar) y espera hasta `drenaje` segundos a que terminen
+    las sesiones; después las corta y run() vuelve. SIGUSR2 llama a
+    al_reiniciar() (reinicio en caliente, lo arma run_single). Los handlers
+    solo anotan el pedido: se atiende al final de la vuelta del loop.
+
+    El loop solo hace I/O no bloqueante de sockets: los logs van al hilo
+    escritor de bitacora.log y la escritura del snapshot de métricas a un pool
+    de hilos (descarga.Descarga) cuyo despertador está registrado en el mismo
+    selector. Cada vuelta se mide
+    (sin contar la espera en select) en turnos_proxy_loop_vuelta_segundos, y
+    la más larga de cada intervalo de volcado queda en
+    turnos_proxy_loop_bloqueo_max_segundos.
+    """
+    def __init__(self, sesiones, servers, from_turnos, canal_rx=None, canales_tx=(), drenaje=30.0):
+        self.sesiones = sesiones
+        sesiones.transporte = self
+        self.servers = servers
+        self.from_turnos = from_turnos
+        self.canal_rx = canal_rx        # datagramas de otros workers (con fds adjuntos)
+        self.canales_tx = canales_tx    # canales_tx[w] escribe en el canal_rx del worker w
+        self.drenaje = drenaje
+        self.limite_drenaje = None      # monotonic en que se cortan las sesiones (None = sin drenar)
+        self.cortadas = False
+        self.pedido = None              # "drenaje" | "reinicio", anotado por el handler de la señal
+        self.al_reiniciar = None
+
+        self.sel = selectors.DefaultSelector()
+        self.rotos = []     # conexiones con error de escritura, se limpian al final de cada vuelta
+        self.conexiones = 0
+        self.descarga = Descarga()
+        self.volcando = False           # hay un snapshot de métricas escribiéndose en el pool
+        self.vuelta = Histograma(BUCKETS_VUELTA)
+        self.bloqueo_max = 0.0          # vuelta más larga desde el último volcado
+        metricas = sesiones.metricas
+        metricas.valor("turnos_proxy_conexiones_activas", "Conexiones TCP abiertas", lambda: self.conexiones)
+        metricas.histograma("turnos_proxy_loop_vuelta_segundos",
+                            "Proceso por vuelta del event loop (sin la espera en select)", self.vuelta)
+        metricas.valor("turnos_proxy_loop_bloqueo_max_segundos",
+                       "Vuelta del event loop más larga en el último intervalo de volcado", lambda: self.bloqueo_max)
+        metricas.valor("turnos_proxy_descarga_en_vuelo", "Trabajos en el pool de descarga",
+                       lambda: self.descarga.en_vuelo)
+        metricas.valor("turnos_proxy_log_descartadas_total", "Eventos de log descartados con la salida saturada",
+                       lambda: log.descartados, tipo="counter")
+
+        for server in servers:
+            server.setblocking(False)
+            self.sel.register(server, selectors.EVENT_READ, data=None)
+        self.sel.register(from_turnos, selectors.EVENT_READ, data=TURNOS_PIPE)
+        self.sel.register(self.descarga, selectors.EVENT_READ, data=DESCARGA)
+        if canal_rx is not None:
+            canal_rx.setblocking(False)
+            self.sel.register(canal_rx, selectors.EVENT_READ, data=CANAL_WORKERS)
+        for tx in canales_tx:
+            tx.setblocking(False)
+
+    def registrar(self, conn, eventos):
+        anterior = conn.eventos
+        conn.eventos = eventos
+        if not anterior:
+            self.sel.register(conn.sock, eventos, conn)
+        elif eventos:
+            self.sel.modify(conn.sock, eventos, conn)
+        else:
+            # selectors no admite 0 eventos: se saca y se vuelve a registrar al reanudar
+            self.sel.unregister(conn.sock)
 
+    def actualizar_eventos(self, conn):
+        """Recalcula READ/WRITE según buffer de salida y backpressure propio y del peer."""
+        if conn.cerrar:
+            return
+        other = conn.peer
+        eventos = 0
+        if not conn.bloqueado and not (other is not None and other.bloqueado):
+            # un admin que multiplexa se frena si alguno de sus clientes está frenado
+            if not conn.atiende or not any(c.bloqueado for c in conn.atiende.values()):
+                eventos |= selectors.EVENT_READ
+        if conn.out:
+            eventos |= selectors.EVENT_WRITE
+        if eventos != conn.eventos:
+            self.registrar(conn, eventos)
+
+    peer_cambio = actualizar_eventos
+
+    def set_bloqueado(self, conn, valor):
+        if conn.bloqueado == valor:
+            return
+        conn.bloqueado = valor
+        self.actualizar_eventos(conn)
+        if conn.peer is not None:
+            self.actualizar_eventos(conn.peer)
+        elif conn.atiende:
+            for cliente in conn.atiende.values():
+                self.actualizar_eventos(cliente)
+
+    def enviar(self, conn, payload: bytes):
+        """
+        Escritura no bloqueante: intenta mandar ya y encola el resto en el buffer
+        de salida, que se vacía con EVENT_WRITE. Nunca bloquea el loop.
+        """
+        if conn.cerrar or conn.roto:
+            return
+        out = conn.out
+        if not out:
+            try:
+                n = conn.sock.send(payload)
+            except BlockingIOError:
+                n = 0
+            except OSError:
+                self.marcar_roto(conn)
+                return
+            payload = payload[n:]
+            if not payload:
+                return
+        out += payload
+        self.encolado(conn)
 
-def main():
-    parser = argparse.ArgumentParser(description="Proxy Server (selectors) - Turnos")
-    parser.add_argument("--host", default="localhost")
-    parser.add_argument("--port", type=int, default=5000)
-    parser.add_argument(
-        "--family",
-        choices=["ipv4", "ipv6", "dual"],
-        default="ipv4",
-        help="Familia IP del servidor: ipv4, ipv6 o dual (IPv6 + IPv4-mapped si el SO lo permite)"
-        )
-    args = parser.parse_args()
+    def enviar_partes(self, conn, partes):
+        """Como enviar(), pero manda las partes juntas con sendmsg sin concatenarlas."""
+        if conn.cerrar or conn.roto:
+            return
+        out = conn.out
+        if not out:
+            try:
+                n = conn.sock.sendmsg(partes)
+            except BlockingIOError:
+                n = 0
+            except OSError:
+                self.marcar_roto(conn)
+                return
+            if n == sum(map(len, partes)):
+                return
+            # envío parcial (socket lleno): lo que falta va al buffer
+            out += b"".join(partes)[n:]
+        else:
+            for parte in partes:
+                out += parte
+        self.encolado(conn)
 
-    q_to_turnos = Queue()
-    q_to_proxy = Queue()
-    q_to_db = Queue()
+    def encolado(self, conn):
+        if len(conn.out) > HIGH_WATERMARK:
+            self.set_bloqueado(conn, True)
+        self.actualizar_eventos(conn)
 
-    p_turnos = Process(target=run_turnos_service, args=(q_to_turnos, q_to_proxy), daemon=True)
-    p_db = Process(target=run_db_worker, args=(q_to_db,), daemon=True)
-    p_turnos.start()
-    p_db.start()
+    def flush(self, conn):
+        out = conn.out
+        try:
+            n = conn.sock.send(out)
+        except BlockingIOError:
+            return
+        except OSError:
+            if conn.cerrar:
+                self.cerrar(conn)
+            else:
+                self.marcar_roto(conn)
+            return
+        del out[:n]
 
-    sel = selectors.DefaultSelector()
+        if conn.cerrar:
+            if not out:
+                self.cerrar(conn)
+            return
+        if conn.bloqueado and len(out) < LOW_WATERMARK:
+            self.set_bloqueado(conn, False)
+        self.actualizar_eventos(conn)
+
+    def marcar_roto(self, conn):
+        conn.roto = True
+        conn.out.clear()
+        self.rotos.append(conn)
+
+    def cerrar(self, conn, vaciar=False):
+        """Cierra el socket; con vaciar=True espera a mandar lo pendiente en el buffer."""
+        if conn.sock is None:
+            return
+        conn.cerrar = True
+        if vaciar and conn.out and not conn.roto:
+            # solo queda escribir: no se lee más de este socket
+            self.registrar(conn, selectors.EVENT_WRITE)
+            return
+        self.soltar(conn)
 
-    sessions_lock = threading.Lock()
-    admin_state_lock = threading.Lock()
+    def abierta(self, conn):
+        return conn.sock is not None and not conn.cerrar and not conn.roto
 
-  
-    role_by_sock = {}       # sock -> "CLIENT" | "ADMIN"
-    id_by_sock = {}         # sock -> cliente_id o admin_id
-    sock_by_client_id = {}  # cliente_id -> sock
-    sock_by_admin_id = {}   # admin_id -> sock
+    def soltar(self, conn):
+        """Saca la conexión del selector y cierra el socket (en este proceso)."""
+        self.conexiones -= 1
+        if conn.eventos:
+            try:
+                self.sel.unregister(conn.sock)
+            except Exception:
+                pass
+        try:
+            conn.sock.close()
+        except Exception:
+            pass
+        conn.sock = None
 
-    client_meta = {}        # cliente_id -> {"nombre","tramite"}
-    admin_busy = set()      # admins ocupados (protegido por admin_state_lock)
+    def registrar_conn(self, sock, addr):
+        sock.setblocking(False)
+        conn = ConexionSocket(sock, addr)
+        self.sel.register(sock, selectors.EVENT_READ, data=conn)
+        self.conexiones += 1
+        self.sesiones.vigilar(conn)
+        return conn
 
-    peer = {}               # sock -> sock emparejado (cliente<->admin)
-    transcript = {}         
+    def accept(self, sock):
+        conn, addr = sock.accept()
+        ocupado = self.sesiones.admitir_conexion(addr, self.conexiones)
+        if ocupado is not None:
+            rechazar(conn, ocupado)
+            return
+        self.registrar_conn(conn, addr)
+        log.info("conexion", "Conexión entrante desde {addr}", addr=addr)
 
-    client_id_lock = threading.Lock()
-    client_id_counter = 0
+    # --- Canal entre workers (--workers N) ---
 
-    def log_session(admin_id, cliente_id, line):
-        key = (admin_id, cliente_id)
-        transcript.setdefault(key, []).append(line)
+    def transferir(self, conn, worker, msg):
+        return self.pasar(self.canales_tx[worker], conn, msg, f"al worker {worker}")
 
-    def close_socket(sock):
+    def pasar(self, canal, conn, msg, destino):
+        """
+        Pasa el socket de conn por canal (fd por SCM_RIGHTS) junto con lo que
+        quedó en sus buffers. Si sale bien, acá solo se suelta el fd: la
+        conexión sigue viva en el otro proceso.
+        """
+        msg = dict(msg, decoder=bytes(conn.decoder.buf), out=bytes(conn.out), addr=conn.addr)
         try:
-            sel.unregister(sock)
-        except Exception:
-            pass
-        try:
-            sock.close()
-        except Exception:
-            pass
+            socket.send_fds(canal, [pickle.dumps(msg)], [conn.sock.fileno()])
+        except OSError as e:
+            log.warning("transferencia_fallida", "No se pudo transferir {addr} {destino}: {error}",
+                        addr=conn.addr, destino=destino, error=str(e))
+            return False
 
-    def unpair(sock, reason_msg=None):
-        """Rompe una sesión si existe y libera admin."""
-        with sessions_lock:
-            other = peer.pop(sock, None)
-            if other:
-                peer.pop(other, None)
+        conn.cerrar = True
+        self.soltar(conn)
+        return True
 
+    def avisar_worker(self, worker, msg):
+        try:
+            self.canales_tx[worker].send(pickle.dumps(msg))
+        except OSError as e:
+            log.warning("aviso_worker_fallido", "No se pudo avisar al worker {worker}: {error}",
+                        worker=worker, error=str(e))
 
-        if other and reason_msg:
+    def drain_canal(self):
+        while True:
             try:
-                other.sendall((reason_msg + "\n").encode())
-            except Exception:
-                pass
-
-        admin_id = None
-        cliente_id = None
-        with sessions_lock:
-            if sock in role_by_sock and role_by_sock.get(sock) == "ADMIN":
-                admin_id = id_by_sock.get(sock)
-            if other in role_by_sock and role_by_sock.get(other) == "ADMIN":
-                admin_id = id_by_sock.get(other)
-            if sock in role_by_sock and role_by_sock.get(sock) == "CLIENT":
-                cliente_id = id_by_sock.get(sock)
-            if other in role_by_sock and role_by_sock.get(other) == "CLIENT":
-                cliente_id = id_by_sock.get(other)
-
-        if admin_id and cliente_id:
-
-            lines = transcript.pop((admin_id, cliente_id), [])
-            meta = client_meta.get(cliente_id, {})
-            tramite = meta.get("tramite", "desconocido")
-            prioridad = PRIORIDADES.get(tramite, 3)
-            q_to_db.put({
-                "cliente_id": str(cliente_id),
-                "nombre": meta.get("nombre", "Desconocido"),
-                "tramite": tramite,
-                "prioridad": int(prioridad),
-                "admin_id": str(admin_id),
-                "conversacion": "\n".join(lines) if lines else None
-            })
-
-        if admin_id:
-            with admin_state_lock:
-                admin_busy.discard(admin_id)
-
-            if admin_id in sock_by_admin_id and sock_by_admin_id[admin_id]:
-                q_to_turnos.put({"type": "ADMIN_READY", "admin_id": admin_id})
-
-    def accept(sock):
-        conn, addr = sock.accept()
-        conn.setblocking(False)
-        sel.register(conn, selectors.EVENT_READ, data={"addr": addr, "buf": ""})
-        print(f"[PROXY] Conexión entrante desde {addr}")
-
-    def handle_read(conn, data):
-        nonlocal client_id_counter
+                raw, fds, _flags, _addr = socket.recv_fds(self.canal_rx, MAX_MSG_WORKER, 1)
+            except BlockingIOError:
+                return
+            msg = pickle.loads(raw)
+            conn = None
+            if fds:
+                conn = self.registrar_conn(socket.socket(fileno=fds[0]), msg["addr"])
+                conn.decoder.buf += msg["decoder"]
+                if msg["out"]:
+                    self.enviar(conn, msg["out"])
+            self.sesiones.handle_worker_msg(msg, conn)
+
+    def handle_read(self, conn):
         try:
-            chunk = conn.recv(1024)
+            chunk = conn.sock.recv(RECV_SIZE)
         except BlockingIOError:
             return
         except Exception:
-            unpair(conn, reason_msg="El otro extremo se desconectó.")
-            cleanup_conn(conn)
+            self.sesiones.desconectado(conn)
             return
 
         if not chunk:
-            unpair(conn, reason_msg="El otro extremo se desconectó.")
-            cleanup_conn(conn)
+            self.sesiones.desconectado(conn)
             return
 
-        msg = chunk.decode(errors="ignore")
-        if conn not in role_by_sock:
-            parsed = parse_hello(msg)
-            if not parsed:
-                data["buf"] += msg
-                parsed = parse_hello(data["buf"])
-                if not parsed:
-                    return
-
-            if parsed["type"] == "ADMIN_LOGIN":
-                admin_id = parsed["admin_id"]
-                with sessions_lock:
-                    role_by_sock[conn] = "ADMIN"
-                    id_by_sock[conn] = admin_id
-                    sock_by_admin_id[admin_id] = conn
-
-                print(f"[PROXY] Admin {admin_id} conectado")
-                conn.sendall(f"--- ADMIN {admin_id} CONECTADO ---\nEsperando turnos...\n".encode())
-
-                q_to_turnos.put({"type": "ADMIN_READY", "admin_id": admin_id})
-                return
-
-            if parsed["type"] == "CLIENT_HELLO":
-                nombre = parsed["nombre"]
-                tramite = parsed["tramite"]
-                with client_id_lock:
-                    client_id_counter += 1
-                    cliente_id = str(client_id_counter)
-
-                with sessions_lock:
-                    role_by_sock[conn] = "CLIENT"
-                    id_by_sock[conn] = cliente_id
-                    sock_by_client_id[cliente_id] = conn
-                    client_meta[cliente_id] = {"nombre": nombre, "tramite": tramite}
-
-                conn.sendall(build_client_id(cliente_id).encode())
-                conn.sendall("Esperando a ser atendido por un administrativo...\n".encode())
-                print(f"[PROXY] Turno recibido Cliente {cliente_id} ({nombre}) trámite={tramite}")
-
-                q_to_turnos.put({
-                    "type": "NEW_TURNO",
-                    "cliente_id": cliente_id,
-                    "nombre": nombre,
-                    "tramite": tramite
-                })
-                return
+        try:
+            frames = conn.decoder.feed_crudo(chunk)
+        except FrameError as e:
+            log.warning("trama_invalida", "Cerrando {addr}: {error}", addr=conn.addr, error=str(e))
+            self.sesiones.desconectado(conn)
+            return
 
-        with sessions_lock:
-            dst = peer.get(conn)
+        for frame in frames:
+            self.sesiones.handle_frame(conn, frame)
+            if conn.cerrar or conn.roto:
+                # el frame cerró la conexión (FIN de cliente, error de relay)
+                break
 
-        if not dst:
+    def drain_turnos(self):
+        """Procesa los lotes que el Turnos Service haya mandado por el pipe (ipc.LectorEventos)."""
+        try:
+            for evt in self.from_turnos.leer():
+                self.sesiones.handle_turnos_event(evt)
+        except (EOFError, OSError):
+            log.error("canal_turnos_cerrado", "Se cerró el canal con Turnos Service")
             try:
-                conn.sendall("[Aún no estás emparejado. Esperá...]\n".encode())
+                self.sel.unregister(self.from_turnos)
             except Exception:
                 pass
-            return
 
-                # Log y relay (con prefijo + FIN correcto)
-        with sessions_lock:
-            src_role = role_by_sock.get(conn)
-            src_id = id_by_sock.get(conn)
-            dst_id = id_by_sock.get(dst)
+    # --- Drenaje y reinicio en caliente ---
 
-        clean = msg.strip()
+    def pedir(self, pedido):
+        """Desde un handler de señal: solo se anota."""
+        self.pedido = self.pedido or pedido
 
-        if clean.upper() == "FIN":
-            try:
-                conn.sendall("FIN\n".encode())
-            except Exception:
-                pass
+    def atender_pedido(self):
+        pedido, self.pedido = self.pedido, None
+        if self.limite_drenaje is not None:
+            return
+        if pedido == "reinicio":
+            if self.al_reiniciar is None:
+                log.warning("reinicio_no_soportado", "Reinicio en caliente solo con --engine selectors y --workers 1")
+            else:
+                self.al_reiniciar()
+            return
+        log.info("drenaje", "SIGTERM: drenando hasta {plazo:g} s", plazo=self.drenaje)
+        self.empezar_drenaje()
+
+    def dejar_de_aceptar(self):
+        for server in self.servers:
             try:
-                dst.sendall("FIN\n".encode())
-            except Exception:
+                self.sel.unregister(server)
+            except (KeyError, ValueError):
                 pass
 
-            unpair(conn, reason_msg=None)
-
-            with sessions_lock:
-                role_conn = role_by_sock.get(conn)
-                role_dst = role_by_sock.get(dst)
+    def empezar_drenaje(self, entregar=None):
+        self.dejar_de_aceptar()
+        self.limite_drenaje = time.monotonic() + self.drenaje
+        sin_hello = [key.data for key in self.sel.get_map().values()
+                     if isinstance(key.data, ConexionSocket) and key.data.rol is None]
+        self.sesiones.drenar(sin_hello, entregar)
+
+    def drenado(self, ahora):
+        """True cuando ya no queda nada (o venció el plazo y pasó la gracia para vaciar buffers)."""
+        if not self.conexiones:
+            return True
+        if ahora < self.limite_drenaje:
+            return False
+        if self.cortadas:
+            return True
+        self.cortadas = True
+        log.warning("drenaje_vencido", "Venció el drenaje: se cortan {sesiones} sesiones",
+                    sesiones=self.sesiones.cortar_sesiones())
+        self.limite_drenaje = ahora + GRACIA_CIERRE
+        return False
+
+    def volcar_metricas(self):
+        """Renderiza acá (lee el estado del loop) y escribe el archivo en el pool."""
+        texto = self.sesiones.metricas.volcado()
+        if texto is None:
+            return
+        self.bloqueo_max = 0.0
+        if self.volcando:
+            # el anterior sigue escribiendo (disco lento): este snapshot se saltea
+            return
+        self.volcando = self.descarga.descargar(self.sesiones.metricas.escribir_volcado, texto,
+                                                listo=self.volcado_escrito)
 
-            if role_conn == "CLIENT":
-                cleanup_conn(conn)
-            elif role_dst == "CLIENT":
-                cleanup_conn(dst)
+    def volcado_escrito(self, _futuro):
+        self.volcando = False
 
-            return
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda *_: self.pedir("drenaje"))
+        signal.signal(signal.SIGUSR2, lambda *_: self.pedir("reinicio"))
+        try:
+            self.loop()
+        finally:
+            self.descarga.cerrar()
 
-        if src_role == "ADMIN":
-            admin_id = src_id
-            cliente_id = dst_id
-            out = f"Admin {admin_id}: {clean}\n"
-        else:
-            cliente_id = src_id
-            admin_id = dst_id
-            out = f"Cliente {cliente_id}: {clean}\n"
+    def loop(self):
+        while True:
+            # con timeout para volcar métricas aunque no haya tráfico
+            events = self.sel.select(INTERVALO_VOLCADO)
+            inicio = time.monotonic()
+            for key, mask in events:
+                conn = key.data
+                if conn is None:
+                    self.accept(key.fileobj)
+                    continue
+                if conn is TURNOS_PIPE:
+                    self.drain_turnos()
+                    continue
+                if conn is CANAL_WORKERS:
+                    self.drain_canal()
+                    continue
+                if conn is DESCARGA:
+                    self.descarga.completar()
+                    continue
+                if conn.roto or conn.sock is None:
+                    # cerrado por un evento anterior de esta misma vuelta
+                    continue
+                if mask & selectors.EVENT_WRITE:
+                    self.flush(conn)
+                if mask & selectors.EVENT_READ and not (conn.cerrar or conn.roto):
+                    self.handle_read(conn)
+
+            while self.rotos:
+                self.sesiones.desconectado(self.rotos.pop())
+
+            ahora = time.monotonic()
+            self.sesiones.vencer(ahora)
+            if self.pedido:
+                self.atender_pedido()
+            # los eventos de toda la vuelta van a Turnos en un solo lote
+            self.sesiones.q_to_turnos.flush()
+            self.volcar_metricas()
+            if self.limite_drenaje is not None and self.drenado(ahora):
+                return
 
-        # guardar transcript con lo mismo que se muestra
-        log_session(admin_id, cliente_id, out.strip())
+            vuelta = time.monotonic() - inicio
+            self.vuelta.observar(vuelta)
+            if vuelta > self.bloqueo_max:
+                self.bloqueo_max = vuelta
 
-        # reenviar con etiqueta
+    def close(self):
+        self.descarga.cerrar()
         try:
-            dst.sendall(out.encode())
+            self.sel.close()
         except Exception:
-            unpair(conn, reason_msg="El otro extremo se desconectó.")
-            cleanup_conn(dst)
-            cleanup_conn(conn)
-            return
+            pass
+
 
-    def cleanup_conn(conn):
-        # remover de maps
-        with sessions_lock:
-            r = role_by_sock.pop(conn, None)
-            ident = id_by_sock.pop(conn, None)
-
-        if r == "CLIENT" and ident:
-            with sessions_lock:
-                sock_by_client_id.pop(ident, None)
-                client_meta.pop(ident, None)
-        if r == "ADMIN" and ident:
-            with sessions_lock:
-                sock_by_admin_id.pop(ident, None)
-            with admin_state_lock:
-                admin_busy.discard(ident)
-            q_to_turnos.put({"type": "ADMIN_DISCONNECTED", "admin_id": ident})
-
-        close_socket(conn)
-
-    # Server sockets (IPv4 + IPv6 separados)
+def crear_servidores(args, reuse_port=False):
+    """
+    Sockets de escucha (IPv4 + IPv6 separados) según --family.
+    Con reuse_port cada worker abre los suyos en el mismo puerto y el kernel
+    reparte las conexiones entrantes entre ellos (SO_REUSEPORT).
+    """
     servers = []
 
     # IPv4
     if args.family in ("ipv4", "dual"):
         server_v4 = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server_v4.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            server_v4.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
         host_v4 = args.host if args.host not in ("localhost", "::") else "0.0.0.0"
         server_v4.bind((host_v4, args.port))
 
         server_v4.listen()
-        server_v4.setblocking(False)
-        sel.register(server_v4, selectors.EVENT_READ, data=None)
         servers.append(server_v4)
 
     # IPv6
     if args.family in ("ipv6", "dual"):
         server_v6 = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
         server_v6.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            server_v6.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
         try:
             server_v6.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
@@ -301,89 +545,424 @@ def main():
         server_v6.bind((host_v6, args.port, 0, 0))
 
         server_v6.listen()
-        server_v6.setblocking(False)
-        sel.register(server_v6, selectors.EVENT_READ, data=None)
         servers.append(server_v6)
 
-    print(f"[PROXY] Escuchando en puerto {args.port} (family={args.family})")
+    return servers
 
-    try:
-        while True:
-            while True:
-                try:
-                    evt = q_to_proxy.get_nowait()
-                except Exception:
-                    break
-
-                if evt.get("type") == "ASSIGN":
-                    admin_id = evt["admin_id"]
-                    cliente_id = evt["cliente_id"]
-                    tramite = evt["tramite"]
-                    nombre = evt["nombre"]
-
-                    with sessions_lock:
-                        admin_sock = sock_by_admin_id.get(admin_id)
-                        client_sock = sock_by_client_id.get(cliente_id)
-
-                    if not admin_sock or not client_sock:
-                        if admin_sock:
-                            q_to_turnos.put({"type": "ADMIN_READY", "admin_id": admin_id})
-                        continue
-
-                    with admin_state_lock:
-                        if admin_id in admin_busy:
-                            q_to_turnos.put({"type": "ADMIN_READY", "admin_id": admin_id})
-                            continue
-                        admin_busy.add(admin_id)
-
-                    with sessions_lock:
-                        peer[admin_sock] = client_sock
-                        peer[client_sock] = admin_sock
-
-                    print(f"[PROXY] Emparejado Admin {admin_id} <-> Cliente {cliente_id} ({nombre})")
-
-                    try:
-                        admin_sock.sendall(
-                            f"Atendiendo a Cliente {cliente_id} ({nombre}) - Trámite: {tramite}\n".encode()
-                        )
-                        client_sock.sendall(
-                            f"Usted está siendo atendido por el administrativo {admin_id}. Puede comenzar a conversar.\n".encode()
-                        )
-                    except Exception:
-                        unpair(admin_sock, reason_msg="Error iniciando conversación.")
-                        cleanup_conn(admin_sock)
-                        cleanup_conn(client_sock)
-
-            events = sel.select(timeout=0.2)
-            for key, mask in events:
-                if key.data is None:
-                    accept(key.fileobj)
-                else:
-                    handle_read(key.fileobj, key.data)
 
-    except KeyboardInterrupt:
-        print("\n[PROXY] Deteniendo...")
-    finally:
-        try:
-            q_to_turnos.put(None)
-            q_to_db.put(None)
-        except Exception:
-            pass
-        try:
-            p_turnos.terminate()
-            p_db.terminate()
-        except Exception:
-            pass
+def cerrar_servidores(servers):
+    for s in servers:
         try:
-            sel.close()
+            s.close()
         except Exception:
             pass
-        for s in servers:
-            try:
-                s.close()
-            except Exception:
-                pass
+
+
+def imprimir_espera(sesiones):
+    espera = sesiones.espera_emparejamiento
+    log.info("espera_emparejamiento", "Espera NEW_TURNO -> emparejamiento: {resumen}\n{histograma}",
+             resumen=espera.resumen(), histograma=espera.formatear(), n=espera.count,
+             p50=espera.percentil(0.5), p99=espera.percentil(0.99), max=espera.max)
+
+
+def run_proxy_worker(worker_id, workers, args, a_turnos, from_turnos, q_to_db, canal_rx, canales_tx,
+                     metricas_dir=None, opciones_sesion=None, opciones_log=None):
+    """Proceso worker (--workers N): sus propios sockets de escucha con SO_REUSEPORT."""
+    log.configurar(f"proxy-{worker_id}", etiqueta=f"PROXY w{worker_id}", **(opciones_log or {}))
+    log.arrancar()
+    q_to_turnos = CanalEventos(a_turnos, bloqueante=False)
+    sesiones = ProxySessions(q_to_turnos, q_to_db, worker_id=worker_id, workers=workers, **(opciones_sesion or {}))
+    if metricas_dir:
+        sesiones.metricas.exportar(metricas_dir, f"proxy-{worker_id}")
+    servers = crear_servidores(args, reuse_port=True)
+    engine = SelectorsEngine(sesiones, servers, from_turnos, canal_rx=canal_rx, canales_tx=canales_tx,
+                             drenaje=args.drenaje)
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        imprimir_espera(sesiones)
+        engine.close()
+        cerrar_servidores(servers)
+        log.cerrar()
+
+
+def run_workers(args, eventos, pipes, q_to_db, p_turnos, p_db, metricas_dir=None, opciones_sesion=None,
+                opciones_log=None):
+    # Un canal AF_UNIX de datagramas por worker: todos escriben en el extremo
+    # tx del worker destino y solo él lee del rx (mensajes atómicos + fds).
+    canales = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM) for _ in range(args.workers)]
+    canales_tx = [tx for _, tx in canales]
+
+    procesos = []
+    for w in range(args.workers):
+        p = Process(
+            target=run_proxy_worker,
+            args=(w, args.workers, args, eventos[w][1], pipes[w][0], q_to_db, canales[w][0], canales_tx,
+                  metricas_dir, opciones_sesion, opciones_log),
+            daemon=True,
+        )
+        p.start()
+        procesos.append(p)
+    # ya no hay más fork: desde acá este proceso también loguea desde el hilo escritor
+    log.arrancar()
+
+    log.info("escuchando", "Escuchando en puerto {port} (family={family}, workers={workers})",
+             port=args.port, family=args.family, workers=args.workers)
+
+    def reenviar_sigterm(*_):
+        # cada worker drena por su cuenta; acá solo se espera a que terminen
+        log.info("drenaje", "SIGTERM: drenando {workers} workers hasta {plazo:g} s",
+                 workers=args.workers, plazo=args.drenaje)
+        for p in procesos:
+            if p.is_alive():
+                os.kill(p.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, reenviar_sigterm)
+    signal.signal(signal.SIGUSR2, lambda *_: log.warning("reinicio_no_soportado",
+                                                         "Reinicio en caliente solo con --workers 1"))
+
+    try:
+        for p in procesos:
+            p.join()
+    except KeyboardInterrupt:
+        log.info("deteniendo", "Deteniendo...")
+        # con Ctrl+C en la terminal ya les llegó SIGINT; si no (kill al pid), se reenvía
+        for p in procesos:
+            p.join(0.5)
+            if p.is_alive():
+                os.kill(p.pid, signal.SIGINT)
+        for p in procesos:
+            p.join(5)
+    finally:
+        for p in procesos:
+            if p.is_alive():
+                p.terminate()
+        # los workers ya no escriben: el FIN va por el canal del worker 0
+        detener_servicios(CanalEventos(eventos[0][1]), q_to_db, p_turnos, p_db)
+
+
+def detener_servicios(q_to_turnos, q_to_db, p_turnos, p_db):
+    """
+    FIN a Turnos y None al DB Worker, y se espera a que terminen: Turnos
+    cierra el journal y el DB Worker escribe lo que le quedaba en la cola.
+    Solo si no terminan en ESPERA_SERVICIOS se los mata.
+    """
+    try:
+        q_to_turnos.cerrar()
+        q_to_db.put(None)
+    except Exception:
+        pass
+    limite = time.monotonic() + ESPERA_SERVICIOS
+    for p in (p_turnos, p_db):
+        p.join(max(0.0, limite - time.monotonic()))
+        if p.is_alive():
+            log.error("servicio_colgado", "{proceso} no terminó en {espera:g} s: se lo mata",
+                      proceso=p.name, espera=ESPERA_SERVICIOS)
+            p.terminate()
+
+
+def reiniciar_en_caliente(argv, engine, servers, q_to_turnos, p_turnos, metricas_http=None):
+    """
+    SIGUSR2: arranca otro proxy con los mismos argumentos y le pasa los
+    sockets de escucha (y el de /metrics) por SCM_RIGHTS, así el puerto nunca
+    queda cerrado: lo que llega mientras tanto espera en el backlog. Antes se
+    detiene el Turnos Service de este proceso, para que el nuevo arranque del
+    journal ya cerrado. Después este proceso drena entregándole al nuevo las
+    conexiones sin sesión y cada admin que termina la suya.
+
+    Lo que este proceso le mande a Turnos desde acá (ADMIN_DISCONNECTED de
+    admins en sesión, CLIENTE_DESCONECTADO si una entrega falla) se descarta
+    con log (ver CanalEventos): el Turnos nuevo no conoce a esos admins y
+    tiene a esos clientes como ausentes desde el journal. Su DB Worker sigue
+    escribiendo las sesiones que terminan, en paralelo con el del proceso
+    nuevo: WAL + busy_timeout (db.PRAGMAS_WRITER) serializan los commits.
+    """
+    control, extremo = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        nuevo = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), *argv, "--heredar", str(extremo.fileno())],
+            pass_fds=(extremo.fileno(),),
+        )
+    except OSError as e:
+        log.error("reinicio_fallido", "No se pudo arrancar el proceso nuevo: {error}", error=str(e))
+        control.close()
+        extremo.close()
+        return
+    extremo.close()
+    log.info("reinicio", "Reinicio en caliente: proceso nuevo pid={pid}", pid=nuevo.pid)
+
+    engine.dejar_de_aceptar()
+    q_to_turnos.cerrar()
+    p_turnos.join(ESPERA_SERVICIOS)
+
+    fds = [server.fileno() for server in servers]
+    if metricas_http is not None:
+        fds.append(metricas_http.socket.fileno())
+    control.settimeout(ESPERA_REINICIO)
+    try:
+        socket.send_fds(control, [pickle.dumps({"type": "ESCUCHA", "servidores": len(servers)})], fds)
+    except OSError as e:
+        log.error("reinicio_fallido", "No se pudieron pasar los sockets de escucha: {error}; se apaga drenando",
+                  error=str(e))
+        engine.empezar_drenaje()
+        return
+
+    cerrar_servidores(servers)
+    if metricas_http is not None:
+        threading.Thread(target=cerrar_http, args=(metricas_http,), daemon=True).start()
+    engine.empezar_drenaje(entregar=lambda conn, msg: engine.pasar(control, conn, msg, "al proceso nuevo"))
+
+
+def cerrar_http(servidor):
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def recibir_escucha(fd):
+    """
+    Proceso nuevo de un reinicio en caliente: espera los sockets de escucha
+    del anterior. Devuelve (control, servers, socket de /metrics o None);
+    por control siguen llegando las conexiones que el anterior entrega.
+    """
+    control = socket.socket(fileno=fd)
+    control.settimeout(ESPERA_REINICIO)
+    raw, fds, _flags, _addr = socket.recv_fds(control, MAX_MSG_WORKER, 8)
+    msg = pickle.loads(raw)
+    socks = [socket.socket(fileno=f) for f in fds]
+    n = msg["servidores"]
+    return control, socks[:n], (socks[n] if len(socks) > n else None)
+
+
+def argv_sin_heredar(argv):
+    """argv para el próximo reinicio: sin el --heredar de este."""
+    limpio = []
+    saltar = False
+    for arg in argv:
+        if saltar:
+            saltar = False
+        elif arg == "--heredar":
+            saltar = True
+        elif not arg.startswith("--heredar="):
+            limpio.append(arg)
+    return limpio
+
+
+def run_single(args, a_turnos, from_turnos, q_to_db, p_turnos, p_db, metricas_dir=None, opciones_sesion=None,
+               heredado=None, metricas_http=None):
+    """
+    Un solo proceso proxy (selectors o asyncio) en este mismo proceso.
+    heredado = (control, servers) si este proceso viene de un reinicio en caliente.
+    """
+    q_to_turnos = CanalEventos(a_turnos, bloqueante=False)
+    sesiones = ProxySessions(q_to_turnos, q_to_db, **(opciones_sesion or {}))
+    if metricas_dir:
+        sesiones.metricas.exportar(metricas_dir, "proxy-0")
+    control, servers = heredado or (None, crear_servidores(args))
+
+    if args.engine == "asyncio":
+        from proxy_asyncio import AsyncioEngine
+        engine = AsyncioEngine(sesiones, servers, from_turnos, usar_uvloop=not args.no_uvloop, drenaje=args.drenaje)
+    else:
+        engine = SelectorsEngine(sesiones, servers, from_turnos, canal_rx=control, drenaje=args.drenaje)
+        argv = argv_sin_heredar(sys.argv[1:])
+        engine.al_reiniciar = lambda: reiniciar_en_caliente(argv, engine, servers, q_to_turnos, p_turnos,
+                                                            metricas_http)
+
+    # Turnos y el DB Worker ya arrancaron: desde acá se loguea desde el hilo escritor
+    log.arrancar()
+    log.info("escuchando", "Escuchando en puerto {port} (family={family}, engine={engine})",
+             port=args.port, family=args.family, engine=args.engine)
+
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        log.info("deteniendo", "Deteniendo...")
+    finally:
+        imprimir_espera(sesiones)
+        detener_servicios(q_to_turnos, q_to_db, p_turnos, p_db)
+        engine.close()
+        cerrar_servidores(servers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Proxy Server - Turnos")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument(
+        "--family",
+        choices=["ipv4", "ipv6", "dual"],
+        default="ipv4",
+        help="Familia IP del servidor: ipv4, ipv6 o dual (IPv6 + IPv4-mapped si el SO lo permite)"
+        )
+    parser.add_argument(
+        "--engine",
+        choices=["selectors", "asyncio"],
+        default="selectors",
+        help="Motor de I/O: selectors (event loop propio) o asyncio (streams)"
+    )
+    parser.add_argument(
+        "--no-uvloop",
+        action="store_true",
+        help="Con --engine asyncio, no usar uvloop aunque esté instalado"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Procesos proxy en el mismo puerto (SO_REUSEPORT), con un único Turnos Service"
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="Puerto HTTP para /metrics en formato Prometheus (0 = deshabilitado)"
+    )
+    parser.add_argument("--metrics-host", default="127.0.0.1")
+    parser.add_argument("--max-conexiones", type=int, default=0, help="Conexiones abiertas a la vez (0 = sin límite)")
+    parser.add_argument(
+        "--max-cola",
+        type=parse_max_cola,
+        default={},
+        help="Clientes esperando por trámite: N para todos, o pago=50,consulta=500 (default: sin límite)"
+    )
+    parser.add_argument("--tasa-ip", type=float, default=0.0, help="Conexiones nuevas por segundo por IP (0 = sin límite)")
+    parser.add_argument("--rafaga-ip", type=int, default=0, help="Ráfaga del límite por IP (default: --tasa-ip)")
+    parser.add_argument("--reintento", type=int, default=5, help="Segundos sugeridos al cliente rechazado por OCUPADO")
+    parser.add_argument(
+        "--latido",
+        type=float,
+        default=30.0,
+        help="Segundos de silencio antes de mandar PING a una conexión (0 = sin timeouts)"
+    )
+    parser.add_argument("--espera-pong", type=float, default=15.0, help="Segundos para contestar un PING antes de cortar")
+    parser.add_argument(
+        "--sesion-inactiva",
+        type=float,
+        default=600.0,
+        help="Segundos sin mensajes tras los que se cierra una sesión cliente-admin (0 = sin límite)"
+    )
+    parser.add_argument(
+        "--drenaje",
+        type=float,
+        default=30.0,
+        help="Con SIGTERM (o SIGUSR2), segundos que se espera a que terminen las sesiones en curso"
+    )
+    parser.add_argument(
+        "--politica",
+        type=parse_politica,
+        default="aging",
+        help=f"Orden de atención: {', '.join(POLITICAS)}, con parámetros como aging:30, estricta:600, "
+             "wfq:pago=3,consulta=1, edf:pago=300 o sest:pago=180 (ver politicas.py)"
+    )
+    parser.add_argument("--log-nivel", type=str.upper, choices=NIVELES, default="INFO", help="Nivel mínimo de log")
+    parser.add_argument(
+        "--log-formato",
+        choices=["json", "texto"],
+        default="json",
+        help="Formato del log en stdout: json (una línea por evento) o texto (los archivos son siempre JSON)"
+    )
+    parser.add_argument(
+        "--log-muestreo",
+        type=parse_muestreo,
+        default={},
+        help="Escribir uno de cada N eventos de un tipo: conexion=10,desconexion=10 (default: todos)"
+    )
+    parser.add_argument("--log-dir", default=None, help="Directorio para un log JSON rotado por proceso (proxy-0.log, ...)")
+    parser.add_argument(
+        "--log-control",
+        default=os.path.join(DATA_DIR, "log_control.json"),
+        help="Archivo JSON ({\"nivel\": ..., \"muestreo\": {...}}) que cambia nivel y muestreo en caliente"
+    )
+    # fd del canal con el proceso anterior en un reinicio en caliente (lo agrega el proxy)
+    parser.add_argument("--heredar", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers debe ser >= 1")
+    if args.workers > 1 and args.engine != "selectors":
+        parser.error("--workers > 1 solo está soportado con --engine selectors")
+
+    # el hilo escritor arranca recién después de los fork (ver run_single / run_workers)
+    opciones_log = {
+        "nivel": args.log_nivel,
+        "formato": args.log_formato,
+        "muestreo": args.log_muestreo,
+        "directorio": args.log_dir,
+        "control": args.log_control,
+    }
+    log.configurar("proxy-0" if args.workers == 1 else "proxy", etiqueta="PROXY", **opciones_log)
+
+    # reinicio en caliente: los sockets de escucha vienen del proceso anterior,
+    # que ya cerró el journal (recién ahora se puede leer)
+    heredado = None
+    sock_metricas = None
+    if args.heredar is not None:
+        control, servers, sock_metricas = recibir_escucha(args.heredar)
+        heredado = (control, servers)
+        log.info("escucha_heredada", "Sockets de escucha recibidos del proceso anterior")
+
+    # cada proceso vuelca sus métricas en este directorio y el HTTP las junta
+    metricas_dir = None
+    metricas_http = None
+    if args.metrics_port:
+        metricas_dir = tempfile.mkdtemp(prefix="turnos_metricas_")
+        metricas_http = servir_metricas(metricas_dir, args.metrics_host, args.metrics_port, sock=sock_metricas)
+        log.info("metricas", "Métricas en http://{host}:{port}/metrics", host=args.metrics_host, port=args.metrics_port)
+
+    # Cola persistida (journal en DATA_DIR): se lee una vez acá; Turnos la
+    # reconstruye y las sesiones siguen numerando clientes desde el último id.
+    estado = cargar_estado(DATA_DIR)
+    if args.politica.nombre == "sest":
+        args.politica.historial(DB_PATH)
+    opciones_sesion = {
+        "clave_token": cargar_clave(DATA_DIR),
+        "ultimo_cliente_id": estado.ultimo_cliente_id,
+        "latido": args.latido,
+        "espera_pong": args.espera_pong,
+        "sesion_inactiva": args.sesion_inactiva,
+        "prioridades": args.politica.prioridades,
+    }
+    if args.max_conexiones or args.max_cola or args.tasa_ip:
+        opciones_sesion["admision"] = Admision(
+            max_conexiones=args.max_conexiones,
+            max_cola=args.max_cola,
+            tasa_ip=args.tasa_ip,
+            rafaga_ip=args.rafaga_ip,
+            reintento_s=args.reintento,
+            workers=args.workers,
+        )
+
+    # Proxy <-> Turnos: un canal de eventos binarios por worker en cada
+    # sentido (ver ipc.py); al DB Worker los registros van por una Queue.
+    eventos = [canal_eventos() for _ in range(args.workers)]
+    pipes = [canal_eventos() for _ in range(args.workers)]
+    q_to_db = Queue()
+
+    p_turnos = Process(
+        name="Turnos Service",
+        target=run_turnos_service,
+        args=([rx for rx, _ in eventos], [tx for _, tx in pipes]),
+        kwargs={"metricas_dir": metricas_dir, "datos_dir": DATA_DIR, "estado": estado, "opciones_log": opciones_log,
+                "politica": args.politica},
+        daemon=True,
+    )
+    p_db = Process(name="DB Worker", target=run_db_worker, args=(q_to_db,),
+                   kwargs={"metricas_dir": metricas_dir, "opciones_log": opciones_log}, daemon=True)
+    p_turnos.start()
+    p_db.start()
+
+    try:
+        if args.workers > 1:
+            run_workers(args, eventos, pipes, q_to_db, p_turnos, p_db, metricas_dir, opciones_sesion, opciones_log)
+        else:
+            run_single(args, eventos[0][1], pipes[0][0], q_to_db, p_turnos, p_db, metricas_dir, opciones_sesion,
+                       heredado=heredado, metricas_http=metricas_http)
+    finally:
+        log.cerrar()
+        if metricas_dir:
+            shutil.rmtree(metricas_dir, ignore_errors=True)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
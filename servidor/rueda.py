@@ -0,0 +1,80 @@
+# servidor/rueda.py
+
+
+class RuedaTiempos:
+    """
+    Rueda de tiempos jerárquica para vencimientos con resolución de un tick.
+
+    `niveles` ruedas de `ranuras` ranuras (potencia de 2): el nivel k cubre
+    ranuras**(k+1) ticks hacia adelante. agregar() cuelga el ítem en la ranura
+    de su tick de vencimiento en el nivel más bajo que lo alcanza, O(1).
+    avanzar() recorre solo la ranura del tick actual del nivel 0; cuando el
+    nivel 0 da la vuelta baja a los niveles inferiores la ranura que toca del
+    siguiente (cada ítem baja a lo sumo `niveles` veces). Lo que queda más
+    lejos que el último nivel vuelve a colgarse ahí hasta que le toque.
+
+    No hay baja: quien agrega decide al vencer si el ítem sigue vigente (y
+    lo vuelve a agregar si hace falta). Así una conexión activa no toca la
+    rueda por cada frame, solo una vez por vencimiento.
+    """
+    def __init__(self, resolucion=1.0, ranuras=64, niveles=3, ahora=0.0):
+        if ranuras & (ranuras - 1):
+            raise ValueError("ranuras tiene que ser potencia de 2")
+        self.resolucion = resolucion
+        self.bits = ranuras.bit_length() - 1
+        self.mascara = ranuras - 1
+        self.ruedas = [[[] for _ in range(ranuras)] for _ in range(niveles)]
+        self.tick = int(ahora / resolucion)
+        self.pendientes = 0
+
+    def __len__(self):
+        return self.pendientes
+
+    def agregar(self, vence, item):
+        """Cuelga item para que avanzar() lo devuelva a partir de `vence` (mismo reloj que ahora)."""
+        tick = -int(-vence // self.resolucion)    # redondeo hacia arriba: nunca antes de tiempo
+        self._colgar(max(tick, self.tick + 1), item)
+        self.pendientes += 1
+
+    def _colgar(self, tick, item):
+        delta = tick - self.tick
+        ultimo = len(self.ruedas) - 1
+        for nivel, rueda in enumerate(self.ruedas):
+            if delta >> (self.bits * (nivel + 1)) == 0 or nivel == ultimo:
+                rueda[(tick >> (self.bits * nivel)) & self.mascara].append((tick, item))
+                return
+
+    def avanzar(self, ahora):
+        """Avanza hasta `ahora` y devuelve los ítems vencidos (en orden de tick)."""
+        objetivo = int(ahora / self.resolucion)
+        vencidos = []
+        while self.tick < objetivo:
+            if not self.pendientes:
+                self.tick = objetivo
+                break
+            self.tick += 1
+            tick = self.tick
+            # niveles que dan la vuelta en este tick, de arriba hacia abajo: lo
+            # que baja de un nivel puede caer en la ranura que baja del siguiente
+            nivel = 1
+            while nivel < len(self.ruedas) and not tick & ((1 << (self.bits * nivel)) - 1):
+                nivel += 1
+            for nivel in range(nivel - 1, 0, -1):
+                ranura = self.ruedas[nivel][(tick >> (self.bits * nivel)) & self.mascara]
+                if ranura:
+                    bajan = ranura[:]
+                    ranura.clear()
+                    for t, item in bajan:
+                        self._colgar(t, item)
+            ranura = self.ruedas[0][tick & self.mascara]
+            if ranura:
+                items = ranura[:]
+                ranura.clear()
+                for t, item in items:
+                    if t <= tick:
+                        vencidos.append(item)
+                        self.pendientes -= 1
+                    else:
+                        # más lejos que el último nivel: todavía le falta una vuelta
+                        self._colgar(t, item)
+        return vencidos
@@ -0,0 +1,742 @@
+# servidor/sesiones.py
+import sys
+import time
+import secrets
+
+from protocol import parse_hello, build_client_id, build_ocupado, build_posicion, etiquetar, PING, PONG
+from metricas import Registro
+from transcript import Transcripts
+from journal import firmar_token, validar_token
+from rueda import RuedaTiempos
+from bitacora import log
+from turnos_service import PRIORIDADES
+
+PING_B = PING.encode()
+PONG_B = PONG.encode()
+
+
+class Conexion:
+    """
+    Estado de sesión de una conexión: rol, id, peer y datos del turno (cliente)
+    o skills (admin). Los motores la extienden con su estado de I/O, así cada
+    conexión es un solo objeto con __slots__ (sin dicts paralelos por socket).
+
+    Un admin con capacidad > 1 multiplexa: no tiene peer sino `atiende`
+    (cliente_id -> Conexion del cliente), y cada cliente suyo tiene de peer
+    al admin. El estado de la sesión (transcript, charla) vive en el cliente.
+    """
+    __slots__ = (
+        "rol", "ident", "peer", "prefijo", "transcript",
+        "nombre", "tramite", "t_turno", "atendido", "skills", "ocupado",
+        "capacidad", "atiende", "ultima", "charla", "ping",
+    )
+
+    def __init__(self):
+        self.rol = None          # None hasta el hello; "CLIENT" | "ADMIN"
+        self.ident = None        # cliente_id o admin_id
+        self.peer = None         # Conexion emparejada (cliente<->admin)
+        self.prefijo = b""       # "Cliente 7: " / "@7 Cliente 7: " / "Admin A1: " ya codificado (relay)
+        self.transcript = None   # cliente: sesión de Transcripts de su sesión con el admin
+        self.nombre = None       # cliente
+        self.tramite = None
+        self.t_turno = 0.0       # monotonic del NEW_TURNO (espera de emparejamiento)
+        self.atendido = False    # ya lo emparejaron alguna vez
+        self.skills = ()         # admin: trámites que atiende (vacío = todos)
+        self.ocupado = False     # admin 1:1 en sesión
+        self.capacidad = 1       # admin: sesiones a la vez
+        self.atiende = None      # admin con capacidad > 1: cliente_id -> Conexion en sesión
+        self.ultima = 0.0        # monotonic del último frame recibido (latidos incluidos)
+        self.charla = 0.0        # cliente: monotonic del último mensaje de su sesión (sesión inactiva)
+        self.ping = 0.0          # monotonic del último PING sin contestar
+
+
+class ProxySessions:
+    """
+    Estado y lógica de sesiones del proxy (roles, emparejamiento, relay,
+    transcript), independiente del motor de I/O.
+
+    El motor (selectors o asyncio) entrega frames completos (bytes, sin
+    decodificar) y desconexiones;
+    las sesiones le piden escribir o cerrar a través de `transporte`:
+      - transporte.enviar(conn, payload: bytes)   nunca bloquea
+      - transporte.enviar_partes(conn, partes)    ídem, escritura vectorizada sin concatenar
+      - transporte.cerrar(conn, vaciar=False)     vaciar: mandar lo pendiente antes
+      - transporte.peer_cambio(conn)              cambió el peer de conn (backpressure)
+      - transporte.transferir(conn, worker, msg)  pasa conn a otro worker (-> bool)
+      - transporte.avisar_worker(worker, msg)     mensaje a otro worker
+
+    Los eventos hacia Turnos van por q_to_turnos (ipc.CanalEventos): put()
+    solo los junta y el motor hace flush() una vez por vuelta del loop.
+
+    `conn` es la Conexion (subclase del motor) de cada socket: el estado de
+    sesión vive en sus atributos y solo se indexa por cliente_id / admin_id
+    para los eventos de Turnos. Todo corre en el hilo del event loop, así que
+    no hace falta ningún lock.
+
+    Con --workers N hay una instancia por proceso worker: los eventos hacia
+    Turnos llevan "worker" y los cliente_id se reparten en franjas
+    (worker_id + 1, worker_id + 1 + N, ...) para que no choquen. Si Turnos
+    asigna un admin de otro worker, el cliente se transfiere a ese worker con
+    transporte.transferir() (fd por SCM_RIGHTS) y la sesión se arma allá.
+
+    Cada cliente recibe junto a su CLIENTE_ID un token firmado con
+    clave_token; si se corta mientras espera y vuelve con ese token retoma
+    su lugar en la cola (RESUME). ultimo_cliente_id es el mayor id ya emitido
+    (recuperado del journal), para no repetir ids después de un reinicio.
+
+    Con admision (ver admision.Admision) el motor consulta admitir_conexion()
+    antes de aceptar y los turnos nuevos se rechazan con OCUPADO si ya hay
+    demasiados clientes esperando ese trámite (en_espera).
+
+    Con latido > 0 cada conexión tiene un vencimiento en una RuedaTiempos:
+    callada más de `latido` segundos recibe PING y si no manda nada en
+    `espera_pong` se da por muerta (desconectado(): unpair + cleanup_conn,
+    igual que un EOF). Sin hello en `latido` se cierra. Una sesión sin
+    mensajes en `sesion_inactiva` segundos se termina como con FIN y el admin
+    vuelve a estar disponible. El motor llama vigilar(conn) al registrar una
+    conexión y vencer(ahora) en cada vuelta del loop; transporte.abierta(conn)
+    dice si la conexión sigue siendo de este proceso.
+
+    drenar() es el apagado ordenado (el motor ya dejó de aceptar): las
+    sesiones en curso siguen hasta su FIN y el resto de las conexiones se van
+    enseguida. En un reinicio en caliente se entregan al proceso nuevo con
+    entregar(conn, msg) (mismo mensaje que un HANDOFF, con fd) y allá siguen
+    esperando sin reconectarse; si no, se les avisa y se cierran (el cliente
+    conserva su lugar con el token). Al vencer el plazo el motor llama
+    cortar_sesiones().
+
+    Un admin que se loguea con capacidad > 1 atiende varias sesiones por la
+    misma conexión: lo que le llega de cada cliente va etiquetado con
+    "@<cliente_id> " y lo que manda tiene que empezar con la etiqueta de la
+    sesión a la que va (ver relay_etiquetado). Turnos lleva la cuenta de sus
+    lugares libres: admin_ready() al loguearse manda la capacidad y, después,
+    cada admin_ready() libera un lugar.
+    """
+    def __init__(self, q_to_turnos, q_to_db, worker_id=0, workers=1, clave_token=None, ultimo_cliente_id=0,
+                 admision=None, latido=0.0, espera_pong=15.0, sesion_inactiva=0.0, prioridades=None):
+        self.q_to_turnos = q_to_turnos
+        self.q_to_db = q_to_db
+        self.transporte = None
+        self.worker_id = worker_id
+        self.workers = workers
+
+        self.clientes = {}           # cliente_id -> Conexion
+        self.admins = {}             # admin_id -> Conexion
+        self.sesiones_activas = 0
+        self.en_espera = {}          # tramite -> clientes esperando turno en este proceso
+        self.admision = admision
+        self.prioridades = prioridades or PRIORIDADES   # las de la política de Turnos (nivel que va a la DB)
+        self.prioridad_defecto = max(self.prioridades.values())
+        self.transcripts = Transcripts(q_to_db)
+        self.drenando = False
+        self.entregar = None         # reinicio en caliente: pasa una conexión al proceso nuevo (-> bool)
+
+        self.latido = latido
+        self.espera_pong = espera_pong
+        self.sesion_inactiva = sesion_inactiva
+        self.ahora = time.monotonic()   # reloj del loop, se actualiza en vencer()
+        self.rueda = RuedaTiempos(ahora=self.ahora) if latido else None
+        self.vencidas = {"sin_hello": 0, "sin_respuesta": 0, "sesion_inactiva": 0}
+
+        self.clave_token = clave_token or secrets.token_bytes(32)
+        self.client_id_counter = ultimo_cliente_id // workers + 1 if ultimo_cliente_id else 0
+
+        self.metricas = Registro({"proceso": "proxy", "worker": worker_id})
+        self.espera_emparejamiento = self.metricas.histograma(  # NEW_TURNO -> ASSIGN aplicado
+            "turnos_proxy_espera_emparejamiento_segundos", "Espera desde NEW_TURNO hasta el emparejamiento")
+        self.relay_bytes = self.metricas.contador("turnos_proxy_relay_bytes_total", "Bytes relayados entre cliente y admin")
+        self.relay_mensajes = self.metricas.contador("turnos_proxy_relay_mensajes_total", "Mensajes relayados")
+        self.sesiones_total = self.metricas.contador("turnos_proxy_sesiones_total", "Sesiones cliente-admin iniciadas")
+        self.metricas.valor("turnos_proxy_sesiones_activas", "Sesiones en curso", lambda: self.sesiones_activas)
+        self.metricas.valor("turnos_proxy_admins_conectados", "Admins conectados", lambda: len(self.admins))
+        self.metricas.valor("turnos_proxy_clientes_conectados", "Clientes conectados", lambda: len(self.clientes))
+        self.metricas.valor("turnos_proxy_clientes_esperando", "Clientes esperando turno por trámite",
+                            lambda: dict(self.en_espera), etiqueta="tramite")
+        if admision is not None:
+            self.metricas.valor("turnos_proxy_rechazos_total", "Conexiones y turnos rechazados por admisión",
+                                lambda: dict(admision.rechazos), tipo="counter", etiqueta="motivo")
+        if latido:
+            self.metricas.valor("turnos_proxy_vencidas_total", "Conexiones y sesiones cortadas por timeout",
+                                lambda: dict(self.vencidas), tipo="counter", etiqueta="motivo")
+
+    def admitir_conexion(self, addr, abiertas):
+        """None si se acepta la conexión de addr; si no, la línea OCUPADO para contestarle."""
+        if self.admision is None:
+            return None
+        rechazo = self.admision.conexion(addr[0], abiertas)
+        return build_ocupado(*rechazo).encode() if rechazo else None
+
+    def esperando(self, conn, delta):
+        """Ajusta en_espera al entrar (+1) o salir (-1) un cliente de la espera."""
+        n = self.en_espera.get(conn.tramite, 0) + delta
+        if n:
+            self.en_espera[conn.tramite] = n
+        else:
+            self.en_espera.pop(conn.tramite, None)
+
+    def lleno(self, admin):
+        """El admin no tiene lugar para otra sesión."""
+        if admin.atiende is not None:
+            return len(admin.atiende) >= admin.capacidad
+        return admin.ocupado
+
+    def avisar(self, admin, cliente, texto):
+        """Mensaje del proxy al admin sobre la sesión con cliente (etiquetado si el admin multiplexa)."""
+        if admin.atiende is not None:
+            texto = etiquetar(cliente.ident, texto)
+        self.transporte.enviar(admin, texto.encode())
+
+    def unpair(self, conn, reason_msg=None):
+        """Rompe la sesión de conn (todas, si es un admin que multiplexa) y libera al admin."""
+        if conn.atiende:
+            sesiones = list(conn.atiende.values())
+        elif conn.peer is not None:
+            sesiones = [conn if conn.rol == "CLIENT" else conn.peer]
+        else:
+            return
+        for cliente in sesiones:
+            admin = cliente.peer
+            if reason_msg:
+                if conn is admin:
+                    self.transporte.enviar(cliente, (reason_msg + "\n").encode())
+                else:
+                    # con FIN el admin cierra la sesión de su lado (la etiquetada, si multiplexa)
+                    self.avisar(admin, cliente, reason_msg + "\nFIN\n")
+            self.separar(admin, cliente)
+
+    def separar(self, admin, cliente):
+        """Cierra la sesión admin<->cliente: transcript, fila en la DB y un lugar libre para el admin."""
+        cliente.peer = None
+        cliente.transcript = None
+        if admin.atiende is not None:
+            admin.atiende.pop(cliente.ident, None)
+        else:
+            admin.peer = None
+            admin.ocupado = False
+        self.sesiones_activas -= 1
+        # pueden haber estado pausados por backpressure del otro
+        self.transporte.peer_cambio(cliente)
+        self.transporte.peer_cambio(admin)
+
+        admin_id = admin.ident
+        cliente_id = cliente.ident
+
+        sesion_id, mensajes, duracion = self.transcripts.cerrar(admin_id, cliente_id)
+        tramite = cliente.tramite or "desconocido"
+        espera = None
+        if duracion is not None and cliente.t_turno:
+            # hello -> emparejamiento (simulacion.py rearma las llegadas con esto)
+            espera = round(max(0.0, time.monotonic() - cliente.t_turno - duracion), 3)
+        self.q_to_db.put({
+            "cliente_id": str(cliente_id),
+            "nombre": cliente.nombre or "Desconocido",
+            "tramite": tramite,
+            "prioridad": int(self.prioridades.get(tramite, self.prioridad_defecto)),
+            "admin_id": str(admin_id),
+            "sesion_id": sesion_id,
+            "mensajes": mensajes,
+            "duracion_s": round(duracion, 3) if duracion is not None else None,
+            "espera_s": espera,
+        })
+
+        if self.admins.get(admin_id) is admin:
+            if not self.drenando:
+                self.admin_ready(admin, atencion_s=duracion)
+            elif not admin.atiende:
+                self.liberar(admin)
+
+    def admin_ready(self, admin, atencion_s=None, login=False):
+        """
+        Login (con la capacidad del admin) o un lugar suyo que se libera.
+        atencion_s: duración de la sesión que terminó (Turnos estima la espera con eso).
+        """
+        evt = {
+            "type": "ADMIN_READY",
+            "admin_id": admin.ident,
+            "worker": self.worker_id,
+            "skills": list(admin.skills),
+        }
+        if login:
+            evt["capacidad"] = admin.capacidad
+        if atencion_s is not None:
+            evt["atencion_s"] = atencion_s
+        self.q_to_turnos.put(evt)
+
+    def reencolar(self, cliente, assign=None):
+        """
+        Devuelve a la cola a un cliente en espera: con `assign` (el ASSIGN
+        que no se pudo aplicar) en el lugar que tenía, con su orden,
+        prioridad y clave; sin él, RESUME (cliente recibido de otro proceso).
+        """
+        evt = {
+            "type": "RESUME",
+            "cliente_id": cliente.ident,
+            "nombre": cliente.nombre,
+            "tramite": cliente.tramite,
+            "worker": self.worker_id,
+        }
+        if assign is not None:
+            evt.update(type="REENCOLAR", orden=assign.get("orden", 0), prioridad=assign.get("prioridad", 0),
+                       clave=assign.get("clave"))
+        self.q_to_turnos.put(evt)
+
+    def turno_vencido(self, cliente_id):
+        """
+        Turnos ya no tenía el turno del token con que volvió el cliente (lo
+        atendieron o se le venció la gracia): pasa por la admisión como un
+        turno nuevo, con el mismo id, o se lo rechaza con OCUPADO.
+        """
+        cliente = self.clientes.get(cliente_id)
+        if cliente is None or cliente.peer is not None or cliente.atendido:
+            return
+        # en_espera ya lo cuenta a él
+        rechazo = self.admision and self.admision.turno(cliente.tramite, self.en_espera.get(cliente.tramite, 0) - 1)
+        if rechazo:
+            log.info("turno_rechazado", "Turno rechazado ({motivo}): {nombre} trámite={tramite} (token vencido)",
+                     motivo=rechazo[1], nombre=cliente.nombre, tramite=cliente.tramite)
+            self.transporte.enviar(cliente, build_ocupado(*rechazo).encode())
+            self.cleanup_conn(cliente, vaciar=True)
+            return
+        log.info("turno_recibido", "Turno recibido Cliente {cliente} ({nombre}) trámite={tramite} (token vencido)",
+                 cliente=cliente_id, nombre=cliente.nombre, tramite=cliente.tramite)
+        self.q_to_turnos.put({
+            "type": "NEW_TURNO",
+            "cliente_id": cliente_id,
+            "nombre": cliente.nombre,
+            "tramite": cliente.tramite,
+            "worker": self.worker_id,
+        })
+
+    def desconectado(self, conn):
+        """El motor detectó EOF/error de lectura o escritura en conn."""
+        log.info("desconexion", "Desconexión: {rol} {id}", rol=conn.rol or "sin hello", id=conn.ident or "")
+        self.unpair(conn, reason_msg="El otro extremo se desconectó.")
+        self.cleanup_conn(conn)
+
+    def handle_frame(self, conn, frame):
+        conn.ultima = self.ahora
+        if frame[:1] == b"\x01" and (frame == PING_B or frame == PONG_B):
+            if frame == PING_B:
+                self.transporte.enviar(conn, PONG_B + b"\n")
+            return
+
+        if conn.peer is not None:
+            self.relay(conn, conn.peer, frame)
+            return
+        if conn.atiende:
+            self.relay_etiquetado(conn, frame)
+            return
+
+        clean = str(frame, "utf-8", "ignore").strip()
+        if not clean:
+            return
+
+        if conn.rol is None:
+            parsed = parse_hello(clean)
+            if not parsed:
+                return
+
+            if parsed["type"] == "ADMIN_LOGIN":
+                admin_id = parsed["admin_id"]
+                conn.rol = "ADMIN"
+                conn.ident = admin_id
+                conn.skills = tuple(sys.intern(t) for t in parsed["skills"])
+                conn.capacidad = parsed["capacidad"]
+                conn.atiende = {} if conn.capacidad > 1 else None
+                conn.prefijo = f"Admin {admin_id}: ".encode()
+                self.admins[admin_id] = conn
+
+                log.info("admin_conectado", "Admin {admin} conectado (trámites: {skills}, capacidad: {capacidad})",
+                         admin=admin_id, skills=", ".join(parsed["skills"]) or "todos", capacidad=conn.capacidad)
+                bienvenida = f"--- ADMIN {admin_id} CONECTADO ---\n"
+                if conn.atiende is not None:
+                    bienvenida += (f"Hasta {conn.capacidad} sesiones a la vez: cada mensaje va etiquetado "
+                                   f"con su sesión (@<cliente_id> <mensaje>)\n")
+                self.transporte.enviar(conn, (bienvenida + "Esperando turnos...\n").encode())
+
+                self.admin_ready(conn, login=True)
+                return
+
+            if parsed["type"] == "CLIENT_HELLO":
+                nombre = parsed["nombre"]
+                # los trámites se repiten en miles de conexiones: una sola copia
+                tramite = sys.intern(parsed["tramite"])
+
+                cliente_id = validar_token(self.clave_token, parsed["token"]) if parsed["token"] else None
+                reanuda = cliente_id is not None
+                if reanuda:
+                    anterior = self.clientes.get(cliente_id)
+                    if anterior is not None:
+                        # la conexión vieja quedó medio abierta: la reemplaza esta
+                        self.desconectado(anterior)
+                else:
+                    rechazo = self.admision and self.admision.turno(tramite, self.en_espera.get(tramite, 0))
+                    if rechazo:
+                        log.info("turno_rechazado", "Turno rechazado ({motivo}): {nombre} trámite={tramite}",
+                                 motivo=rechazo[1], nombre=nombre, tramite=tramite)
+                        self.transporte.enviar(conn, build_ocupado(*rechazo).encode())
+                        self.transporte.cerrar(conn, vaciar=True)
+                        return
+                    self.client_id_counter += 1
+                    cliente_id = str((self.client_id_counter - 1) * self.workers + self.worker_id + 1)
+
+                conn.rol = "CLIENT"
+                conn.ident = cliente_id
+                conn.nombre = nombre
+                conn.tramite = tramite
+                conn.t_turno = time.monotonic()
+                self.clientes[cliente_id] = conn
+                self.esperando(conn, 1)
+
+                token = firmar_token(self.clave_token, cliente_id)
+                self.transporte.enviar(conn, build_client_id(cliente_id, token).encode())
+                self.transporte.enviar(conn, "Esperando a ser atendido por un administrativo...\n".encode())
+                if reanuda:
+                    log.info("turno_retomado", "Cliente {cliente} ({nombre}) retoma su turno",
+                             cliente=cliente_id, nombre=nombre, tramite=tramite)
+                else:
+                    log.info("turno_recibido", "Turno recibido Cliente {cliente} ({nombre}) trámite={tramite}",
+                             cliente=cliente_id, nombre=nombre, tramite=tramite)
+
+                self.q_to_turnos.put({
+                    "type": "RESUME" if reanuda else "NEW_TURNO",
+                    "cliente_id": cliente_id,
+                    "nombre": nombre,
+                    "tramite": tramite,
+                    "worker": self.worker_id,
+                })
+                return
+
+        self.transporte.enviar(conn, "[Aún no estás emparejado. Esperá...]\n".encode())
+
+    def relay(self, conn, dst, frame):
+        """
+        Camino rápido de una sesión emparejada: el frame no se decodifica ni se
+        re-arma, se manda como prefijo ya codificado + frame + "\\n" en una
+        escritura vectorizada. El transcript guarda los bytes tal cual y los
+        decodifica el DB Worker.
+        """
+        frame = frame.strip()
+        if not frame:
+            return
+        cliente = conn if conn.rol == "CLIENT" else dst
+
+        if len(frame) == 3 and frame.upper() == b"FIN":
+            self.transporte.enviar(cliente, b"FIN\n")
+            self.avisar(cliente.peer, cliente, "FIN\n")
+            self.unpair(cliente)
+            self.cleanup_conn(cliente, vaciar=True)
+            return
+
+        cliente.charla = self.ahora
+        # el transcript va en streaming al DB Worker (tabla mensajes)
+        self.transcripts.agregar(cliente.transcript, conn.rol, frame)
+
+        # reenviar con etiqueta (los errores de escritura los reporta el motor)
+        self.relay_mensajes.inc()
+        self.relay_bytes.inc(len(conn.prefijo) + len(frame) + 1)
+        self.transporte.enviar_partes(dst, (conn.prefijo, frame, b"\n"))
+
+    def relay_etiquetado(self, admin, frame):
+        """Frame de un admin que multiplexa: "@<cliente_id> <mensaje>" va a esa sesión, sin la etiqueta."""
+        etiqueta, _, texto = frame.strip().partition(b" ")
+        cliente = admin.atiende.get(str(etiqueta[1:], "utf-8", "ignore")) if etiqueta[:1] == b"@" else None
+        if cliente is not None:
+            self.relay(admin, cliente, texto)
+            return
+        sesiones = ", ".join(f"@{cliente_id}" for cliente_id in admin.atiende)
+        if etiqueta[:1] == b"@":
+            aviso = f"[No hay una sesión {str(etiqueta, 'utf-8', 'replace')}. Sesiones: {sesiones}]\n"
+        else:
+            aviso = f"[Indicá la sesión: @<cliente_id> <mensaje>. Sesiones: {sesiones}]\n"
+        self.transporte.enviar(admin, aviso.encode())
+
+    def cleanup_conn(self, conn, vaciar=False):
+        ident = conn.ident
+        if conn.rol == "CLIENT" and self.clientes.get(ident) is conn:
+            del self.clientes[ident]
+            if not conn.atendido:
+                self.esperando(conn, -1)
+                # se fue esperando: Turnos le guarda el lugar por si vuelve con su token
+                self.q_to_turnos.put({"type": "CLIENTE_DESCONECTADO", "cliente_id": ident, "worker": self.worker_id})
+        elif conn.rol == "ADMIN" and self.admins.get(ident) is conn:
+            del self.admins[ident]
+            conn.ocupado = False
+            self.q_to_turnos.put({"type": "ADMIN_DISCONNECTED", "admin_id": ident, "worker": self.worker_id})
+        conn.rol = None
+
+        self.transporte.cerrar(conn, vaciar=vaciar)
+
+    def handle_turnos_event(self, evt):
+        if evt.get("type") == "POSICIONES":
+            self.avisar_posiciones(evt["posiciones"])
+            return
+
+        if evt.get("type") == "TURNO_VENCIDO":
+            self.turno_vencido(evt["cliente_id"])
+            return
+
+        if evt.get("type") == "ASSIGN":
+            admin_id = evt["admin_id"]
+            cliente_id = evt["cliente_id"]
+            tramite = evt["tramite"]
+            nombre = evt["nombre"]
+
+            admin_worker = evt.get("admin_worker", self.worker_id)
+            if admin_worker != self.worker_id:
+                self.derivar_assign(evt, admin_worker)
+                return
+
+            admin = self.admins.get(admin_id)
+            cliente = self.clientes.get(cliente_id)
+
+            if admin is None or cliente is None:
+                if admin is not None:
+                    self.admin_ready(admin)
+                if cliente is not None:
+                    self.reencolar(cliente, evt)
+                return
+
+            if self.lleno(admin):
+                # Turnos le contó un lugar que no tiene: el turno vuelve a la
+                # cola y ese lugar queda ocupado (no se libera)
+                self.reencolar(cliente, evt)
+                return
+
+            if admin.atiende is not None:
+                admin.atiende[cliente_id] = cliente
+                cliente.prefijo = f"@{cliente_id} Cliente {cliente_id}: ".encode()
+            else:
+                admin.ocupado = True
+                admin.peer = cliente
+                cliente.prefijo = f"Cliente {cliente_id}: ".encode()
+            cliente.peer = admin
+            cliente.charla = self.ahora
+            self.sesiones_activas += 1
+            cliente.transcript = self.transcripts.abrir(admin_id, cliente_id)
+            self.sesiones_total.inc()
+
+            if not cliente.atendido:
+                cliente.atendido = True
+                self.esperando(cliente, -1)
+            self.espera_emparejamiento.observar(time.monotonic() - cliente.t_turno)
+
+            log.info("emparejado", "Emparejado Admin {admin} <-> Cliente {cliente} ({nombre})",
+                     admin=admin_id, cliente=cliente_id, nombre=nombre, tramite=tramite)
+
+            self.avisar(admin, cliente, f"Atendiendo a Cliente {cliente_id} ({nombre}) - Trámite: {tramite}\n")
+            self.transporte.enviar(
+                cliente,
+                f"Usted está siendo atendido por el administrativo {admin_id}. Puede comenzar a conversar.\n".encode()
+            )
+            # el backpressure de uno ahora también frena al otro
+            self.transporte.peer_cambio(admin)
+            self.transporte.peer_cambio(cliente)
+
+    def avisar_posiciones(self, posiciones):
+        """Reenvía a cada cliente que sigue esperando su posición y espera estimada."""
+        enviar = self.transporte.enviar
+        for cliente_id, posicion, espera in posiciones:
+            cliente = self.clientes.get(cliente_id)
+            if cliente is not None and cliente.peer is None and not cliente.atendido:
+                enviar(cliente, build_posicion(posicion, espera).encode())
+
+    # --- Vencimientos (latidos, conexiones muertas, sesiones inactivas) ---
+
+    def vigilar(self, conn):
+        """El motor registró una conexión (aceptada o recibida de otro worker)."""
+        conn.ultima = self.ahora
+        if self.rueda is not None:
+            self.rueda.agregar(self.ahora + self.latido, conn)
+
+    def vencer(self, ahora):
+        """Actualiza el reloj del loop y procesa las conexiones cuyo vencimiento llegó."""
+        self.ahora = ahora
+        if self.rueda is None:
+            return
+        for conn in self.rueda.avanzar(ahora):
+            if not self.transporte.abierta(conn):
+                continue
+            proximo = self.revisar(conn, ahora)
+            if proximo is not None:
+                self.rueda.agregar(proximo, conn)
+
+    def revisar(self, conn, ahora):
+        """Devuelve el próximo vencimiento de conn, o None si se cerró."""
+        if conn.rol is None:
+            if ahora - conn.ultima < self.latido:
+                return conn.ultima + self.latido
+            self.vencida(conn, "sin_hello")
+            return None
+
+        # la sesión la vigila el cliente (un admin que multiplexa no tiene peer)
+        cliente = conn if conn.rol == "CLIENT" else conn.peer
+        if cliente is not None and cliente.peer is not None and self.sesion_inactiva:
+            if ahora - cliente.charla >= self.sesion_inactiva:
+                self.terminar_inactiva(cliente)
+                if not self.transporte.abierta(conn):
+                    return None
+
+        if conn.ping > conn.ultima:
+            # PING mandado y nada recibido desde entonces
+            if ahora - conn.ping < self.espera_pong:
+                return conn.ping + self.espera_pong
+            self.vencida(conn, "sin_respuesta")
+            return None
+        if ahora - conn.ultima >= self.latido:
+            conn.ping = ahora
+            self.transporte.enviar(conn, PING_B + b"\n")
+            return ahora + self.espera_pong
+
+        proximo = conn.ultima + self.latido
+        cliente = conn if conn.rol == "CLIENT" else conn.peer
+        if cliente is not None and cliente.peer is not None and self.sesion_inactiva:
+            proximo = min(proximo, cliente.charla + self.sesion_inactiva)
+        return proximo
+
+    def vencida(self, conn, motivo):
+        """Conexión muerta: sigue el mismo camino que un EOF."""
+        self.vencidas[motivo] += 1
+        log.info("timeout", "Timeout ({motivo}): {rol} {id}", motivo=motivo, rol=conn.rol or "sin hello",
+                 id=conn.ident or "")
+        self.desconectado(conn)
+
+    def terminar_inactiva(self, cliente):
+        """Sesión sin mensajes por sesion_inactiva: se cierra como con FIN (admin vuelve al pool)."""
+        self.vencidas["sesion_inactiva"] += 1
+        log.info("sesion_inactiva", "Sesión inactiva Admin {admin} <-> Cliente {cliente}: se cierra",
+                 admin=cliente.peer.ident, cliente=cliente.ident)
+        self.cerrar_sesion(cliente, "[Sesión cerrada por inactividad]")
+
+    def cerrar_sesion(self, cliente, aviso):
+        """Termina la sesión del cliente como con FIN, avisándoles el motivo a los dos."""
+        texto = f"{aviso}\nFIN\n"
+        self.transporte.enviar(cliente, texto.encode())
+        self.avisar(cliente.peer, cliente, texto)
+        self.unpair(cliente)
+        self.cleanup_conn(cliente, vaciar=True)
+
+    # --- Drenaje (apagado ordenado y reinicio en caliente) ---
+
+    def drenar(self, sin_hello=(), entregar=None):
+        """
+        El motor dejó de aceptar: clientes en espera, admins libres y las
+        conexiones sin hello (sin_hello, las conoce el motor) dejan el proceso
+        ya; los admins en sesión, cuando la terminen (ver unpair).
+        """
+        self.drenando = True
+        self.entregar = entregar
+        libres = [c for c in self.clientes.values() if c.peer is None]
+        libres += [a for a in self.admins.values() if a.peer is None and not a.atiende]
+        libres += sin_hello
+        for conn in libres:
+            if self.transporte.abierta(conn):
+                self.liberar(conn)
+        log.info("drenando", "Drenando: {libres} conexiones sin sesión {destino}, {sesiones} sesiones en curso",
+                 libres=len(libres), destino="entregadas" if entregar else "cerradas", sesiones=self.sesiones_activas)
+
+    def liberar(self, conn):
+        """Durante el drenaje: conn (sin sesión) deja este proceso."""
+        if self.entregar is not None:
+            msg = {"type": "HEREDADA"}
+            if conn.rol == "CLIENT":
+                msg["cliente"] = datos = self.exportar_cliente(conn)
+            elif conn.rol == "ADMIN":
+                msg["admin"] = datos = self.exportar_admin(conn)
+            if self.entregar(conn, msg):
+                return
+            # no se pudo pasar: vuelve a los mapas y se cierra como en un apagado
+            if "cliente" in msg:
+                self.importar_cliente(conn, datos)
+            elif "admin" in msg:
+                self.importar_admin(conn, datos)
+
+        if conn.rol == "CLIENT":
+            aviso = "[Servidor en mantenimiento: vuelva a conectarse con su token para conservar su lugar]\n"
+        else:
+            aviso = "[Servidor en mantenimiento: vuelva a conectarse en unos segundos]\n"
+        self.transporte.enviar(conn, aviso.encode())
+        self.cleanup_conn(conn, vaciar=True)
+
+    def cortar_sesiones(self):
+        """Venció el plazo del drenaje: se terminan las sesiones que quedan."""
+        sesiones = [c for c in self.clientes.values() if c.peer is not None]
+        for cliente in sesiones:
+            if cliente.peer is not None:
+                self.cerrar_sesion(cliente, "[Servidor en mantenimiento: sesión cerrada]")
+        return len(sesiones)
+
+    # --- Transferencia de clientes entre workers ---
+
+    def derivar_assign(self, evt, admin_worker):
+        """El admin asignado vive en otro worker: se le pasa el cliente (en espera)."""
+        admin_id = evt["admin_id"]
+        cliente = self.clientes.get(evt["cliente_id"])
+
+        if cliente is None or cliente.peer is not None:
+            self.transporte.avisar_worker(admin_worker, {"type": "ASSIGN_FALLIDO", "admin_id": admin_id})
+            return
+
+        datos = self.exportar_cliente(cliente)
+        msg = {"type": "HANDOFF", "cliente": datos, "assign": evt}
+        if not self.transporte.transferir(cliente, admin_worker, msg):
+            self.importar_cliente(cliente, datos)
+            self.reencolar(cliente, evt)
+            self.transporte.avisar_worker(admin_worker, {"type": "ASSIGN_FALLIDO", "admin_id": admin_id})
+
+    def exportar_cliente(self, conn):
+        """Saca a un cliente en espera de los mapas (sin cerrarlo ni avisar a Turnos)."""
+        self.clientes.pop(conn.ident, None)
+        conn.rol = None
+        if not conn.atendido:
+            self.esperando(conn, -1)
+        return {
+            "cliente_id": conn.ident,
+            "meta": {"nombre": conn.nombre, "tramite": conn.tramite, "t_turno": conn.t_turno, "atendido": conn.atendido},
+        }
+
+    def importar_cliente(self, conn, cliente):
+        meta = cliente["meta"]
+        conn.rol = "CLIENT"
+        conn.ident = cliente["cliente_id"]
+        conn.nombre = meta["nombre"]
+        conn.tramite = sys.intern(meta["tramite"])
+        conn.t_turno = meta["t_turno"]
+        conn.atendido = meta["atendido"]
+        self.clientes[conn.ident] = conn
+        if not conn.atendido:
+            self.esperando(conn, 1)
+
+    def exportar_admin(self, conn):
+        """Saca a un admin libre de los mapas (sin cerrarlo ni avisar a Turnos)."""
+        self.admins.pop(conn.ident, None)
+        conn.rol = None
+        return {"admin_id": conn.ident, "skills": list(conn.skills), "capacidad": conn.capacidad}
+
+    def importar_admin(self, conn, admin):
+        conn.rol = "ADMIN"
+        conn.ident = admin["admin_id"]
+        conn.skills = tuple(sys.intern(t) for t in admin["skills"])
+        conn.capacidad = admin.get("capacidad", 1)
+        conn.atiende = {} if conn.capacidad > 1 else None
+        conn.prefijo = f"Admin {conn.ident}: ".encode()
+        self.admins[conn.ident] = conn
+
+    def handle_worker_msg(self, msg, conn=None):
+        """Mensaje de otro worker (o del proceso anterior); en HANDOFF / HEREDADA, conn es la conexión recibida."""
+        t = msg.get("type")
+        if t == "HANDOFF":
+            self.importar_cliente(conn, msg["cliente"])
+            self.handle_turnos_event(dict(msg["assign"], admin_worker=self.worker_id))
+        elif t == "HEREDADA":
+            # reinicio en caliente: el cliente retoma su lugar en el journal, el admin vuelve al pool
+            if "cliente" in msg:
+                self.importar_cliente(conn, msg["cliente"])
+                self.reencolar(conn)
+            elif "admin" in msg:
+                self.importar_admin(conn, msg["admin"])
+                self.admin_ready(conn, login=True)
+        elif t == "ASSIGN_FALLIDO":
+            admin = self.admins.get(msg["admin_id"])
+            if admin is not None and not self.lleno(admin):
+                self.admin_ready(admin)
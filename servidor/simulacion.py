@@ -0,0 +1,275 @@
+# servidor/simulacion.py
+"""
+Simulación de eventos discretos del despacho de turnos: el mismo
+Despachador (y sus TurnoQueue con aging) que corre en Turnos Service, con un
+reloj virtual inyectado, sin sockets ni procesos. Sirve para elegir la
+política (ver politicas.py), aging_seconds y PRIORIDADES mirando la espera
+por trámite y la ocupación de los admins con millones de turnos.
+
+Llegadas:
+  - sintéticas: Poisson (--tasa turnos/s), trámite según --mezcla y
+    atención exponencial con la media de --atencion
+  - traza (--db): las filas de turnos_atendidos. Llegada = fin de la sesión
+    (timestamp) - duracion_s - espera_s, atención = duracion_s. Las filas
+    sin espera_s (anteriores a esa columna) cuentan como llegadas al
+    emparejarse. --escala comprime el tiempo entre llegadas (más carga).
+
+Los admins salen de --admins: grupos "skills=cantidad" ("pago+reclamo=3,*=2";
+* atiende todo), cada uno con --capacidad sesiones a la vez. Cada --aging
+(o cada --politica) corre la misma carga de nuevo para comparar.
+
+Uso:
+    python3 servidor/simulacion.py --turnos 1000000 --tasa 0.05 --admins "*=10"
+    python3 servidor/simulacion.py --db data/turnos.db --admins "pago+reclamo=3,*=2" --aging 10 30 60
+    python3 servidor/simulacion.py --prioridades pago=1,reclamo=1,consulta=2 --json
+    python3 servidor/simulacion.py --politica aging estricta:300 wfq edf:pago=120 sest
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import sqlite3
+import argparse
+from bisect import bisect
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from turnos_service import Despachador, PoliticaAging, TODOS
+from politicas import parse_pares, parse_politica
+from metricas import Histograma
+from consultas import abrir_lectura, imprimir_tabla
+from db import DB_PATH
+
+# Buckets (segundos) de la espera simulada: de segundos a horas
+BUCKETS_ESPERA = (
+    1, 2, 5, 10, 20, 30, 45, 60, 90, 120, 180, 240, 300, 450, 600,
+    900, 1200, 1800, 2700, 3600, 5400, 7200, float("inf"),
+)
+
+MEZCLA = {"pago": 0.3, "reclamo": 0.2, "consulta": 0.5}
+ATENCION = {"pago": 180.0, "reclamo": 300.0, "consulta": 120.0}
+
+
+def parse_admins(texto):
+    """'pago+reclamo=3,*=2' -> [(("pago", "reclamo"), 3), ((), 2)]"""
+    grupos = []
+    for skills, cantidad in parse_pares(texto, int).items():
+        grupos.append((() if skills == TODOS else tuple(s for s in skills.split("+") if s), cantidad))
+    return grupos
+
+
+def llegadas_sinteticas(turnos, tasa, mezcla=MEZCLA, atencion=ATENCION, seed=1):
+    """(llegada, tramite, atencion) con llegadas Poisson; un generador, no arma la lista."""
+    rng = random.Random(seed)
+    tramites = list(mezcla)
+    acumulados = []
+    total = 0.0
+    for t in tramites:
+        total += mezcla[t]
+        acumulados.append(total)
+    # lo mismo que rng.choices(tramites, cum_weights=acumulados), sin armar una lista por turno
+    ultimo = len(tramites) - 1
+    t = 0.0
+    for _ in range(turnos):
+        t += rng.expovariate(tasa)
+        tramite = tramites[bisect(acumulados, rng.random() * total, 0, ultimo)]
+        yield t, tramite, rng.expovariate(1.0 / atencion.get(tramite, 120.0))
+
+
+def llegadas_de_db(path=DB_PATH, desde=None, hasta=None, escala=1.0):
+    """Traza de turnos_atendidos ordenada por llegada, con el tiempo empezando en 0."""
+    conn = abrir_lectura(path)
+    try:
+        sql = "SELECT tramite, timestamp, duracion_s, espera_s FROM turnos_atendidos WHERE duracion_s IS NOT NULL"
+        params = []
+        if desde:
+            sql += " AND timestamp >= ?"
+            params.append(desde)
+        if hasta:
+            sql += " AND timestamp < ?"
+            params.append(hasta)
+        filas = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+    epoch = {}      # timestamp (resolución de segundos, se repite mucho) -> epoch
+    traza = []
+    for fila in filas:
+        fin = epoch.get(fila["timestamp"])
+        if fin is None:
+            fin = epoch[fila["timestamp"]] = datetime.strptime(fila["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+        atencion = fila["duracion_s"]
+        traza.append((fin - atencion - (fila["espera_s"] or 0.0), sys.intern(fila["tramite"]), atencion))
+    traza.sort()
+    if traza:
+        inicio = traza[0][0]
+        traza = [((llegada - inicio) / escala, tramite, atencion) for llegada, tramite, atencion in traza]
+    return traza
+
+
+class Simulacion:
+    """
+    Corre llegadas (iterable de (llegada, tramite, atencion) ordenado por
+    llegada) contra un Despachador con el reloj en self.ahora. Cada turno
+    asignado ocupa un lugar de su admin `atencion` segundos; al terminar el
+    admin se libera como con el ADMIN_READY del proxy (admin_listo sin
+    capacidad). Las terminaciones van en un heap; las llegadas se leen en
+    orden, así que la memoria es O(turnos en el sistema).
+    """
+    def __init__(self, admins, capacidad=1, politica=None):
+        self.ahora = 0.0
+        self.despachador = Despachador(reloj=self.reloj, politica=politica)
+        self.admins = []            # (admin_id, skills, grupo)
+        for skills, cantidad in admins:
+            grupo = "+".join(skills) or TODOS
+            for _ in range(cantidad):
+                self.admins.append((f"S{len(self.admins) + 1}", skills, grupo))
+        self.capacidad = capacidad
+        self.fines = []             # heap (fin, seq, admin_id)
+        self.seq = 0
+        self.esperando = {}         # cliente_id -> (llegada, atencion)
+        self.espera = {}            # tramite -> Histograma
+        self.espera_total = Histograma(BUCKETS_ESPERA)
+        self.ocupado = {admin_id: 0.0 for admin_id, _, _ in self.admins}   # segundos-lugar atendiendo
+        self.turnos = 0
+
+    def reloj(self):
+        return self.ahora
+
+    def correr(self, llegadas):
+        despachador = self.despachador
+        fines = self.fines
+        for admin_id, skills, _ in self.admins:
+            for turno in despachador.admin_listo(admin_id, skills, self.capacidad):
+                self.empezar(admin_id, turno)
+
+        esperando = self.esperando
+        for llegada, tramite, atencion in llegadas:
+            while fines and fines[0][0] <= llegada:
+                self.terminar(heapq.heappop(fines))
+            self.ahora = llegada
+            self.turnos += 1
+            esperando[self.turnos] = (llegada, atencion)
+            par = despachador.nuevo_turno(self.turnos, "", tramite)
+            if par:
+                self.empezar(*par)
+        while fines:
+            self.terminar(heapq.heappop(fines))
+        return self
+
+    def terminar(self, fin):
+        self.ahora, _, admin_id = fin
+        for turno in self.despachador.admin_listo(admin_id):
+            self.empezar(admin_id, turno)
+
+    def empezar(self, admin_id, turno):
+        llegada, atencion = self.esperando.pop(turno["cliente_id"])
+        espera = self.ahora - llegada
+        h = self.espera.get(turno["tramite"])
+        if h is None:
+            h = self.espera[turno["tramite"]] = Histograma(BUCKETS_ESPERA)
+        h.observar(espera)
+        self.espera_total.observar(espera)
+        self.ocupado[admin_id] += atencion
+        self.seq += 1
+        heapq.heappush(self.fines, (self.ahora + atencion, self.seq, admin_id))
+
+    def resumen(self):
+        """Espera por trámite (segundos) y ocupación por grupo de admins (0 a 1)."""
+        def fila(nombre, h):
+            return {
+                "tramite": nombre, "turnos": h.count,
+                "espera_prom_s": round(h.sum / h.count, 1) if h.count else 0.0,
+                "p50_s": round(h.percentil(0.5), 1), "p90_s": round(h.percentil(0.9), 1),
+                "p99_s": round(h.percentil(0.99), 1), "max_s": round(h.max, 1),
+            }
+
+        espera = [fila(t, self.espera[t]) for t in sorted(self.espera)]
+        espera.append(fila("(todos)", self.espera_total))
+
+        horizonte = self.ahora or 1.0
+        por_grupo = {}
+        for admin_id, _, grupo in self.admins:
+            por_grupo.setdefault(grupo, []).append(self.ocupado[admin_id] / (self.capacidad * horizonte))
+        ocupacion = [
+            {"admins": grupo, "cantidad": len(v), "ocupacion_prom": round(sum(v) / len(v), 3),
+             "min": round(min(v), 3), "max": round(max(v), 3)}
+            for grupo, v in por_grupo.items()
+        ]
+        return {"turnos": self.turnos, "horizonte_h": round(self.ahora / 3600, 2), "espera": espera,
+                "ocupacion": ocupacion}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulación del despacho de turnos con reloj virtual")
+    parser.add_argument("--db", help="traza desde turnos_atendidos de esta DB (sin --db: llegadas sintéticas)")
+    parser.add_argument("--desde", help="con --db, timestamp inicial (ej. 2026-10-01)")
+    parser.add_argument("--hasta", help="con --db, timestamp final (exclusivo)")
+    parser.add_argument("--escala", type=float, default=1.0, help="con --db, llegadas N veces más seguidas")
+    parser.add_argument("--turnos", type=int, default=100000, help="turnos sintéticos")
+    parser.add_argument("--tasa", type=float, default=0.05, help="llegadas sintéticas por segundo")
+    parser.add_argument("--mezcla", type=parse_pares, default=MEZCLA, help="proporción por trámite: pago=0.3,...")
+    parser.add_argument("--atencion", type=parse_pares, default=ATENCION,
+                        help="atención media (s) por trámite: pago=180,...")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--admins", type=parse_admins, default=[((), 10)],
+                        help="grupos skills=cantidad: 'pago+reclamo=3,*=2' (* = todos los trámites)")
+    parser.add_argument("--capacidad", type=int, default=1, help="sesiones a la vez por admin")
+    parser.add_argument("--aging", type=float, nargs="+", default=[30.0], help="aging_seconds a comparar")
+    parser.add_argument("--politica", type=parse_politica, nargs="+", default=None,
+                        help="políticas a comparar (ver politicas.py): aging:30 estricta:600 wfq edf sest; "
+                             "reemplaza a --aging")
+    parser.add_argument("--prioridades", type=lambda t: parse_pares(t, int), default=None,
+                        help="reemplaza PRIORIDADES: pago=1,reclamo=2,consulta=3")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    traza = None
+    if args.db:
+        try:
+            traza = llegadas_de_db(args.db, args.desde, args.hasta, args.escala)
+        except sqlite3.Error as e:
+            sys.exit(f"No se pudo leer {args.db}: {e}")
+        if not traza:
+            sys.exit("La traza no tiene turnos con duracion_s")
+
+    politicas = args.politica or [PoliticaAging(aging) for aging in args.aging]
+    resultados = []
+    for politica in politicas:
+        if args.prioridades:
+            politica.prioridades = args.prioridades
+        if politica.nombre == "sest" and not politica.valores:
+            # sin estimaciones explícitas: las medias de la carga (sintética) o el historial de la traza
+            if traza is None:
+                politica.valores.update(args.atencion)
+            else:
+                politica.historial(args.db)
+        llegadas = traza if traza is not None else llegadas_sinteticas(
+            args.turnos, args.tasa, args.mezcla, args.atencion, args.seed)
+        t0 = time.perf_counter()
+        sim = Simulacion(args.admins, args.capacidad, politica).correr(llegadas)
+        segundos = time.perf_counter() - t0
+        resumen = sim.resumen()
+        resumen.update(politica=str(politica), prioridades=politica.prioridades, simulacion_s=round(segundos, 2),
+                       turnos_por_s=round(sim.turnos / segundos))
+        resultados.append(resumen)
+
+        if not args.json:
+            print(f"politica={politica}  turnos={sim.turnos}  horizonte={resumen['horizonte_h']}h  "
+                  f"({segundos:.1f}s, {resumen['turnos_por_s']} turnos/s simulados)")
+            imprimir_tabla(resumen["espera"])
+            print()
+            imprimir_tabla(resumen["ocupacion"])
+            print()
+
+    if args.json:
+        print(json.dumps(resultados, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
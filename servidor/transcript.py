@@ -0,0 +1,68 @@
+# servidor/transcript.py
+import time
+import uuid
+
+# Límites del buffer por sesión: al pasar cualquiera de los dos se manda
+# lo acumulado al DB Worker. Así el proxy nunca guarda más que esto por sesión
+# y los mensajes por la Queue quedan chicos.
+MAX_LINEAS_BUFFER = 32
+MAX_BYTES_BUFFER = 16 * 1024
+
+
+class _Sesion:
+    __slots__ = ("sesion_id", "seq", "lineas", "bytes", "t_inicio")
+
+    def __init__(self, sesion_id):
+        self.sesion_id = sesion_id
+        self.t_inicio = time.monotonic()
+        self.seq = 0
+        self.lineas = []
+        self.bytes = 0
+
+
+class Transcripts:
+    """
+    Transcript de las sesiones en streaming hacia el DB Worker.
+
+    Cada sesión (admin_id, cliente_id) recibe un sesion_id al abrirse; cada
+    línea relayada (bytes, sin decodificar) se numera (seq) y se acumula en un
+    buffer acotado que se manda como {"tipo": "mensajes", ...} cuando se llena. Al cerrar se manda
+    lo que quede y se devuelve (sesion_id, cantidad, duración) para el registro
+    de cierre.
+    """
+    def __init__(self, q_to_db, max_lineas=MAX_LINEAS_BUFFER, max_bytes=MAX_BYTES_BUFFER):
+        self.q_to_db = q_to_db
+        self.max_lineas = max_lineas
+        self.max_bytes = max_bytes
+        self.sesiones = {}   # (admin_id, cliente_id) -> _Sesion
+
+    def abrir(self, admin_id, cliente_id):
+        """Devuelve la sesión: el relay la guarda y se la pasa a agregar() sin buscarla."""
+        sesion = _Sesion(uuid.uuid4().hex)
+        self.sesiones[(admin_id, cliente_id)] = sesion
+        return sesion
+
+    def agregar(self, sesion, emisor, texto):
+        sesion.seq += 1
+        sesion.lineas.append((sesion.seq, time.time(), emisor, texto))
+        sesion.bytes += len(texto)
+        if len(sesion.lineas) >= self.max_lineas or sesion.bytes >= self.max_bytes:
+            self._vaciar(sesion)
+
+    def cerrar(self, admin_id, cliente_id):
+        """
+        Manda lo pendiente y devuelve (sesion_id, mensajes, segundos desde abrir)
+        o (None, 0, None) si no había sesión.
+        """
+        sesion = self.sesiones.pop((admin_id, cliente_id), None)
+        if sesion is None:
+            return None, 0, None
+        self._vaciar(sesion)
+        return sesion.sesion_id, sesion.seq, time.monotonic() - sesion.t_inicio
+
+    def _vaciar(self, sesion):
+        if not sesion.lineas:
+            return
+        self.q_to_db.put({"tipo": "mensajes", "sesion_id": sesion.sesion_id, "filas": sesion.lineas})
+        sesion.lineas = []
+        sesion.bytes = 0
@@ -1,7 +1,15 @@
 # servidor/turnos_service.py
+import math
 import time
 import heapq
-from collections import deque
+import signal
+from collections import deque, OrderedDict
+from multiprocessing.connection import wait
+
+from metricas import Registro, INTERVALO_VOLCADO
+from journal import JournalTurnos, cargar_estado
+from ipc import CanalEventos
+from bitacora import log
 
 
 PRIORIDADES = {
@@ -11,86 +19,810 @@ PRIORIDADES = {
 }
 
 
+class _Turno:
+    __slots__ = ("prioridad", "orden", "cliente_id", "nombre", "tramite", "ts", "activo", "clave")
+
+    def __init__(self, prioridad, orden, cliente_id, nombre, tramite, ts):
+        self.prioridad = prioridad
+        self.orden = orden
+        self.cliente_id = cliente_id
+        self.nombre = nombre
+        self.tramite = tramite
+        self.ts = ts
+        self.activo = True
+        self.clave = None       # la fija de las políticas de politicas.py (acá manda prioridad)
+
+    def __lt__(self, otro):
+        # empate de orden en un heap: es el mismo turno reingresado (reanudar)
+        # junto a su entrada vieja, que ya está inactiva; da igual cuál sale primero
+        return False
+
+
+# Tamaño mínimo de la ventana de órdenes de un _ConteoOrden
+VENTANA_MINIMA = 64
+
+
+class _ConteoOrden:
+    """
+    Turnos vivos de un nivel indexados por orden de llegada en un árbol de
+    Fenwick: antes(orden) = cuántos tienen orden menor, en O(log n).
+    Cubre una ventana [base, base + tamaño) de órdenes; si llega uno fuera de
+    ella se rearma en O(tamaño) alrededor de los vivos, dejando el doble de
+    lugar, así que el costo amortizado por turno sigue siendo O(1).
+    """
+    __slots__ = ("base", "cuenta", "arbol", "vivos")
+
+    def __init__(self):
+        self.base = 0
+        self.cuenta = [0] * VENTANA_MINIMA       # cuenta[i]: vivos con orden base + i
+        self.arbol = [0] * (VENTANA_MINIMA + 1)  # Fenwick sobre cuenta (1-indexado)
+        self.vivos = 0
+
+    def sumar(self, orden, delta):
+        i = orden - self.base
+        if not 0 <= i < len(self.cuenta):
+            if self.vivos:
+                self._rearmar(orden)
+            else:
+                # vacío: cuenta y arbol son todos 0, alcanza con mover la ventana
+                self.base = orden
+            i = orden - self.base
+        self.cuenta[i] += delta
+        self.vivos += delta
+        arbol = self.arbol
+        n = len(arbol)
+        i += 1
+        while i < n:
+            arbol[i] += delta
+            i += i & -i
+
+    def antes(self, orden):
+        i = orden - self.base
+        if i <= 0:
+            return 0
+        if i >= len(self.cuenta):
+            return self.vivos
+        arbol = self.arbol
+        total = 0
+        while i:
+            total += arbol[i]
+            i &= i - 1
+        return total
+
+    def _rearmar(self, orden):
+        presentes = [(self.base + i, c) for i, c in enumerate(self.cuenta) if c]
+        desde = min(orden, presentes[0][0]) if presentes else orden
+        hasta = max(orden, presentes[-1][0]) if presentes else orden
+        tamano = max(VENTANA_MINIMA, 2 * (hasta - desde + 1))
+        self.base = desde
+        self.cuenta = [0] * tamano
+        for o, c in presentes:
+            self.cuenta[o - desde] = c
+        # construcción del Fenwick en O(tamaño)
+        arbol = [0] + self.cuenta
+        for i in range(1, tamano + 1):
+            padre = i + (i & -i)
+            if padre <= tamano:
+                arbol[padre] += arbol[i]
+        self.arbol = arbol
+
+
 class TurnoQueue:
     """
-    Cola de prioridad con aging simple:
-    - Guardamos (prioridad, orden, cliente_id, nombre, tramite, timestamp)
-    - Cada vez que pedimos turno, aplicamos aging si esperó >= aging_seconds:
-      baja prioridad numérica (ej: 3->2->1) hasta min 1.
+    Cola de prioridad con aging, pop en O(log n) amortizado:
+    - Un heap por nivel de prioridad, ordenado por orden de llegada.
+    - Una deque por nivel con los turnos en el orden en que entraron al nivel.
+      Quien entra a un nivel lo hace con ts=ahora, así que la deque queda
+      ordenada por ts y los que ya esperaron >= aging_seconds están al frente.
+      El nivel más urgente no envejece y no tiene deque que recorrer.
+    - Al pedir turno se promueven (3->2->1, hasta min 1) solo los del frente
+      de cada deque. El turno conserva su orden original en el nivel nuevo;
+      la entrada vieja queda obsoleta y se descarta al llegar al tope.
+    - quitar(turno) lo marca inactivo (misma baja perezosa que el aging).
+      Las entradas obsoletas se cuentan por nivel (muertos) y el heap se
+      compacta cuando superan a las vivas: la memoria sigue a los turnos en
+      espera aunque el tope de ese nivel no se alcance nunca.
+    - al_promover(turno), si se asigna, se llama en cada promoción.
+    - La pasada de aging solo corre cuando ya le toca a alguien: ts_frente
+      es el ts más viejo entre los frentes de las deques.
+    - antes_que(prioridad, orden): cuántos turnos vivos saldrían antes que
+      uno de ese nivel y orden, en O(log n) (un _ConteoOrden por nivel). Los
+      conteos se arman con la primera consulta y desde ahí se mantienen; sin
+      consultas (simulacion.py) push y pop no los pagan.
+    - reloj (time.time por defecto) y prioridades (PRIORIDADES) se pueden
+      reemplazar, p. ej. por el reloj virtual de simulacion.py.
+    Es la cola de PoliticaAging; las otras políticas (politicas.py) tienen
+    la misma interfaz: push / pop / quitar / antes_que más peek y clave.
     """
-    def __init__(self, aging_seconds=30):
-        self.heap = []
+    def __init__(self, aging_seconds=30, reloj=None, prioridades=None):
+        self.prioridades = prioridades or PRIORIDADES
+        self.reloj = reloj or time.time
+        niveles = sorted(set(self.prioridades.values()))
+        self.min_prioridad = niveles[0]
+        self.max_prioridad = niveles[-1]
+        rango = range(self.min_prioridad, self.max_prioridad + 1)
+        self.heaps = {p: [] for p in rango}
+        self.por_llegada = {p: deque() for p in rango}
+        self.en_nivel = {p: 0 for p in rango}   # turnos vivos por nivel (para métricas)
+        self.muertos = {p: 0 for p in rango}    # entradas obsoletas en cada heap
+        self.conteo = None                      # nivel -> _ConteoOrden, desde el primer antes_que()
+        self.ts_frente = math.inf               # ts del frente más viejo (el próximo en promoverse)
         self.counter = 0
+        self.size = 0
         self.aging_seconds = aging_seconds
+        self.al_promover = None
+
+    def __len__(self):
+        return self.size
 
-    def push(self, cliente_id, nombre, tramite):
-        prioridad = PRIORIDADES.get(tramite, 3)
+    def push(self, cliente_id, nombre, tramite, orden=None, prioridad=None, clave=None):
+        """
+        orden: número de llegada (por defecto el contador propio de la cola).
+        prioridad: nivel actual si el turno ya tenía aging (al restaurarlo;
+        si viene de otra política se lleva al rango de niveles de esta cola).
+        clave: la de las políticas de clave fija; acá no se usa.
+        """
+        if prioridad is None:
+            prioridad = self.prioridades.get(tramite, self.max_prioridad)
+        else:
+            prioridad = min(max(prioridad, self.min_prioridad), self.max_prioridad)
         self.counter += 1
-        ts = time.time()
-        heapq.heappush(self.heap, [prioridad, self.counter, cliente_id, nombre, tramite, ts])
+        turno = _Turno(prioridad, orden or self.counter, cliente_id, nombre, tramite, self.reloj())
+        self._entrar(turno)
+        self.size += 1
+        return turno
+
+    def quitar(self, turno):
+        if not turno.activo:
+            return
+        turno.activo = False
+        self.size -= 1
+        self.en_nivel[turno.prioridad] -= 1
+        if self.conteo is not None:
+            self.conteo[turno.prioridad].sumar(turno.orden, -1)
+        self._obsoleta(turno.prioridad)
+
+    def _obsoleta(self, p):
+        # una entrada de heaps[p] quedó muerta; si ya son más que las vivas se rearma
+        # el heap sin ellas (O(heap), pagado por las bajas que lo llenaron)
+        self.muertos[p] += 1
+        if self.muertos[p] > self.en_nivel[p]:
+            heap = self.heaps[p]
+            heap[:] = [(o, t) for o, t in heap if t.activo and t.prioridad == p]
+            heapq.heapify(heap)
+            self.muertos[p] = 0
+
+    def _entrar(self, turno):
+        p = turno.prioridad
+        self.en_nivel[p] += 1
+        if self.conteo is not None:
+            self.conteo[p].sumar(turno.orden, 1)
+        heapq.heappush(self.heaps[p], (turno.orden, turno))
+        if p > self.min_prioridad:
+            self.por_llegada[p].append(turno)
+            # entra con ts=ahora: no cambia ts_frente salvo que las deques estuvieran vacías
+            if turno.ts < self.ts_frente:
+                self.ts_frente = turno.ts
+
+    def _aplicar_aging(self, now):
+        if now - self.ts_frente < self.aging_seconds:
+            return
+        # los promovidos lo bajan en _entrar; los frentes que quedan, abajo
+        self.ts_frente = ts_frente = math.inf
+        # De más urgente a menos: un turno recién promovido no vuelve a subir en la misma pasada
+        for p in range(self.min_prioridad + 1, self.max_prioridad + 1):
+            dq = self.por_llegada[p]
+            while dq:
+                turno = dq[0]
+                if not turno.activo or turno.prioridad != p:
+                    dq.popleft()
+                    continue
+                if now - turno.ts < self.aging_seconds:
+                    if turno.ts < ts_frente:
+                        ts_frente = turno.ts
+                    break
+                dq.popleft()
+                self.en_nivel[p] -= 1
+                if self.conteo is not None:
+                    self.conteo[p].sumar(turno.orden, -1)
+                turno.prioridad = self._promocion(p)
+                turno.ts = now
+                self._obsoleta(p)
+                self._entrar(turno)
+                if self.al_promover is not None:
+                    self.al_promover(turno)
+        if ts_frente < self.ts_frente:
+            self.ts_frente = ts_frente
+
+    def _promocion(self, p):
+        """Nivel al que sube un turno que esperó aging_seconds en el nivel p."""
+        return p - 1
+
+    def envejecer(self):
+        """Aplica el aging pendiente (peek y pop lo hacen solos; antes_que no)."""
+        if self.size:
+            self._aplicar_aging(self.reloj())
+
+    def antes_que(self, prioridad, orden):
+        """
+        Turnos vivos de esta cola que salen antes que (prioridad, orden): todos
+        los de niveles más urgentes más los del mismo nivel con menor orden.
+        Llamar a envejecer() antes para que los niveles estén al día.
+        """
+        if self.conteo is None:
+            self._armar_conteo()
+        total = 0
+        for p in range(self.min_prioridad, prioridad):
+            total += self.en_nivel[p]
+        return total + self.conteo[prioridad].antes(orden)
+
+    def _armar_conteo(self):
+        # los vivos de cada nivel son las entradas del heap activas y con esa prioridad
+        self.conteo = {}
+        for p, heap in self.heaps.items():
+            conteo = self.conteo[p] = _ConteoOrden()
+            for orden, turno in sorted(heap):
+                if turno.activo and turno.prioridad == p:
+                    conteo.sumar(orden, 1)
+
+    def clave(self, turno):
+        """(prioridad, orden) del turno: lo que compara peek() entre colas y recibe antes_que()."""
+        return turno.prioridad, turno.orden
+
+    def peek(self):
+        """(prioridad, orden) del próximo turno que saldría con pop(), o None."""
+        if not self.size:
+            return None
+
+        self._aplicar_aging(self.reloj())
+
+        for p, heap in self.heaps.items():
+            while heap:
+                orden, turno = heap[0]
+                if not turno.activo or turno.prioridad != p:
+                    heapq.heappop(heap)
+                    self.muertos[p] -= 1
+                    continue
+                return p, orden
+        return None
 
     def pop(self):
-        if not self.heap:
+        if not self.size:
+            return None
+
+        self._aplicar_aging(self.reloj())
+
+        for p, heap in self.heaps.items():
+            while heap:
+                _, turno = heapq.heappop(heap)
+                if not turno.activo or turno.prioridad != p:
+                    self.muertos[p] -= 1
+                    continue
+                turno.activo = False
+                self.size -= 1
+                self.en_nivel[p] -= 1
+                if self.conteo is not None:
+                    self.conteo[p].sumar(turno.orden, -1)
+                return {
+                    "cliente_id": turno.cliente_id,
+                    "nombre": turno.nombre,
+                    "tramite": turno.tramite,
+                    "prioridad": turno.prioridad,
+                    "orden": turno.orden
+                }
+        return None
+
+
+class PoliticaAging:
+    """
+    La política de siempre: nivel según PRIORIDADES y, cada aging_seconds
+    de espera en un nivel, un nivel más urgente (ver TurnoQueue). Las
+    alternativas están en politicas.py; todas arman con cola(reloj) la cola
+    de cada trámite del Despachador.
+    """
+    nombre = "aging"
+
+    def __init__(self, aging_seconds=30, prioridades=None):
+        self.aging_seconds = aging_seconds
+        self.prioridades = prioridades or PRIORIDADES
+
+    def __str__(self):
+        return f"{self.nombre}:{self.aging_seconds:g}"
+
+    def cola(self, reloj):
+        return TurnoQueue(aging_seconds=self.aging_seconds, reloj=reloj, prioridades=self.prioridades)
+
+
+# Clave de los admins sin skills: atienden cualquier trámite
+TODOS = "*"
+
+
+class Despachador:
+    """
+    Empareja turnos con admins según los trámites que cada admin atiende (skills).
+    - Una cola por trámite, que arma la política (PoliticaAging por defecto:
+      una TurnoQueue con su aging; ver politicas.py). El orden de llegada
+      es global, así que los topes de colas distintas se comparan por su
+      clave (prioridad, orden con aging) igual que en una cola única.
+    - Cada admin tiene `capacidad` lugares (sesiones a la vez, 1 por
+      defecto). Por trámite, los admins con algún lugar libre que lo atienden
+      van en baldes por cantidad de lugares libres, cada balde un
+      OrderedDict en orden de llegada (los que no declaran skills van en
+      TODOS). Se elige al que tiene más lugares libres y, a igualdad, al que
+      más espera: la carga se reparte antes de apilar sesiones en uno solo.
+      Mover a un admin de balde es O(cantidad de skills) y elegir es
+      O(capacidades distintas), esté donde esté.
+    - Invariante: ningún admin con lugar libre tiene un turno que pueda atender.
+      Por eso solo hay que buscar pareja al llegar un turno (admins de su
+      trámite) o un admin (topes de las colas de sus skills).
+    Nada recorre la lista de admins ni la de turnos.
+
+    Turnos ausentes: si el cliente se desconecta mientras espera (o el turno
+    viene de un reinicio), el turno sale de la cola y queda guardado con su
+    orden y prioridad durante gracia_ausente segundos. Si el cliente vuelve
+    (reanudar) entra de nuevo con el mismo orden, o sea en su lugar. Lo
+    mismo un turno cuya asignación el proxy no pudo aplicar (reencolar):
+    vuelve con el orden, la prioridad y la clave que traía el ASSIGN.
+
+    Con journal (ver journal.JournalTurnos) cada push / pop / aging queda
+    registrado para reconstruir la cola después de un reinicio; el push lleva
+    la clave de las políticas de clave fija, así edf / wfq / sest no
+    recalculan vencimientos ni etiquetas al restaurar.
+
+    Con reloj (una función sin argumentos, en segundos) todo el tiempo sale
+    de ahí en vez de time.time / time.monotonic: así simulacion.py corre este
+    mismo código con un reloj virtual. aging_seconds y prioridades arman la
+    PoliticaAging por defecto; con politica se usa esa en su lugar.
+    """
+    def __init__(self, aging_seconds=30, journal=None, gracia_ausente=120.0, reloj=None, prioridades=None,
+                 politica=None):
+        self.politica = politica or PoliticaAging(aging_seconds, prioridades)
+        self.journal = journal
+        self.gracia_ausente = gracia_ausente
+        self.reloj = reloj or time.time             # ts de los turnos (aging) y del journal
+        self.reloj_ausentes = reloj or time.monotonic
+        self.colas = {}             # tramite -> TurnoQueue (solo las que tienen turnos)
+        self.vacias = {}            # tramite -> cola que se vació (se reusa en vez de armar otra)
+        self.turnos = {}            # cliente_id -> _Turno en cola
+        self.ausentes = OrderedDict()   # cliente_id -> (_Turno, desde) sin cliente conectado
+        self.disponibles = {}       # tramite | TODOS -> {libres: OrderedDict(admin_id -> orden)}
+        self.skills_de_admin = {}   # admin_id disponible -> claves donde está anotado
+        self.lugares = {}           # admin_id conectado -> [libres, capacidad, skills]
+        self.llegadas = 0           # orden global de turnos
+        self.orden_admins = 0
+
+    def __len__(self):
+        return len(self.turnos)
+
+    def restaurar(self, estado):
+        """
+        Carga lo recuperado del journal; todos quedan ausentes hasta que el
+        cliente vuelva. La clave de las políticas de clave fija se recupera
+        si la guardó la misma política (con otra se recalcula al reanudar).
+        """
+        self.llegadas = max(self.llegadas, estado.llegadas)
+        ahora = self.reloj_ausentes()
+        for reg in sorted(estado.turnos.values(), key=lambda r: r["o"]):
+            turno = _Turno(reg["p"], reg["o"], reg["c"], reg["n"], reg["t"], reg["ts"])
+            clave = reg.get("k")
+            if clave and clave[0] == self.politica.nombre:
+                turno.clave = (clave[1], reg["o"])
+                self.politica.restaurado(turno)
+            self.ausentes[reg["c"]] = (turno, ahora)
+
+    def nuevo_turno(self, cliente_id, nombre, tramite):
+        """Encola el turno; si hay un admin libre que lo atienda devuelve (admin_id, turno)."""
+        if cliente_id in self.turnos or cliente_id in self.ausentes:
+            return self.reanudar(cliente_id, nombre, tramite)
+        self.llegadas += 1
+        return self._alta(cliente_id, nombre, tramite, self.llegadas, None)
+
+    def reencolar(self, cliente_id, nombre, tramite, orden, prioridad, clave=None):
+        """
+        La asignación de este turno no se pudo aplicar (el admin ya no
+        estaba): vuelve con el orden, la prioridad y la clave (políticas de
+        clave fija) con que salió, o sea en su lugar, y no al final como un
+        turno nuevo.
+        """
+        if cliente_id in self.turnos or cliente_id in self.ausentes:
+            return self.reanudar(cliente_id, nombre, tramite)
+        self.llegadas = max(self.llegadas, orden)
+        return self._alta(cliente_id, nombre, tramite, orden, prioridad, clave)
+
+    def guarda(self, cliente_id):
+        """Tiene el turno de ese cliente (en cola o ausente), o sea que su token todavía vale."""
+        return cliente_id in self.turnos or cliente_id in self.ausentes
+
+    def reanudar(self, cliente_id, nombre, tramite):
+        """El cliente volvió con su token: recupera su lugar. Si ya no estaba no hace nada (ver guarda)."""
+        if cliente_id in self.turnos:
+            return None
+        par = self.ausentes.pop(cliente_id, None)
+        if par is None:
             return None
+        turno = par[0]
+        self._encolar(cliente_id, turno.nombre, turno.tramite, turno.orden, turno.prioridad, turno.clave)
+        return self._buscar_admin(turno.tramite)
+
+    def ausente(self, cliente_id):
+        """El cliente se desconectó esperando: su turno sale de la cola pero se guarda."""
+        turno = self.turnos.pop(cliente_id, None)
+        if turno is None:
+            return
+        self._quitar(turno)
+        self.ausentes[cliente_id] = (turno, self.reloj_ausentes())
+
+    def expirar(self, ahora=None):
+        """Descarta los ausentes que pasaron gracia_ausente (están en orden de llegada)."""
+        ahora = self.reloj_ausentes() if ahora is None else ahora
+        while self.ausentes:
+            cliente_id, (_turno, desde) = next(iter(self.ausentes.items()))
+            if ahora - desde < self.gracia_ausente:
+                break
+            del self.ausentes[cliente_id]
+            if self.journal is not None:
+                self.journal.pop(cliente_id)
+
+    def admin_listo(self, admin_id, skills=(), capacidad=0):
+        """
+        Con capacidad (login) el admin queda con esa cantidad de lugares
+        libres; sin capacidad se le libera un lugar (terminó una sesión o no
+        se pudo aplicar una asignación). Devuelve los turnos que le tocan ya,
+        los mejores que puede atender y a lo sumo uno por lugar libre; con los
+        lugares que sobran queda disponible.
+        """
+        lugar = self.lugares.get(admin_id)
+        self._descolgar(admin_id)
+        if capacidad or lugar is None:
+            capacidad = capacidad or 1
+            lugar = self.lugares[admin_id] = [capacidad, capacidad, tuple(skills)]
+        else:
+            lugar[0] = min(lugar[0] + 1, lugar[1])
+
+        turnos = []
+        while lugar[0]:
+            mejor = None
+            mejor_tramite = None
+            for tramite in (lugar[2] or self.colas):
+                cola = self.colas.get(tramite)
+                tope = cola.peek() if cola is not None else None
+                if tope is not None and (mejor is None or tope < mejor):
+                    mejor, mejor_tramite = tope, tramite
+            if mejor_tramite is None:
+                self._colgar(admin_id)
+                break
+            turnos.append(self._pop(mejor_tramite))
+            lugar[0] -= 1
+        return turnos
+
+    def quitar_admin(self, admin_id):
+        """El admin se desconectó: sale de los disponibles (si estaba). O(skills)."""
+        self._descolgar(admin_id)
+        self.lugares.pop(admin_id, None)
+
+    def lugares_totales(self):
+        """Sesiones que pueden atender a la vez todos los admins conectados."""
+        return sum(lugar[1] for lugar in self.lugares.values())
+
+    def _colgar(self, admin_id):
+        libres, _capacidad, skills = self.lugares[admin_id]
+        self.orden_admins += 1
+        claves = skills or (TODOS,)
+        for clave in claves:
+            self.disponibles.setdefault(clave, {}).setdefault(libres, OrderedDict())[admin_id] = self.orden_admins
+        self.skills_de_admin[admin_id] = claves
+
+    def _descolgar(self, admin_id):
+        claves = self.skills_de_admin.pop(admin_id, ())
+        if not claves:
+            return
+        libres = self.lugares[admin_id][0]
+        for clave in claves:
+            baldes = self.disponibles[clave]
+            balde = baldes[libres]
+            del balde[admin_id]
+            if not balde:
+                del baldes[libres]
+
+    def _alta(self, cliente_id, nombre, tramite, orden, prioridad, clave=None):
+        turno = self._encolar(cliente_id, nombre, tramite, orden, prioridad, clave)
+        if self.journal is not None:
+            clave = [self.politica.nombre, turno.clave[0]] if turno.clave is not None else None
+            self.journal.push(cliente_id, nombre, tramite, turno.prioridad, turno.orden, self.reloj(), clave)
+        return self._buscar_admin(tramite)
+
+    def _encolar(self, cliente_id, nombre, tramite, orden, prioridad, clave=None):
+        cola = self.colas.get(tramite)
+        if cola is None:
+            cola = self.vacias.pop(tramite, None)
+            if cola is None:
+                cola = self.politica.cola(self.reloj)
+                if self.journal is not None:
+                    cola.al_promover = self._promovido
+            self.colas[tramite] = cola
+        turno = cola.push(cliente_id, nombre, tramite, orden=orden, prioridad=prioridad, clave=clave)
+        self.turnos[cliente_id] = turno
+        return turno
+
+    def _quitar(self, turno):
+        cola = self.colas[turno.tramite]
+        cola.quitar(turno)
+        if not cola:
+            self.vacias[turno.tramite] = self.colas.pop(turno.tramite)
+
+    def _promovido(self, turno):
+        self.journal.aging(turno.cliente_id, turno.prioridad)
+
+    def _buscar_admin(self, tramite):
+        admin_id = self._primer_admin(tramite)
+        if admin_id is None:
+            return None
+        # ocupa un lugar: baja de balde (o deja de estar disponible)
+        self._descolgar(admin_id)
+        lugar = self.lugares[admin_id]
+        lugar[0] -= 1
+        if lugar[0]:
+            self._colgar(admin_id)
+        return admin_id, self._pop(tramite)
+
+    def _primer_admin(self, tramite):
+        # el de más lugares libres y, entre esos, el que más espera, mirando
+        # los de ese trámite y los que atienden todo
+        elegido = None
+        elegido_clave = None
+        for clave in (tramite, TODOS):
+            baldes = self.disponibles.get(clave)
+            if baldes:
+                libres = max(baldes)
+                admin_id, orden = next(iter(baldes[libres].items()))
+                if elegido is None or (-libres, orden) < elegido_clave:
+                    elegido, elegido_clave = admin_id, (-libres, orden)
+        return elegido
+
+    def _pop(self, tramite):
+        cola = self.colas[tramite]
+        turno = cola.pop()
+        if not cola:
+            self.vacias[tramite] = self.colas.pop(tramite)
+        self.turnos.pop(turno["cliente_id"], None)
+        if self.journal is not None:
+            self.journal.pop(turno["cliente_id"])
+        return turno
 
-        now = time.time()
-        for item in self.heap:
-            prioridad, orden, cliente_id, nombre, tramite, ts = item
-            espera = now - ts
-            if espera >= self.aging_seconds and prioridad > 1:
-                item[0] = prioridad - 1
-                item[5] = now  
-
-        heapq.heapify(self.heap)
-        prioridad, orden, cliente_id, nombre, tramite, ts = heapq.heappop(self.heap)
-        return {
-            "cliente_id": cliente_id,
-            "nombre": nombre,
-            "tramite": tramite,
-            "prioridad": prioridad
-        }
-
-
-def run_turnos_service(q_to_turnos, q_to_proxy):
+    def posiciones(self):
+        """
+        (cliente_id, adelante) de cada turno en cola: cuántos turnos de todas
+        las colas salen antes que él, comparando claves como admin_listo().
+        O(colas * log n) por turno, con el aging ya aplicado.
+        """
+        colas = self.colas
+        for cola in colas.values():
+            cola.envejecer()
+        for cliente_id, turno in self.turnos.items():
+            primario, orden = colas[turno.tramite].clave(turno)
+            yield cliente_id, sum(cola.antes_que(primario, orden) for cola in colas.values())
+
+    def profundidad_por_prioridad(self):
+        total = {p: 0 for p in sorted(set(self.politica.prioridades.values()))}
+        for cola in self.colas.values():
+            for p, n in cola.en_nivel.items():
+                total[p] = total.get(p, 0) + n
+        return total
+
+
+class EstimadorEspera:
+    """
+    Espera estimada a partir del tiempo de atención: promedio móvil
+    exponencial (peso alfa a la última) de las sesiones que informa el proxy
+    al liberar un admin. Con `admins` lugares (la suma de las capacidades de
+    los admins conectados) y `adelante` turnos antes, se libera un lugar cada
+    promedio / admins segundos y hacen falta adelante + 1. Sin ninguna
+    sesión medida todavía no hay estimación.
+    """
+    def __init__(self, alfa=0.2):
+        self.alfa = alfa
+        self.promedio = None
+
+    def atencion(self, segundos):
+        if self.promedio is None:
+            self.promedio = segundos
+        else:
+            self.promedio += self.alfa * (segundos - self.promedio)
+
+    def espera(self, adelante, admins):
+        if self.promedio is None or not admins:
+            return None
+        return (adelante + 1) * self.promedio / admins
+
+
+# Cada cuánto se manda a los clientes en espera su posición y espera estimada
+INTERVALO_POSICIONES = 2.0
+
+# La espera se avisa redondeada a este paso (segundos), así una variación
+# chica del promedio no genera un aviso nuevo para cada cliente
+PASO_ESPERA = 5
+
+
+def run_turnos_service(entradas, conns_to_proxy, metricas_dir=None, datos_dir=None, estado=None, opciones_log=None,
+                       politica=None):
     """
     Proceso de turnos:
       - recibe eventos del proxy (nuevo cliente / admin disponible)
-      - mantiene cola de turnos + cola de admins disponibles
+      - mantiene colas de turnos por trámite + admins disponibles por skill
+        (ver Despachador)
       - emite eventos de asignación hacia el proxy
+
+    ADMIN_READY puede traer "skills" (trámites que atiende el admin); sin
+    skills el admin atiende cualquier trámite. Al loguearse trae
+    "capacidad" (sesiones a la vez); sin ella libera un lugar del admin, uno
+    por cada ASSIGN que terminó o que el proxy no pudo aplicar.
+
+    Con datos_dir la cola se guarda en un journal ahí (ver journal.py) y al
+    arrancar se reconstruye desde el disco (o desde `estado`, si el proceso
+    padre ya lo leyó). RESUME (cliente que volvió con su token) le devuelve
+    su lugar; si ese turno ya no está, contesta TURNO_VENCIDO y el proxy lo
+    pasa por la admisión como uno nuevo. CLIENTE_DESCONECTADO deja su turno
+    en espera de que vuelva.
+    REENCOLAR (un ASSIGN que el proxy no pudo aplicar) devuelve el turno con
+    el orden, la prioridad y la clave que traía el ASSIGN.
+
+    Cada INTERVALO_POSICIONES manda a cada worker un POSICIONES con
+    (cliente_id, posición, espera estimada) de sus clientes en cola, solo
+    los que cambiaron desde el último aviso. La espera sale de EstimadorEspera
+    con el "atencion_s" que trae ADMIN_READY al terminar una sesión.
+
+    entradas (ipc.LectorEventos) y conns_to_proxy (extremos de escritura de
+    multiprocessing.Pipe) tienen un canal por worker del proxy, por los que
+    viajan lotes de registros binarios (ver ipc.py). Turnos espera en todas
+    las entradas a la vez, procesa lo que llegó y manda lo que generó en un
+    lote por worker. Cada worker registra su extremo en el selector y se despierta
+    apenas llega una asignación (sin polling). Los eventos traen "worker"; el
+    ASSIGN va al worker del cliente e indica en "admin_worker" dónde está el
+    admin. Un FIN (None) en cualquier entrada termina el servicio.
+    Ctrl+C se ignora: el proxy manda FIN cuando terminó de drenar.
+
+    Con metricas_dir vuelca sus métricas ahí (ver metricas.Registro), y loguea
+    con opciones_log (ver bitacora.Bitacora.configurar). politica elige el
+    orden de atención (ver politicas.py; por defecto PoliticaAging de 30 s).
     """
-    turnos = TurnoQueue(aging_seconds=30)
-    admins = deque()  
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    log.configurar("turnos", etiqueta="TURNOS", **(opciones_log or {}))
+    log.arrancar()
+    journal = None
+    if datos_dir:
+        journal = JournalTurnos(datos_dir, estado if estado is not None else cargar_estado(datos_dir))
+    despachador = Despachador(aging_seconds=30, journal=journal, politica=politica)
+    log.info("politica", "Política de turnos: {politica}", politica=str(despachador.politica))
+    if journal is not None:
+        despachador.restaurar(journal.estado)
+        if despachador.ausentes:
+            log.info("turnos_recuperados", "{ausentes} turnos recuperados, esperando que sus clientes vuelvan",
+                     ausentes=len(despachador.ausentes))
+    worker_de_admin = {}    # admin_id -> worker
+    worker_de_cliente = {}  # cliente_id -> worker (mientras espera)
+    estimador = EstimadorEspera()
+    avisado = {}            # cliente_id -> (posición, espera) del último POSICIONES
+    proximo_aviso = 0.0
 
-    while True:
-        evt = q_to_turnos.get() 
-        if evt is None:
-            break
+    metricas = Registro({"proceso": "turnos"})
+    metricas.valor("turnos_cola_profundidad", "Turnos en espera por nivel de prioridad",
+                   despachador.profundidad_por_prioridad, etiqueta="prioridad")
+    metricas.valor("turnos_cola_por_tramite", "Turnos en espera por trámite",
+                   lambda: {t: len(c) for t, c in despachador.colas.items()}, etiqueta="tramite")
+    metricas.valor("turnos_ausentes", "Turnos guardados de clientes desconectados", lambda: len(despachador.ausentes))
+    metricas.valor("turnos_admins_disponibles", "Admins con algún lugar libre", lambda: len(despachador.skills_de_admin))
+    metricas.valor("turnos_admin_lugares_libres", "Sesiones que los admins pueden tomar ya",
+                   lambda: sum(lugar[0] for lugar in despachador.lugares.values()))
+    eventos = metricas.contador("turnos_eventos_total", "Eventos recibidos del proxy")
+    lotes = metricas.contador("turnos_eventos_lotes_total", "Lotes de eventos recibidos del proxy")
+    asignaciones = metricas.contador("turnos_asignaciones_total", "ASSIGN emitidos")
+    metricas.valor("turnos_atencion_promedio_segundos", "Promedio móvil del tiempo de atención",
+                   lambda: estimador.promedio or 0.0)
+    if metricas_dir:
+        metricas.exportar(metricas_dir, "turnos")
 
+    salidas = [CanalEventos(conn) for conn in conns_to_proxy]
+
+    def asignar(admin_id, turno):
+        worker = worker_de_cliente.pop(turno["cliente_id"], 0)
+        asignaciones.inc()
+        salidas[worker].put({
+            "type": "ASSIGN",
+            "admin_id": admin_id,
+            "admin_worker": worker_de_admin.get(admin_id, 0),
+            **turno
+        })
+
+    def avisar_posiciones():
+        nonlocal avisado
+        admins = despachador.lugares_totales()
+        por_worker = {}
+        nuevo = {}
+        for cliente_id, adelante in despachador.posiciones():
+            espera = estimador.espera(adelante, admins)
+            if espera is not None:
+                espera = int(-(-espera // PASO_ESPERA) * PASO_ESPERA)
+            aviso = (adelante + 1, espera)
+            nuevo[cliente_id] = aviso
+            if avisado.get(cliente_id) != aviso:
+                por_worker.setdefault(worker_de_cliente.get(cliente_id, 0), []).append((cliente_id, *aviso))
+        avisado = nuevo
+        for worker, posiciones in por_worker.items():
+            salidas[worker].put({"type": "POSICIONES", "posiciones": posiciones})
+
+    def procesar(evt):
         t = evt.get("type")
 
         if t == "ADMIN_READY":
             admin_id = evt["admin_id"]
-            admins.append(admin_id)
+            worker_de_admin[admin_id] = evt.get("worker", 0)
+            if evt.get("atencion_s") is not None:
+                estimador.atencion(evt["atencion_s"])
+            for turno in despachador.admin_listo(admin_id, evt.get("skills") or (), evt.get("capacidad", 0)):
+                asignar(admin_id, turno)
 
-        elif t == "NEW_TURNO":
-            turnos.push(evt["cliente_id"], evt["nombre"], evt["tramite"])
+        elif t in ("NEW_TURNO", "RESUME", "REENCOLAR"):
+            if t == "RESUME" and not despachador.guarda(evt["cliente_id"]):
+                # token de un turno que ya no está (atendido o vencida la gracia): el
+                # proxy lo trata como un turno nuevo, con admisión
+                salidas[evt.get("worker", 0)].put({"type": "TURNO_VENCIDO", "cliente_id": evt["cliente_id"]})
+                return
+            worker_de_cliente[evt["cliente_id"]] = evt.get("worker", 0)
+            avisado.pop(evt["cliente_id"], None)   # conexión nueva: mandarle su posición
+            if t == "NEW_TURNO":
+                par = despachador.nuevo_turno(evt["cliente_id"], evt["nombre"], evt["tramite"])
+            elif t == "RESUME":
+                par = despachador.reanudar(evt["cliente_id"], evt["nombre"], evt["tramite"])
+            else:
+                par = despachador.reencolar(evt["cliente_id"], evt["nombre"], evt["tramite"],
+                                            evt["orden"], evt["prioridad"], evt.get("clave"))
+            if par:
+                asignar(*par)
 
-        elif t == "ADMIN_DISCONNECTED":
+        elif t == "CLIENTE_DESCONECTADO":
+            cliente_id = evt["cliente_id"]
+            # si ya volvió por otro worker, este aviso es viejo
+            if worker_de_cliente.get(cliente_id) == evt.get("worker", 0):
+                worker_de_cliente.pop(cliente_id)
+                despachador.ausente(cliente_id)
 
+        elif t == "ADMIN_DISCONNECTED":
             admin_id = evt["admin_id"]
-            try:
-                admins.remove(admin_id)
-            except ValueError:
-                pass
+            # si ya se reconectó en otro worker, este aviso es viejo
+            if worker_de_admin.get(admin_id) == evt.get("worker", 0):
+                worker_de_admin.pop(admin_id)
+                despachador.quitar_admin(admin_id)
 
+    abiertas = list(entradas)
+    seguir = True
+    try:
+        while seguir and abiertas:
+            for conn in wait(abiertas, timeout=INTERVALO_VOLCADO):
+                try:
+                    lote = conn.leer()
+                except (EOFError, OSError):
+                    abiertas.remove(conn)
+                    continue
+                lotes.inc()
+                for evt in lote:
+                    if evt is None:
+                        seguir = False
+                        break
+                    eventos.inc()
+                    procesar(evt)
 
-        while admins:
-            turno = turnos.pop()
-            if not turno:
-                break
-            admin_id = admins.popleft()
-            q_to_proxy.put({
-                "type": "ASSIGN",
-                "admin_id": admin_id,
-                **turno
-            })
\ No newline at end of file
+            metricas.volcar()
+            despachador.expirar()
+            ahora = time.monotonic()
+            if ahora >= proximo_aviso:
+                proximo_aviso = ahora + INTERVALO_POSICIONES
+                avisar_posiciones()
+            if journal is not None:
+                journal.sincronizar()
+            # lo que generó esta vuelta sale en un lote por worker
+            for salida in salidas:
+                salida.flush()
+    finally:
+        if journal is not None:
+            journal.cerrar()
+        log.cerrar()